@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import WatchlistEntry
+
+
+@admin.register(WatchlistEntry)
+class WatchlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('passport_series', 'passport_number', 'reason', 'created_at')
+    search_fields = ('passport_series', 'passport_number')
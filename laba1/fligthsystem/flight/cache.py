@@ -0,0 +1,221 @@
+"""Двухуровневый кэш: L1 в памяти процесса + L2 общий для всех воркеров.
+
+L1 - небольшой LRU со своим коротким TTL, отвечает без сетевого запроса.
+L2 - любой настроенный бэкенд Django (Redis, файловый, LocMem), через него
+воркеры gunicorn делят прогретые данные. Запись и удаление идут в оба уровня;
+удаление в одном воркере не видно в L1 остальных, поэтому L1_TIMEOUT задаёт
+допустимую задержку устаревания. Ошибки L2 (недоступен Redis) не роняют
+запрос: значение берётся из L1 или считается промахом.
+
+Целые числа (счётчики incr/decr) в L1 не кладутся: изменение счётчика в
+другом воркере там не было бы видно. Версии снимков данных в памяти процесса
+(get_version/bump_version) читаются и пишутся только в общем кэше 'shared'.
+
+Настройка в CACHES:
+
+    'default': {
+        'BACKEND': 'flight.cache.TieredCache',
+        'OPTIONS': {'L2': 'shared', 'L1_TIMEOUT': 5, 'L1_MAX_ENTRIES': 1000},
+    }
+"""
+import logging
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+logger = logging.getLogger('flight')
+
+L2_ERRORS = (ConnectionError, TimeoutError, OSError)
+
+try:
+    from redis.exceptions import RedisError
+except ImportError:
+    pass
+else:
+    L2_ERRORS += (RedisError,)
+
+SHARED_CACHE_ALIAS = 'shared'
+
+
+def get_version(key):
+    """Текущая версия из общего кэша.
+
+    0 - версия ещё не публиковалась или вытеснена; None - общий кэш недоступен,
+    и узнать об изменениях в других воркерах нельзя.
+    """
+    try:
+        return caches[SHARED_CACHE_ALIAS].get(key, 0)
+    except Exception as e:
+        logger.warning(f"Version unavailable: key={key}, error={e}")
+        return None
+
+
+def bump_version(key):
+    """Публикует новую версию.
+
+    Версия - случайная строка, а не incr: в FileBasedCache incr не атомарен,
+    и два воркера могут записать одно и то же число, а вытесненный счётчик
+    начинается заново и может повторить значение, которое воркер уже видел.
+    """
+    try:
+        caches[SHARED_CACHE_ALIAS].set(key, uuid.uuid4().hex, None)
+    except Exception as e:
+        logger.warning(f"Version not published: key={key}, error={e}")
+
+
+def _l1_cacheable(value):
+    return type(value) is not int
+
+
+class LocalLRU:
+    """Потокобезопасный LRU с TTL; значения хранятся сериализованными, как в LocMemCache"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires_at, payload = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+        return True, pickle.loads(payload)
+
+    def set(self, key, value, ttl):
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires_at, payload)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options.get('L2', 'shared')
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.l1 = LocalLRU(options.get('L1_MAX_ENTRIES', 1000))
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _l1_ttl(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self.l1_timeout
+        return min(max(timeout - time.time(), 0), self.l1_timeout)
+
+    def _key(self, key, version):
+        return self.make_and_validate_key(key, version=version)
+
+    def get(self, key, default=None, version=None):
+        l1_key = self._key(key, version)
+        hit, value = self.l1.get(l1_key)
+        if hit:
+            return value
+
+        sentinel = object()
+        try:
+            value = self.l2.get(key, sentinel, version=version)
+        except L2_ERRORS as e:
+            logger.warning(f"L2 cache unavailable: alias={self.l2_alias}, error={e}")
+            return default
+        if value is sentinel:
+            return default
+        if _l1_cacheable(value):
+            self.l1.set(l1_key, value, self.l1_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self._key(key, version)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        try:
+            self.l2.set(key, value, timeout, version=version)
+        except L2_ERRORS as e:
+            logger.warning(f"L2 cache unavailable: alias={self.l2_alias}, error={e}")
+        if (timeout is not None and timeout <= 0) or not _l1_cacheable(value):
+            self.l1.delete(l1_key)
+        else:
+            self.l1.set(l1_key, value, self._l1_ttl(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self._key(key, version)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        try:
+            added = self.l2.add(key, value, timeout, version=version)
+        except L2_ERRORS as e:
+            logger.warning(f"L2 cache unavailable: alias={self.l2_alias}, error={e}")
+            hit, _ = self.l1.get(l1_key)
+            added = not hit
+        if added and _l1_cacheable(value):
+            self.l1.set(l1_key, value, self._l1_ttl(timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self._key(key, version)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        self.l1.delete(l1_key)
+        try:
+            return self.l2.touch(key, timeout, version=version)
+        except L2_ERRORS as e:
+            logger.warning(f"L2 cache unavailable: alias={self.l2_alias}, error={e}")
+            return False
+
+    def delete(self, key, version=None):
+        deleted = self.l1.delete(self._key(key, version))
+        try:
+            return self.l2.delete(key, version=version) or deleted
+        except L2_ERRORS as e:
+            logger.warning(f"L2 cache unavailable: alias={self.l2_alias}, error={e}")
+            return deleted
+
+    def has_key(self, key, version=None):
+        hit, _ = self.l1.get(self._key(key, version))
+        if hit:
+            return True
+        try:
+            return self.l2.has_key(key, version=version)
+        except L2_ERRORS as e:
+            logger.warning(f"L2 cache unavailable: alias={self.l2_alias}, error={e}")
+            return False
+
+    def incr(self, key, delta=1, version=None):
+        # Счётчики живут только в L2, иначе воркеры разойдутся
+        self.l1.delete(self._key(key, version))
+        return self.l2.incr(key, delta, version=version)
+
+    def clear(self):
+        self.l1.clear()
+        try:
+            self.l2.clear()
+        except L2_ERRORS as e:
+            logger.warning(f"L2 cache unavailable: alias={self.l2_alias}, error={e}")
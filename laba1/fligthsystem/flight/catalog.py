@@ -0,0 +1,113 @@
+"""Справочник рейсов в памяти процесса.
+
+Рейсы меняются редко, а нужны почти на каждой странице (выпадающие списки
+регистрации и фильтра подозрительных пассажиров, поле рейса в
+RegistrationForm). Каждый процесс держит снимок всех рейсов; снимок
+синхронизируется между воркерами через версию в общем кэше (flight.cache):
+сохранение или удаление Flight публикует новую версию после COMMIT
+(flight.signals), и воркер с другой версией перечитывает рейсы одним запросом. Без общего
+кэша версию узнать нельзя, и снимок перечитывается при каждом обращении.
+
+Возвращаемые объекты Flight общие для всех запросов процесса - их можно
+только читать.
+"""
+import threading
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.forms import ModelChoiceField
+from django.forms.models import ModelChoiceIterator
+
+from .cache import bump_version, get_version
+from .models import Flight
+
+CATALOG_VERSION_KEY = 'flight:catalog:version'
+
+
+class FlightCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = None
+        self._by_id = None
+        self._by_number = None
+        self._version = None
+
+    def _build(self, version):
+        flights = list(Flight.objects.order_by('id'))
+        self._flights = flights
+        self._by_id = {flight.id: flight for flight in flights}
+        self._by_number = {flight.flight_number: flight for flight in flights}
+        self._version = version
+
+    def _snapshot(self):
+        version = get_version(CATALOG_VERSION_KEY)
+        with self._lock:
+            if self._flights is None or version is None or version != self._version:
+                self._build(version)
+            return self._flights, self._by_id, self._by_number
+
+    def flights(self):
+        """Все рейсы в порядке id, как Flight.objects.all()"""
+        return self._snapshot()[0]
+
+    def get(self, flight_id):
+        return self._snapshot()[1].get(flight_id)
+
+    def get_by_number(self, flight_number):
+        return self._snapshot()[2].get(flight_number)
+
+    def invalidate(self):
+        with self._lock:
+            self._flights = None
+
+
+flight_catalog = FlightCatalog()
+
+
+def flights_changed():
+    """Вызывается после изменения рейсов, в том числе пакетного"""
+    def publish():
+        flight_catalog.invalidate()
+        bump_version(CATALOG_VERSION_KEY)
+    transaction.on_commit(publish)
+
+
+class FlightCatalogChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for flight in flight_catalog.flights():
+            yield self.choice(flight)
+
+    def __len__(self):
+        return len(flight_catalog.flights()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(flight_catalog.flights())
+
+
+class FlightChoiceField(ModelChoiceField):
+    """Поле выбора рейса, которое берёт варианты и проверяет значение по справочнику без запросов"""
+
+    iterator = FlightCatalogChoiceIterator
+
+    def __init__(self, **kwargs):
+        kwargs.pop('queryset', None)
+        super().__init__(queryset=Flight.objects.all(), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, Flight):
+            value = value.pk
+        try:
+            flight = flight_catalog.get(int(value))
+        except (TypeError, ValueError):
+            flight = None
+        if flight is None:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return flight
@@ -4,8 +4,24 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 
+from .catalog import FlightChoiceField
+
 User  = get_user_model()
 
+# Правила паспортных данных; используются и при импорте манифестов (flight.manifests)
+PASSPORT_SERIES_ERROR = "Серия паспорта должна состоять из 4 цифр."
+PASSPORT_NUMBER_ERROR = "Номер паспорта должен состоять из 6 цифр."
+DUPLICATE_BOOKING_ERROR = "Пассажир с этим паспортом уже зарегистрирован на рейс."
+
+
+def is_valid_passport_series(value):
+    return value.isdigit() and len(value) == 4
+
+
+def is_valid_passport_number(value):
+    return value.isdigit() and len(value) == 6
+
+
 class CreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
 
@@ -30,15 +46,34 @@ class RegistrationForm(forms.ModelForm):
             'passport_number': 'Номер паспорта',
             'flight': 'Рейс',
         }
+        # Варианты рейсов из справочника в памяти, без запроса на каждую форму
+        field_classes = {'flight': FlightChoiceField}
         
     def clean_passport_series(self):
         passport_series = self.cleaned_data.get('passport_series')
-        if not passport_series.isdigit() or len(passport_series) != 4:
-            raise forms.ValidationError("Серия паспорта должна состоять из 4 цифр.")
+        if not is_valid_passport_series(passport_series):
+            raise forms.ValidationError(PASSPORT_SERIES_ERROR)
         return passport_series
 
     def clean_passport_number(self):
         passport_number = self.cleaned_data.get('passport_number')
-        if not passport_number.isdigit() or len(passport_number) != 6:
-            raise forms.ValidationError("Номер паспорта должен состоять из 6 цифр.")
-        return passport_number
\ No newline at end of file
+        if not is_valid_passport_number(passport_number):
+            raise forms.ValidationError(PASSPORT_NUMBER_ERROR)
+        return passport_number
+
+    def _get_validation_exclusions(self):
+        # Рейс уже проверен по справочнику (FlightChoiceField); проверка
+        # ForeignKey в full_clean() повторила бы её запросом к БД
+        exclude = super()._get_validation_exclusions()
+        exclude.add('flight')
+        return exclude
+
+    def clean(self):
+        cleaned_data = super().clean()
+        passport_series = cleaned_data.get('passport_series')
+        passport_number = cleaned_data.get('passport_number')
+        flight = cleaned_data.get('flight')
+        if passport_series and passport_number and flight:
+            if Registration.objects.is_booked(passport_series, passport_number, flight):
+                self.add_error('passport_number', DUPLICATE_BOOKING_ERROR)
+        return cleaned_data
@@ -0,0 +1,144 @@
+"""Неблокирующее структурированное логирование.
+
+Потоки запросов только кладут запись в ограниченную очередь
+(AsyncQueueHandler), а запись на диск и в консоль выполняет фоновый
+QueueListener. При переполнении очереди запись отбрасывается и учитывается
+в счётчике dropped - запрос никогда не ждёт ввода-вывода. В файл пишутся
+JSON-строки (JsonFormatter). SamplingFilter пропускает только долю частых
+записей уровня ниже WARNING.
+
+Все воркеры дописывают один файл (O_APPEND, запись строки целиком), а
+ротирует его внешний logrotate: RotatingFileHandler в каждом процессе
+переименовывал бы файл независимо и терял или затирал записи соседей.
+WatchedFileHandler замечает, что файл переименован, и открывает новый:
+
+    /srv/app/debug.log {
+        daily
+        rotate 7
+        compress
+        delaycompress
+        missingok
+    }
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Стандартные атрибуты LogRecord; всё остальное пришло через extra=
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'process': record.process,
+            'thread': record.thread,
+        }
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю записей ниже WARNING.
+
+    rates - {имя события или логгера: доля от 0 до 1}. Событие задаётся через
+    extra={'event': ...}; для логгера учитываются и родители ('django' для
+    'django.server'). Доля сохраняется в записи как sample_rate.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def rate_for(self, record):
+        event = getattr(record, 'event', None)
+        if event in self.rates:
+            return self.rates[event]
+        name = record.name
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record)
+        if rate >= 1.0:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler со своими приёмниками: JSON-файл (ротация внешняя) и консоль"""
+
+    def __init__(self, filename=None, console=True, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+
+        sinks = []
+        if filename:
+            file_handler = logging.handlers.WatchedFileHandler(filename, encoding='utf-8')
+            file_handler.setFormatter(JsonFormatter())
+            sinks.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler(sys.stderr)
+            console_handler.setFormatter(logging.Formatter('{levelname} {message}', style='{'))
+            sinks.append(console_handler)
+        self.sinks = sinks
+
+        self.listener = None
+        self.start()
+        atexit.register(self.stop)
+        # После fork (gunicorn --preload) поток слушателя в дочернем процессе не существует
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.start)
+
+    def start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, *self.sinks, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def prepare(self, record):
+        # Форматирование JSON - в потоке слушателя; здесь только то, что нельзя отложить
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.stop()
+        for sink in self.sinks:
+            sink.close()
+        super().close()
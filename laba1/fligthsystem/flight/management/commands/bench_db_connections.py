@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client
+from django.urls import reverse
+
+from flight.models import CustomUser, Flight
+
+# Режимы для --compare: переменные окружения, с которыми перезапускается команда
+MODES = [
+    ('новое подключение на запрос', {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '0'}),
+    ('постоянные подключения', {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '60'}),
+    ('пул psycopg', {'DB_POOL': '1'}),
+]
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def describe_mode():
+    database = settings.DATABASES['default']
+    pool = database.get('OPTIONS', {}).get('pool')
+    if pool:
+        return f"пул psycopg ({pool.get('min_size')}..{pool.get('max_size')})"
+    return f"CONN_MAX_AGE={database['CONN_MAX_AGE']}"
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку GET registration_view при параллельных клиентах '
+        'в текущем режиме подключений к БД (--compare - во всех режимах)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на клиента')
+        parser.add_argument('--compare', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            self.compare(options)
+            return
+
+        user = CustomUser.objects.first()
+        if user is None or not Flight.objects.exists():
+            raise CommandError('Нужны пользователь и рейсы (populate.py)')
+        connections.close_all()
+
+        url = reverse('registration')
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['clients'])
+
+        def client_loop(index):
+            client = Client(SERVER_NAME='localhost')
+            client.force_login(user)
+            local = []
+            try:
+                barrier.wait()
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    # Тестовый клиент отключает close_old_connections на время запроса;
+                    # вызываем его сами, как обработчик запросов WSGI/ASGI
+                    close_old_connections()
+                    response = client.get(url)
+                    close_old_connections()
+                    local.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise RuntimeError(f'HTTP {response.status_code}')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+                with lock:
+                    latencies.extend(local)
+
+        threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(options['clients'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if errors:
+            raise CommandError(f'Ошибки клиентов: {errors[:3]}')
+
+        ordered = sorted(latencies)
+        self.stdout.write(
+            f"{describe_mode()}: клиентов {options['clients']}, запросов {len(ordered)}, "
+            f"{len(ordered) / elapsed:.0f} запр/с"
+        )
+        self.stdout.write(
+            f"  p50 {percentile(ordered, 0.5) * 1000:.2f} мс, "
+            f"p95 {percentile(ordered, 0.95) * 1000:.2f} мс, "
+            f"p99 {percentile(ordered, 0.99) * 1000:.2f} мс"
+        )
+
+    def compare(self, options):
+        command = [
+            sys.executable, sys.argv[0], 'bench_db_connections',
+            '--clients', str(options['clients']),
+            '--requests', str(options['requests']),
+        ]
+        for title, env in MODES:
+            self.stdout.write(f"== {title}")
+            self.stdout.flush()
+            subprocess.run(command, env={**os.environ, **env}, check=True)
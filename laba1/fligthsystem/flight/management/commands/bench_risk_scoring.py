@@ -0,0 +1,89 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from flight.models import Flight, Passenger, Registration, WatchlistEntry, normalize_passport
+from flight.risk import score_flight, score_registrations
+
+
+class RollbackBenchmark(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пакетную и построчную оценку риска на тестовых регистрациях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registrations', type=int, default=20000)
+        parser.add_argument('--flights', type=int, default=20)
+        parser.add_argument('--per-row', type=int, default=1000, help='Сколько регистраций оценить построчно')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Все тестовые данные откатываются по завершении замера
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise RollbackBenchmark
+        except RollbackBenchmark:
+            pass
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        flights = Flight.objects.bulk_create([
+            Flight(flight_number=f'ZZ{i:04d}', destination=f'Bench {i}') for i in range(options['flights'])
+        ])
+
+        # Часть паспортов повторяется, часть в списке наблюдения
+        passports = [
+            (f'{rng.randint(0, 9999):04d}', f'{rng.randint(0, 999999):06d}')
+            for _ in range(options['registrations'])
+        ]
+        WatchlistEntry.objects.bulk_create(
+            [WatchlistEntry(passport_series=s, passport_number=n) for s, n in rng.sample(passports, len(passports) // 100)],
+            ignore_conflicts=True,
+        )
+        # bulk_create не вызывает save(): ключ паспорта задаётся сам, повторы на рейсе отбрасываются
+        bookings = {}
+        for _ in range(options['registrations']):
+            series, number = rng.choice(passports)
+            flight = rng.choice(flights)
+            bookings.setdefault((normalize_passport(series, number), flight.id), (series, number, flight))
+        passengers = Passenger.objects.bulk_create([Passenger() for _ in bookings])
+        registrations = Registration.objects.bulk_create([
+            Registration(
+                last_name='Bench',
+                first_name='Bench',
+                passport_series=series,
+                passport_number=number,
+                passport_key=passport_key,
+                flight=flight,
+                passenger=passenger,
+            )
+            for passenger, ((passport_key, _), (series, number, flight)) in zip(passengers, bookings.items())
+        ])
+
+        sample = registrations[:options['per_row']]
+        started = time.perf_counter()
+        for registration in sample:
+            score_registrations([registration])
+        per_row_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scored = flagged = 0
+        for flight in flights:
+            flight_scored, flight_flagged = score_flight(flight, batch_size=options['batch_size'])
+            scored += flight_scored
+            flagged += flight_flagged
+        batch_elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Регистраций: {scored}, подозрительных: {flagged}")
+        self.stdout.write(
+            f"Построчно: {len(sample)} за {per_row_elapsed:.3f} с, {len(sample) / per_row_elapsed:.0f} рег/с"
+        )
+        self.stdout.write(
+            f"Пакетами:  {scored} за {batch_elapsed:.3f} с, {scored / batch_elapsed:.0f} рег/с"
+        )
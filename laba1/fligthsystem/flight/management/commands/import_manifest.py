@@ -0,0 +1,45 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flight.manifests import ManifestError, import_manifest, parse_manifest
+
+
+class Command(BaseCommand):
+    help = 'Регистрирует пассажиров из манифеста (CSV или JSON) одной транзакцией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--flight', help='Номер рейса для всего манифеста')
+        parser.add_argument('--format', choices=['csv', 'json'], help='По умолчанию - по расширению файла')
+        parser.add_argument('--skip-invalid', action='store_true', help='Импортировать корректные строки при ошибках в других')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        fmt = options['format'] or ('json' if path.suffix.lower() == '.json' else 'csv')
+
+        started = time.perf_counter()
+        try:
+            rows, manifest_flight = parse_manifest(path.read_bytes(), fmt)
+        except (OSError, ManifestError) as e:
+            raise CommandError(str(e))
+
+        try:
+            created, errors = import_manifest(
+                rows,
+                default_flight=options['flight'] or manifest_flight,
+                skip_invalid=options['skip_invalid'],
+            )
+        except ManifestError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for error in errors[:50]:
+            self.stderr.write(f"Строка {error['row']}: {error['field'] or '-'}: {error['message']}")
+        if len(errors) > 50:
+            self.stderr.write(f"... и ещё {len(errors) - 50} ошибок")
+
+        if errors and not created:
+            raise CommandError(f"Манифест не импортирован: ошибок {len(errors)}")
+        self.stdout.write(f"Зарегистрировано пассажиров: {created} за {elapsed:.2f} с, пропущено строк с ошибками: {len({e['row'] for e in errors})}")
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flight.models import Flight
+from flight.risk import DEFAULT_BATCH_SIZE, score_flight
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает оценку риска регистраций рейса (или всех рейсов) пакетами'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--flight', help='Номер рейса')
+        target.add_argument('--all', action='store_true', help='Все рейсы')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Снимать отметки с пассажиров ниже порога (по умолчанию отметки только добавляются)',
+        )
+
+    def handle(self, *args, **options):
+        flight = None
+        if options['flight']:
+            try:
+                flight = Flight.objects.get(flight_number=options['flight'])
+            except Flight.DoesNotExist:
+                raise CommandError(f"Рейс {options['flight']} не найден")
+
+        started = time.perf_counter()
+        scored, flagged = score_flight(flight, batch_size=options['batch_size'], only_raise=not options['reset'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Оценено регистраций: {scored}, подозрительных: {flagged} за {elapsed:.2f} с'
+        ))
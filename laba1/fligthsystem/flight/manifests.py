@@ -0,0 +1,186 @@
+"""Пакетная регистрация пассажиров по манифестам авиакомпаний.
+
+Манифест - CSV с заголовком или JSON (список объектов либо
+{"flight": ..., "passengers": [...]}) с полями last_name, first_name,
+passport_series, passport_number и flight (номер рейса; можно задать один
+рейс на весь манифест). Все строки проверяются за один проход по тем же
+правилам, что и RegistrationForm, включая запрет повторной регистрации
+паспорта на рейс; рейсы и уже сделанные регистрации находятся одним запросом
+каждые, а пассажиры и регистрации вставляются через bulk_create в одной
+транзакции.
+
+Проверка повторов идёт до транзакции, поэтому регистрация того же паспорта,
+сделанная параллельно, обнаруживается только уникальным ограничением при
+вставке. Тогда транзакция откатывается, манифест проверяется заново (теперь
+конфликтующие строки видны как повторы) и при необходимости записывается ещё
+раз.
+"""
+import csv
+import io
+import json
+import logging
+
+from django.db import IntegrityError, transaction
+
+from .forms import (
+    DUPLICATE_BOOKING_ERROR,
+    PASSPORT_NUMBER_ERROR,
+    PASSPORT_SERIES_ERROR,
+    is_valid_passport_number,
+    is_valid_passport_series,
+)
+from .models import Flight, Passenger, Registration, normalize_passport
+from .risk import score_registrations
+
+logger = logging.getLogger('flight')
+
+MANIFEST_FIELDS = ['last_name', 'first_name', 'passport_series', 'passport_number', 'flight']
+NAME_MAX_LENGTH = Registration._meta.get_field('last_name').max_length
+BULK_BATCH_SIZE = 1000
+# Сколько раз манифест перепроверяется после конфликта с параллельными регистрациями
+IMPORT_ATTEMPTS = 3
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def parse_manifest(content, fmt):
+    """Возвращает (строки манифеста, номер рейса для всего манифеста или None)"""
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ManifestError('Манифест должен быть в кодировке UTF-8')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(content))
+        missing = set(MANIFEST_FIELDS) - {'flight'} - set(reader.fieldnames or [])
+        if missing:
+            raise ManifestError(f"В CSV нет столбцов: {', '.join(sorted(missing))}")
+        return list(reader), None
+
+    if fmt == 'json':
+        try:
+            data = json.loads(content)
+        except ValueError as e:
+            raise ManifestError(f'Некорректный JSON: {e}')
+        if isinstance(data, dict):
+            return data.get('passengers') or [], data.get('flight')
+        if isinstance(data, list):
+            return data, None
+        raise ManifestError('JSON-манифест должен быть списком или объектом с ключом passengers')
+
+    raise ManifestError(f'Неизвестный формат манифеста: {fmt}')
+
+
+def validate_manifest(rows, default_flight=None):
+    """Проверяет все строки за один проход.
+
+    Возвращает (корректные строки с подставленным Flight, ошибки); ошибка -
+    {'row': номер строки с 1, 'field': поле, 'message': текст}.
+    """
+    flight_numbers = {
+        str(row.get('flight') or default_flight or '').strip()
+        for row in rows if isinstance(row, dict)
+    }
+    flights = Flight.objects.in_bulk(flight_numbers - {''}, field_name='flight_number')
+
+    candidates = []
+    errors = []
+    for index, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': index, 'field': None, 'message': 'Строка манифеста должна быть объектом'})
+            continue
+
+        values = {field: str(row.get(field) or '').strip() for field in MANIFEST_FIELDS}
+        row_errors = []
+        for field in ('last_name', 'first_name'):
+            if not values[field]:
+                row_errors.append((field, 'Обязательное поле.'))
+            elif len(values[field]) > NAME_MAX_LENGTH:
+                row_errors.append((field, f'Не более {NAME_MAX_LENGTH} символов.'))
+        if not is_valid_passport_series(values['passport_series']):
+            row_errors.append(('passport_series', PASSPORT_SERIES_ERROR))
+        if not is_valid_passport_number(values['passport_number']):
+            row_errors.append(('passport_number', PASSPORT_NUMBER_ERROR))
+
+        flight_number = values['flight'] or str(default_flight or '').strip()
+        flight = flights.get(flight_number)
+        if flight is None:
+            row_errors.append(('flight', f'Рейс {flight_number or "не указан"} не найден.'))
+
+        if row_errors:
+            errors.extend({'row': index, 'field': field, 'message': message} for field, message in row_errors)
+            continue
+
+        values['flight'] = flight
+        values['passport_key'] = normalize_passport(values['passport_series'], values['passport_number'])
+        candidates.append((index, values))
+
+    # Повторы паспорта на рейсе - и с уже сделанными регистрациями (один запрос
+    # по индексу passport_key), и внутри самого манифеста
+    booked = set(
+        Registration.objects.filter(
+            passport_key__in={values['passport_key'] for _, values in candidates}
+        ).values_list('passport_key', 'flight_id')
+    )
+    valid = []
+    for index, values in candidates:
+        booking = (values['passport_key'], values['flight'].id)
+        if booking in booked:
+            errors.append({'row': index, 'field': 'passport_number', 'message': DUPLICATE_BOOKING_ERROR})
+            continue
+        booked.add(booking)
+        valid.append(values)
+    errors.sort(key=lambda error: error['row'])
+    return valid, errors
+
+
+def import_manifest(rows, default_flight=None, skip_invalid=False):
+    """Регистрирует пассажиров манифеста.
+
+    По умолчанию при любой ошибке не вставляется ничего; со skip_invalid
+    корректные строки импортируются, а ошибочные только возвращаются в отчёте.
+    Возвращает (число регистраций, ошибки). ManifestError - если конфликты с
+    параллельными регистрациями не прекратились за IMPORT_ATTEMPTS попыток.
+    """
+    for attempt in range(1, IMPORT_ATTEMPTS + 1):
+        valid, errors = validate_manifest(rows, default_flight)
+        if errors and not skip_invalid:
+            return 0, errors
+        if not valid:
+            return 0, errors
+        try:
+            write_registrations(valid)
+        except IntegrityError as e:
+            # Паспорт зарегистрирован на рейс после проверки - перепроверяем
+            logger.warning(f"Manifest booking conflict, revalidating: attempt={attempt}, error={e}")
+            continue
+        return len(valid), errors
+    raise ManifestError('Регистрации на эти рейсы одновременно меняются, повторите импорт позже')
+
+
+def write_registrations(valid):
+    with transaction.atomic():
+        passengers = Passenger.objects.bulk_create(
+            [Passenger() for _ in valid],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        registrations = Registration.objects.bulk_create(
+            [
+                Registration(
+                    last_name=values['last_name'],
+                    first_name=values['first_name'],
+                    passport_series=values['passport_series'],
+                    passport_number=values['passport_number'],
+                    passport_key=values['passport_key'],
+                    flight=values['flight'],
+                    passenger=passenger,
+                )
+                for values, passenger in zip(valid, passengers)
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        # Оценка риска всего манифеста пакетом, включая повторы паспортов внутри него
+        score_registrations(registrations)
@@ -3,6 +3,10 @@ from django.http import JsonResponse, HttpResponseRedirect
 from django.urls import reverse
 import logging
 from django.shortcuts import render
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +28,10 @@ class LogJWTMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
-        # Логируем заголовок Authorization
+        # Логируем наличие заголовка Authorization (сам токен в лог не пишем)
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
         if auth_header.startswith('Bearer '):
-            print(f"JWT Header: {auth_header[:50]}...")
+            logger.debug("JWT header present", extra={'event': 'jwt_header', 'path': request.path})
         
         response = self.get_response(request)
         return response
@@ -57,4 +61,53 @@ class AuthErrorMiddleware:
                     'error': 'Доступ запрещен',
                     'detail': str(exception)
                 }, status=403)
-            return render(request, 'errors/403.html', status=403)
\ No newline at end of file
+            return render(request, 'errors/403.html', status=403)
+
+
+class StatelessJWTMiddleware:
+    """Аутентификация API по access-токену без запросов к БД.
+
+    Для представлений из JWT_STATELESS_AUTH['VIEWS'] токен из cookie или
+    заголовка Authorization проверяется локально (подпись и срок действия),
+    и request.user становится TokenUser из claims - сессия и пользователь
+    не читаются. Без действительного токена работает обычная сессия.
+
+    Запросы с действительным токеном в заголовке Authorization не проверяются
+    на CSRF (браузер такой заголовок сам не добавляет); запросы с токеном из
+    cookie проверяются, как и сессионные. Стоит перед CsrfViewMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = settings.JWT_STATELESS_AUTH
+        self.cookie_name = config['COOKIE']
+        self.view_names = frozenset(config['VIEWS'])
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def get_raw_token(self, request):
+        """Токен и признак того, что он пришёл в заголовке Authorization"""
+        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+        if auth_header.startswith('Bearer '):
+            return auth_header[len('Bearer '):], True
+        return request.COOKIES.get(self.cookie_name), False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.resolver_match.url_name not in self.view_names:
+            return None
+
+        raw_token, from_header = self.get_raw_token(request)
+        if not raw_token:
+            return None
+
+        try:
+            token = AccessToken(raw_token)
+        except TokenError as e:
+            logger.debug(f"Stateless JWT rejected for {request.path}: {e}")
+            return None
+
+        request.user = TokenUser(token)
+        if from_header:
+            request._dont_enforce_csrf_checks = True
+        return None
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flight', '0005_alter_registration_flight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('passport_series', models.CharField(max_length=10)),
+                ('passport_number', models.CharField(max_length=10)),
+                ('reason', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='watchlistentry',
+            constraint=models.UniqueConstraint(fields=('passport_series', 'passport_number'), name='unique_watchlist_passport'),
+        ),
+    ]
@@ -0,0 +1,123 @@
+from django.db import IntegrityError, migrations, models, transaction
+
+# Миграция неатомарная: каждый пакет - отдельная короткая транзакция, индексы
+# строятся CONCURRENTLY. Старый код может вставлять регистрации всё это время -
+# они получают ключ на последнем шаге, уже при действующем ограничении.
+BATCH_SIZE = 10000
+
+PASSPORT_KEY_SQL = "regexp_replace(passport_series || passport_number, '\\D', '', 'g')"
+
+FILL_PASSPORT_KEY = f"""
+UPDATE flight_registration
+SET passport_key = {PASSPORT_KEY_SQL}
+WHERE id >= %s AND id < %s AND passport_key IS NULL AND NOT legacy_duplicate
+"""
+
+# Ключ остаётся у первой (по id) регистрации паспорта на рейс; более поздние
+# повторы, сделанные до ограничения, помечаются legacy_duplicate и теряют ключ
+MARK_LEGACY_DUPLICATES = """
+UPDATE flight_registration AS r
+SET legacy_duplicate = true, passport_key = NULL
+WHERE r.id >= %s AND r.id < %s AND r.passport_key IS NOT NULL
+  AND EXISTS (
+      SELECT 1 FROM flight_registration AS o
+      WHERE o.passport_key = r.passport_key AND o.flight_id = r.flight_id AND o.id < r.id
+  )
+"""
+
+
+def for_id_batches(cursor, sql):
+    cursor.execute('SELECT MIN(id), MAX(id) FROM flight_registration')
+    low, high = cursor.fetchone()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        cursor.execute(sql, [start, start + BATCH_SIZE])
+
+
+def fill_passport_keys(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for_id_batches(cursor, FILL_PASSPORT_KEY)
+
+
+def mark_legacy_duplicates(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for_id_batches(cursor, MARK_LEGACY_DUPLICATES)
+
+
+def fill_late_passport_keys(apps, schema_editor):
+    """Ключи регистраций, вставленных старым кодом во время миграции.
+
+    Их немного, поэтому по одной: повтор паспорта на рейс не пропустит уже
+    действующее ограничение, и такая регистрация помечается legacy_duplicate.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT id FROM flight_registration WHERE passport_key IS NULL AND NOT legacy_duplicate ORDER BY id'
+        )
+        for (registration_id,) in cursor.fetchall():
+            try:
+                with transaction.atomic(using=schema_editor.connection.alias):
+                    cursor.execute(
+                        f'UPDATE flight_registration SET passport_key = {PASSPORT_KEY_SQL} WHERE id = %s',
+                        [registration_id],
+                    )
+            except IntegrityError:
+                cursor.execute(
+                    'UPDATE flight_registration SET legacy_duplicate = true WHERE id = %s',
+                    [registration_id],
+                )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('flight', '0006_watchlistentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='passport_key',
+            field=models.CharField(editable=False, max_length=20, null=True),
+        ),
+        # db_default: INSERT старого кода без этого столбца не нарушает NOT NULL
+        migrations.AddField(
+            model_name='registration',
+            name='legacy_duplicate',
+            field=models.BooleanField(db_default=False, default=False, editable=False),
+        ),
+        migrations.RunPython(fill_passport_keys, migrations.RunPython.noop),
+        # Временный индекс для поиска повторов; уникальный на этом шаге ещё не построить
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY registration_passport_key_tmp '
+            'ON flight_registration (passport_key, flight_id)',
+            'DROP INDEX CONCURRENTLY IF EXISTS registration_passport_key_tmp',
+        ),
+        migrations.RunPython(mark_legacy_duplicates, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='registration',
+                    constraint=models.UniqueConstraint(fields=['passport_key', 'flight'], name='unique_registration_passport_flight'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    [
+                        'CREATE UNIQUE INDEX CONCURRENTLY unique_registration_passport_flight '
+                        'ON flight_registration (passport_key, flight_id)',
+                        'ALTER TABLE flight_registration ADD CONSTRAINT unique_registration_passport_flight '
+                        'UNIQUE USING INDEX unique_registration_passport_flight',
+                    ],
+                    'ALTER TABLE flight_registration DROP CONSTRAINT unique_registration_passport_flight',
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            'DROP INDEX CONCURRENTLY registration_passport_key_tmp',
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunPython(fill_late_passport_keys, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,8 @@
+import re
+
 from django.db import models
 from django.core.validators import RegexValidator
 from django.contrib.auth.models import AbstractUser 
-import random
 
 class CustomUser (AbstractUser ):
     email = models.EmailField(unique=True)
@@ -15,10 +16,6 @@ class Passenger(models.Model):
 
     suspicious_status = models.IntegerField(choices=STATUS_CHOICES, default=0)
 
-    def generate_random_status(self):
-        self.suspicious_status = random.choice([0, 1])  # 0 - Не подозрительный, 1 - Подозрительный
-        self.save()
-
 class Flight(models.Model):
     flight_number = models.CharField(max_length=6, unique=True)  # Номер рейса (2 буквы + 4 цифры)
     destination = models.CharField(max_length=100)  # Направление
@@ -26,6 +23,21 @@ class Flight(models.Model):
     def __str__(self):
         return f"{self.flight_number} - {self.destination}"   
          
+def normalize_passport(series, number):
+    """Ключ паспорта - только цифры серии и номера: ('12 34', '567890') -> '1234567890'"""
+    return re.sub(r'\D', '', f'{series}{number}')
+
+
+class RegistrationQuerySet(models.QuerySet):
+    def for_passport(self, series, number):
+        """Регистрации паспорта; по индексу (passport_key, flight)"""
+        return self.filter(passport_key=normalize_passport(series, number))
+
+    def is_booked(self, series, number, flight):
+        """Есть ли уже регистрация паспорта на рейс - одна проба уникального индекса"""
+        return self.for_passport(series, number).filter(flight=flight).exists()
+
+
 class Registration(models.Model):
     # Валидатор для серии паспорта (например, 00 00)
     passport_series_validator = RegexValidator(
@@ -44,9 +56,43 @@ class Registration(models.Model):
     passport_number = models.CharField(max_length=10)
     flight = models.ForeignKey(Flight, on_delete=models.CASCADE)
     passenger = models.ForeignKey(Passenger, on_delete=models.CASCADE, null=True, blank=True) 
+    # Нормализованный паспорт (normalize_passport), заполняется в save()
+    passport_key = models.CharField(max_length=20, null=True, editable=False)
+    # Повторная регистрация паспорта на рейс, сделанная до появления ограничения
+    # (миграция 0007); остаётся без ключа, чтобы не нарушать уникальность.
+    # Умолчание и в БД: старый код, не знающий о поле, вставляет строки без него
+    legacy_duplicate = models.BooleanField(default=False, db_default=False, editable=False)
+
+    objects = RegistrationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Один паспорт - одна регистрация на рейс; индекс с passport_key в начале
+            # служит и для поиска регистраций паспорта по всем рейсам
+            models.UniqueConstraint(fields=['passport_key', 'flight'], name='unique_registration_passport_flight'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.legacy_duplicate:
+            self.passport_key = normalize_passport(self.passport_series, self.passport_number)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.flight}"
     
 
 
+class WatchlistEntry(models.Model):
+    """Паспорт из списка наблюдения; учитывается при оценке риска (flight.risk)"""
+    passport_series = models.CharField(max_length=10)
+    passport_number = models.CharField(max_length=10)
+    reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['passport_series', 'passport_number'], name='unique_watchlist_passport'),
+        ]
+
+    def __str__(self):
+        return f"{self.passport_series} {self.passport_number}"
@@ -0,0 +1,141 @@
+"""Пакетная оценка риска регистраций.
+
+Оценка считается сразу для пакета регистраций: признаки собираются
+несколькими запросами на весь пакет (число рейсов паспорта, совпадения со
+списком наблюдения), затем каждое правило из RISK_SCORING['RULES'] возвращает столбец
+баллов для всего пакета, баллы складываются, и пассажиры с суммой не ниже
+THRESHOLD помечаются подозрительными. Изменившиеся статусы записываются
+одним bulk_update.
+
+Правило - функция rule(batch, config) -> список баллов длиной len(batch);
+подключается по пути в настройках, например 'flight.risk.destination_rule'.
+Для одной регистрации (registration_view) используется тот же путь с пакетом
+из одного элемента.
+"""
+from django.conf import settings
+from django.db.models import Count
+from django.utils.module_loading import import_string
+
+from .models import Passenger, Registration, WatchlistEntry, normalize_passport
+
+DEFAULT_BATCH_SIZE = 2000
+BULK_UPDATE_BATCH_SIZE = 1000
+
+
+class RiskBatch:
+    """Пакет регистраций в виде столбцов признаков"""
+
+    def __init__(self, registrations):
+        self.registrations = list(registrations)
+        self.passport_keys = [
+            r.passport_key or normalize_passport(r.passport_series, r.passport_number) for r in self.registrations
+        ]
+        self.destinations = [r.flight.destination for r in self.registrations]
+
+        keys = set(self.passport_keys)
+
+        # Число рейсов паспорта: регистрации по ключу, одним запросом по индексу
+        # уникального ограничения (passport_key, flight) - на рейс не больше одной
+        flights = dict(
+            Registration.objects.filter(passport_key__in=keys).values_list('passport_key').annotate(count=Count('id'))
+        )
+        self.flight_counts = [flights.get(key, 0) for key in self.passport_keys]
+
+        # Список наблюдения хранит паспорт как введён, сравниваются ключи
+        numbers = {r.passport_number.strip() for r in self.registrations}
+        watchlist = {
+            normalize_passport(series, number)
+            for series, number in WatchlistEntry.objects.filter(
+                passport_number__in=numbers
+            ).values_list('passport_series', 'passport_number')
+        }
+        self.watchlisted = [key in watchlist for key in self.passport_keys]
+
+    def __len__(self):
+        return len(self.registrations)
+
+
+def watchlist_rule(batch, config):
+    return [1.0 if hit else 0.0 for hit in batch.watchlisted]
+
+
+def frequent_passport_rule(batch, config):
+    """Паспорт на многих рейсах: частые перелёты - слабый признак, чрезмерные - сильный"""
+    frequent = config['FREQUENT_PASSPORT_REGISTRATIONS']
+    excessive = config['EXCESSIVE_PASSPORT_REGISTRATIONS']
+    return [
+        0.6 if flights >= excessive else 0.2 if flights >= frequent else 0.0
+        for flights in batch.flight_counts
+    ]
+
+
+def destination_rule(batch, config):
+    weights = config['DESTINATION_WEIGHTS']
+    return [weights.get(destination, 0.0) for destination in batch.destinations]
+
+
+def get_config():
+    return settings.RISK_SCORING
+
+
+def get_rules(config):
+    return [import_string(path) for path in config['RULES']]
+
+
+def score_batch(batch, config=None):
+    config = config or get_config()
+    scores = [0.0] * len(batch)
+    for rule in get_rules(config):
+        scores = [score + value for score, value in zip(scores, rule(batch, config))]
+    return scores
+
+
+def score_registrations(registrations, only_raise=False, config=None):
+    """Оценивает регистрации и записывает изменившиеся статусы пассажиров.
+
+    Регистрации должны быть сохранены и иметь flight и passenger (подойдёт
+    select_related). only_raise - только помечать, не снимая отметок,
+    поставленных раньше (например, вручную). Возвращает число помеченных.
+    """
+    config = config or get_config()
+    batch = RiskBatch(registrations)
+    if not len(batch):
+        return 0
+
+    threshold = config['THRESHOLD']
+    changed = []
+    flagged = 0
+    for registration, score in zip(batch.registrations, score_batch(batch, config)):
+        passenger = registration.passenger
+        if passenger is None:
+            continue
+        status = 1 if score >= threshold else 0
+        flagged += status
+        if only_raise and status == 0:
+            continue
+        if passenger.suspicious_status != status:
+            passenger.suspicious_status = status
+            changed.append(passenger)
+
+    if changed:
+        Passenger.objects.bulk_update(changed, ['suspicious_status'], batch_size=BULK_UPDATE_BATCH_SIZE)
+    return flagged
+
+
+def score_flight(flight, batch_size=DEFAULT_BATCH_SIZE, only_raise=False):
+    """Пересчитывает риск всех регистраций рейса пакетами по id (для фоновых задач)"""
+    queryset = Registration.objects.select_related('flight', 'passenger').order_by('id')
+    if flight is not None:
+        queryset = queryset.filter(flight=flight)
+
+    scored = 0
+    flagged = 0
+    last_id = 0
+    while True:
+        registrations = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not registrations:
+            break
+        flagged += score_registrations(registrations, only_raise=only_raise)
+        scored += len(registrations)
+        last_id = registrations[-1].id
+    return scored, flagged
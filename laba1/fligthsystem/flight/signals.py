@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import flights_changed
+from .models import Flight
+
+
+@receiver([post_save, post_delete], sender=Flight)
+def invalidate_flight_catalog(sender, **kwargs):
+    flights_changed()
@@ -0,0 +1,157 @@
+"""Выявление медленных SQL-запросов.
+
+SlowQueryMiddleware на время запроса ставит execute_wrapper на все
+подключения. Запрос дольше SLOW_QUERY['THRESHOLD_MS'] попадает в кольцевой
+буфер (последние SLOW_QUERY['BUFFER_SIZE'] записей) вместе с текстом SQL,
+кадрами стека из кода flight и планом выполнения. Для простых SELECT
+снимается EXPLAIN ANALYZE (запрос выполняется повторно, поэтому это можно
+отключить через 'EXPLAIN_ANALYZE'), для остальных - только EXPLAIN: WITH
+может содержать INSERT/UPDATE/DELETE, а FOR UPDATE и nextval() изменили бы
+блокировки и последовательности. План снимается в отдельной точке
+сохранения, которая всегда откатывается: ошибка EXPLAIN не ломает транзакцию
+представления, а побочные эффекты повторного выполнения не сохраняются.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections, transaction
+
+from . import metrics, middleware
+
+logger = logging.getLogger('flight')
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+MAX_SQL_LENGTH = 10000
+MAX_STACK_FRAMES = 10
+# Обёртки и middleware сами по себе не место вызова запроса
+INFRASTRUCTURE_FILES = {os.path.abspath(module.__file__) for module in (metrics, middleware)} | {os.path.abspath(__file__)}
+
+# Повторное выполнение таких SELECT меняет состояние вне отката точки сохранения
+SIDE_EFFECTS_RE = re.compile(r'\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE)\b|\bFOR\s+KEY\s+SHARE\b|\b(NEXTVAL|SETVAL)\s*\(', re.IGNORECASE)
+
+# Не перехватывать собственные EXPLAIN
+_explaining = ContextVar('slow_query_explaining', default=False)
+_request_path = ContextVar('slow_query_request_path', default=None)
+
+
+class SlowQueryLog:
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=size)
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self):
+        """Записи от новых к старым"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+slow_query_log = SlowQueryLog(settings.SLOW_QUERY['BUFFER_SIZE'])
+
+
+def app_stack():
+    """Кадры стека из кода приложения (без этого модуля), от внешнего к внутреннему"""
+    frames = [
+        f"{os.path.relpath(frame.filename, os.path.dirname(APP_DIR))}:{frame.lineno} in {frame.name}"
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(APP_DIR) and frame.filename not in INFRASTRUCTURE_FILES
+    ]
+    return frames[-MAX_STACK_FRAMES:]
+
+
+def is_plain_select(sql):
+    return sql.lstrip().upper().startswith('SELECT') and not SIDE_EFFECTS_RE.search(sql)
+
+
+def explain(connection, sql, params, analyze):
+    options = 'ANALYZE, BUFFERS' if analyze and is_plain_select(sql) else 'COSTS'
+    token = _explaining.set(True)
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN ({options}) {sql}', params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            # План нужен только как текст - всё, что сделал ANALYZE, откатывается
+            transaction.set_rollback(True, using=connection.alias)
+        return plan
+    except DatabaseError as e:
+        return f'EXPLAIN не выполнен: {e}'
+    finally:
+        _explaining.reset(token)
+
+
+class SlowQueryWrapper:
+    def __init__(self, connection, threshold, analyze):
+        self.connection = connection
+        self.threshold = threshold
+        self.analyze = analyze
+
+    def __call__(self, execute, sql, params, many, context):
+        if _explaining.get():
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        if duration >= self.threshold:
+            self.record(sql, params, many, duration)
+        return result
+
+    def record(self, sql, params, many, duration):
+        stack = app_stack()
+        plan = None if many else explain(self.connection, sql, params, self.analyze)
+        slow_query_log.add({
+            'timestamp': datetime.now(timezone.utc),
+            'duration_ms': round(duration * 1000, 1),
+            'alias': self.connection.alias,
+            'path': _request_path.get(),
+            'sql': sql[:MAX_SQL_LENGTH],
+            'params': repr(params)[:MAX_SQL_LENGTH] if not many else '<executemany>',
+            'stack': stack,
+            'plan': plan,
+        })
+        logger.warning(
+            f"Slow query: duration_ms={duration * 1000:.1f}, path={_request_path.get()}, "
+            f"call_site={stack[-1] if stack else None}",
+            extra={'event': 'slow_query', 'sql': sql[:1000]},
+        )
+
+
+class SlowQueryMiddleware:
+    def __init__(self, get_response):
+        config = settings.SLOW_QUERY
+        if not config.get('THRESHOLD_MS'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = config['THRESHOLD_MS'] / 1000
+        self.analyze = config.get('EXPLAIN_ANALYZE', True)
+
+    def __call__(self, request):
+        token = _request_path.set(request.path)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    connection = connections[alias]
+                    stack.enter_context(
+                        connection.execute_wrapper(SlowQueryWrapper(connection, self.threshold, self.analyze))
+                    )
+                return self.get_response(request)
+        finally:
+            _request_path.reset(token)
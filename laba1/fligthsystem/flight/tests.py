@@ -0,0 +1,658 @@
+import json
+import logging
+import shutil
+import tempfile
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .cache import TieredCache, bump_version, get_version
+from .catalog import CATALOG_VERSION_KEY, flight_catalog
+from .forms import DUPLICATE_BOOKING_ERROR, RegistrationForm
+from .logs import AsyncQueueHandler
+from .manifests import ManifestError, parse_manifest, validate_manifest
+from .metrics import registry as metrics_registry
+from .models import CustomUser, Flight, Passenger, Registration, WatchlistEntry
+from .risk import RiskBatch, score_batch, score_registrations
+from .slowqueries import explain, slow_query_log
+
+# LocMem вместо Redis в роли общего L2
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+
+    def make_worker(self, **options):
+        options.setdefault('L2', 'shared')
+        return TieredCache('', {'OPTIONS': options})
+
+    def test_workers_share_values_through_l2(self):
+        first, second = self.make_worker(), self.make_worker()
+        first.set('flights', [1, 2, 3], 60)
+        self.assertEqual(second.get('flights'), [1, 2, 3])
+
+    def test_l1_answers_without_l2_until_its_ttl(self):
+        worker = self.make_worker(L1_TIMEOUT=5)
+        with mock.patch('flight.cache.time.monotonic', return_value=1000):
+            worker.set('key', 'value', 60)
+        caches['shared'].clear()
+
+        with mock.patch('flight.cache.time.monotonic', return_value=1004):
+            self.assertEqual(worker.get('key'), 'value')
+        with mock.patch('flight.cache.time.monotonic', return_value=1006):
+            self.assertIsNone(worker.get('key'))
+
+    def test_l2_failure_falls_back_to_l1(self):
+        worker = self.make_worker()
+        l2 = caches['shared']
+        with mock.patch.object(l2, 'set', side_effect=ConnectionError), \
+                mock.patch.object(l2, 'get', side_effect=ConnectionError):
+            worker.set('key', 'value')
+            self.assertEqual(worker.get('key'), 'value')
+
+    def test_counters_are_not_kept_in_l1(self):
+        first, second = self.make_worker(), self.make_worker()
+        first.set('counter', 1)
+        self.assertEqual(second.get('counter'), 1)
+
+        first.incr('counter')
+        self.assertEqual(second.get('counter'), 2)
+        self.assertEqual(len(first.l1) + len(second.l1), 0)
+
+    def test_versions_live_in_shared_cache_and_never_repeat(self):
+        self.assertEqual(get_version('catalog'), 0)
+        bump_version('catalog')
+        first = get_version('catalog')
+        self.assertEqual(caches['shared'].get('catalog'), first)
+
+        caches['shared'].clear()  # вытеснение ключа
+        bump_version('catalog')
+        self.assertNotIn(get_version('catalog'), (0, first))
+
+    def test_unavailable_shared_cache_has_no_version(self):
+        with mock.patch.object(caches['shared'], 'get', side_effect=ConnectionError):
+            self.assertIsNone(get_version('catalog'))
+
+
+class StatelessJWTTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='op', email='op@example.com')
+        self.passenger = Passenger.objects.create()
+
+    def put_status(self, **headers):
+        return self.client.put(
+            reverse('update_passenger_status', args=[self.passenger.id]),
+            json.dumps({'suspicious_status': 1}),
+            content_type='application/json',
+            **headers,
+        )
+
+    def test_token_authenticates_without_user_queries(self):
+        token = AccessToken.for_user(self.user)
+        token['username'] = self.user.username
+
+        # Пассажир: чтение и обновление; сессия и пользователь не читаются
+        with self.assertNumQueries(2):
+            response = self.put_status(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.json()['status'], 'success')
+        self.passenger.refresh_from_db()
+        self.assertEqual(self.passenger.suspicious_status, 1)
+
+    def test_bearer_token_is_exempt_from_csrf(self):
+        token = AccessToken.for_user(self.user)
+        token['username'] = self.user.username
+        self.client = Client(enforce_csrf_checks=True)
+        self.assertEqual(self.put_status(HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 200)
+
+        # Токен из cookie и сессию браузер отправляет сам - CSRF проверяется
+        self.client.cookies['jwt_access_token'] = str(token)
+        self.assertEqual(self.put_status().status_code, 403)
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+        self.assertEqual(self.put_status().status_code, 403)
+
+    def test_invalid_token_falls_back_to_session(self):
+        response = self.put_status(HTTP_AUTHORIZATION='Bearer broken')
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.put_status(HTTP_AUTHORIZATION='Bearer broken').status_code, 200)
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class PerformanceMetricsTests(TestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.client.force_login(CustomUser.objects.create(username='op', email='op@example.com'))
+
+    def test_request_metrics_are_exposed(self):
+        self.client.get(reverse('registration'))
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        body = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_request_duration_seconds_count{view="registration"', body)
+        self.assertRegex(body, r'http_request_template_duration_seconds_sum\{view="registration",pid="\d+"\} 0\.\d*[1-9]')
+
+    def test_metrics_require_token(self):
+        # За прокси адрес клиента всегда локальный - он ничего не разрешает
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_metrics_are_closed_without_configured_token(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer None')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(SLOW_QUERY={'THRESHOLD_MS': 0.001, 'BUFFER_SIZE': 200, 'EXPLAIN_ANALYZE': True})
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        slow_query_log.clear()
+        self.user = CustomUser.objects.create(username='op', email='op@example.com')
+        self.staff = CustomUser.objects.create(username='admin', email='admin@example.com', is_staff=True)
+
+    def test_slow_queries_are_captured_with_plan_and_call_site(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('suspicious_passengers'))
+
+        entry = next(e for e in slow_query_log.entries() if 'flight_flight' in e['sql'])
+        self.assertEqual(entry['path'], reverse('suspicious_passengers'))
+        self.assertIn('actual time', entry['plan'])
+        self.assertTrue(any('flight/' in frame for frame in entry['stack']))
+
+    def test_only_staff_see_slow_queries(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('slow_queries')).status_code, 302)
+
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse('slow_queries')), 'План выполнения')
+
+    def test_explain_rolls_back_side_effects(self):
+        plan = explain(connection, "SELECT set_config('slow_query.test', 'changed', false)", None, analyze=True)
+        self.assertIn('actual time', plan)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('slow_query.test', true)")
+            self.assertIn(cursor.fetchone()[0], (None, ''))
+
+    def test_only_plain_selects_are_analyzed(self):
+        Passenger.objects.create()
+        for sql in [
+            'WITH gone AS (DELETE FROM flight_passenger RETURNING id) SELECT count(*) FROM gone',
+            'SELECT id FROM flight_passenger FOR UPDATE',
+            "SELECT nextval(pg_get_serial_sequence('flight_passenger', 'id'))",
+        ]:
+            plan = explain(connection, sql, None, analyze=True)
+            self.assertNotIn('actual time', plan, sql)
+        self.assertEqual(Passenger.objects.count(), 1)
+
+
+class AsyncQueueHandlerTests(SimpleTestCase):
+    def setUp(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir, ignore_errors=True)
+        self.path = Path(log_dir) / 'debug.log'
+
+    def make_handler(self):
+        handler = AsyncQueueHandler(filename=self.path, console=False)
+        self.addCleanup(handler.close)
+        return handler
+
+    def emit(self, handler, message):
+        handler.handle(logging.makeLogRecord({'name': 'flight', 'levelno': logging.INFO, 'levelname': 'INFO', 'msg': message}))
+
+    def drain(self, handler):
+        # stop() дожидается записи всей очереди; дальше работа продолжается
+        handler.stop()
+        handler.start()
+
+    def messages(self, path):
+        return [json.loads(line)['message'] for line in path.read_text(encoding='utf-8').splitlines()]
+
+    def test_workers_append_to_one_file(self):
+        first, second = self.make_handler(), self.make_handler()
+        for i in range(100):
+            self.emit(first, f'first {i}')
+            self.emit(second, f'second {i}')
+        self.drain(first)
+        self.drain(second)
+
+        messages = self.messages(self.path)
+        self.assertEqual(len(messages), 200)
+        self.assertEqual([m for m in messages if m.startswith('first')], [f'first {i}' for i in range(100)])
+
+    def test_external_rotation_reopens_file(self):
+        handler = self.make_handler()
+        self.emit(handler, 'before')
+        self.drain(handler)
+
+        rotated = self.path.with_name('debug.log.1')
+        self.path.rename(rotated)  # так делает logrotate
+        self.emit(handler, 'after')
+        self.drain(handler)
+
+        self.assertEqual(self.messages(rotated), ['before'])
+        self.assertEqual(self.messages(self.path), ['after'])
+
+
+class SuspiciousPassengersPageTests(TestCase):
+    def setUp(self):
+        self.client.force_login(CustomUser.objects.create(username='op', email='op@example.com'))
+        self.flights = [
+            Flight.objects.create(flight_number=f'SU{1000 + i}', destination='Москва') for i in range(5)
+        ]
+        # У рейса с индексом 2 регистраций нет - на страницах его быть не должно
+        for i, flight in enumerate(self.flights):
+            if i == 2:
+                continue
+            for j in range(i + 1):
+                Registration.objects.create(
+                    last_name='Иванов', first_name=f'Пассажир {j}', passport_series='1234',
+                    passport_number=f'{i}{j}0000', flight=flight,
+                    passenger=Passenger.objects.create(suspicious_status=j % 2),
+                )
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('suspicious_passengers'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_pages_contain_only_flights_with_registrations(self):
+        first, second = self.get_page(), self.get_page(page=2)
+
+        self.assertEqual(first.paginator.count, 4)
+        self.assertEqual([flight for flight, _ in first.object_list], self.flights[:2])
+        self.assertEqual([flight for flight, _ in second.object_list], [self.flights[3], self.flights[4]])
+        self.assertEqual([len(passengers) for _, passengers in second.object_list], [4, 5])
+        self.assertEqual(second.object_list[0][1][1]['suspicious_status'], 1)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.get_page()  # справочник рейсов загружен
+        # Сессия, пользователь, COUNT рейсов, рейсы страницы, регистрации с пассажирами
+        with self.assertNumQueries(5):
+            self.get_page(page=2)
+
+    def test_out_of_range_page_shows_last_page(self):
+        self.assertEqual(self.get_page(page=99).number, 2)
+        self.assertEqual(self.get_page(page='abc').number, 1)
+
+    def test_flight_filter(self):
+        page = self.get_page(flight_id=self.flights[1].id)
+        self.assertEqual([(flight, len(passengers)) for flight, passengers in page.object_list], [(self.flights[1], 2)])
+
+        self.assertEqual(list(self.get_page(flight_id=self.flights[2].id).object_list), [])
+        self.assertEqual(list(self.get_page(flight_id='SU1001').object_list), [])
+
+    def test_no_registrations(self):
+        Registration.objects.all().delete()
+        page = self.get_page()
+        self.assertEqual(page.paginator.count, 0)
+        self.assertEqual(list(page.object_list), [])
+
+
+class ManifestImportTests(TestCase):
+    def setUp(self):
+        self.flight = Flight.objects.create(flight_number='SU1234', destination='Москва')
+        self.other_flight = Flight.objects.create(flight_number='SU4321', destination='Казань')
+        self.client.force_login(CustomUser.objects.create(username='op', email='op@example.com'))
+
+    def row(self, number, **values):
+        return {
+            'last_name': 'Иванов', 'first_name': 'Иван', 'passport_series': '1234',
+            'passport_number': number, 'flight': 'SU1234', **values,
+        }
+
+    def book(self, series, number, flight):
+        return Registration.objects.create(
+            last_name='Петров', first_name='Пётр', passport_series=series, passport_number=number, flight=flight,
+        )
+
+    def post_manifest(self, rows, **params):
+        url = reverse('import_manifest')
+        if params:
+            url += '?' + '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.client.post(url, json.dumps(rows), content_type='application/json')
+
+    def test_parse_csv_and_json(self):
+        rows, flight = parse_manifest(
+            '﻿last_name,first_name,passport_series,passport_number\nИванов,Иван,1234,567890\n'.encode(), 'csv'
+        )
+        self.assertEqual((rows[0]['passport_number'], flight), ('567890', None))
+
+        rows, flight = parse_manifest(json.dumps({'flight': 'SU1234', 'passengers': [self.row('567890')]}), 'json')
+        self.assertEqual((len(rows), flight), (1, 'SU1234'))
+
+    def test_parse_errors(self):
+        for content, fmt in [
+            ('last_name,first_name\nИванов,Иван\n', 'csv'),
+            ('{"passengers": ', 'json'),
+            ('"строка"', 'json'),
+            ('Иванов'.encode('cp1251'), 'csv'),
+            ('', 'xml'),
+        ]:
+            with self.subTest(fmt=fmt, content=content), self.assertRaises(ManifestError):
+                parse_manifest(content, fmt)
+
+    def test_validation_reports_every_row(self):
+        self.book('1234', '111111', self.flight)
+        valid, errors = validate_manifest([
+            self.row('222222'),
+            self.row('12', first_name=''),
+            self.row('333333', flight='XX0000'),
+            self.row('111111'),  # уже зарегистрирован
+            self.row('222222'),  # повтор внутри манифеста
+            self.row('222222', flight='SU4321'),  # тот же паспорт на другой рейс - можно
+            'не объект',
+        ])
+
+        self.assertEqual([values['passport_number'] for values in valid], ['222222', '222222'])
+        self.assertEqual(
+            [(error['row'], error['field']) for error in errors],
+            [(2, 'first_name'), (2, 'passport_number'), (3, 'flight'), (4, 'passport_number'),
+             (5, 'passport_number'), (7, None)],
+        )
+        self.assertEqual(errors[3]['message'], DUPLICATE_BOOKING_ERROR)
+
+    def test_manifest_with_errors_is_rejected_whole(self):
+        response = self.post_manifest([self.row('222222'), self.row('333')])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['row'], 2)
+        self.assertFalse(Registration.objects.exists())
+        self.assertFalse(Passenger.objects.exists())
+
+    def test_skip_invalid_imports_correct_rows(self):
+        response = self.post_manifest([self.row('222222'), self.row('333'), self.row('444444')], skip_invalid=1)
+
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [2])
+        self.assertEqual(
+            set(Registration.objects.values_list('passport_key', 'flight__flight_number')),
+            {('1234222222', 'SU1234'), ('1234444444', 'SU1234')},
+        )
+        self.assertEqual(Passenger.objects.count(), 2)
+
+    def booked_during_import(self, series, number):
+        """validate_manifest, после которого паспорт регистрирует параллельный запрос"""
+        calls = []
+
+        def validate(rows, default_flight=None):
+            result = validate_manifest(rows, default_flight)
+            if not calls:
+                self.book(series, number, self.flight)
+            calls.append(result)
+            return result
+        return mock.patch('flight.manifests.validate_manifest', side_effect=validate)
+
+    def test_concurrent_booking_is_reported_per_row(self):
+        with self.booked_during_import('1234', '333333'):
+            response = self.post_manifest([self.row('222222'), self.row('333333')])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            {'row': 2, 'field': 'passport_number', 'message': DUPLICATE_BOOKING_ERROR},
+        ])
+        self.assertEqual(Registration.objects.count(), 1)  # только параллельная
+
+    def test_concurrent_booking_with_skip_invalid(self):
+        with self.booked_during_import('1234', '333333'):
+            response = self.post_manifest([self.row('222222'), self.row('333333')], skip_invalid=1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [2])
+
+    def test_persistent_conflicts_give_up(self):
+        with mock.patch('flight.manifests.write_registrations', side_effect=IntegrityError):
+            response = self.post_manifest([self.row('222222')])
+        self.assertEqual(response.status_code, 409)
+
+
+RISK_CONFIG = {
+    'THRESHOLD': 0.5,
+    'RULES': ['flight.risk.watchlist_rule', 'flight.risk.frequent_passport_rule', 'flight.risk.destination_rule'],
+    'FREQUENT_PASSPORT_REGISTRATIONS': 3,
+    'EXCESSIVE_PASSPORT_REGISTRATIONS': 5,
+    'DESTINATION_WEIGHTS': {'Кабул': 0.3},
+}
+
+
+@override_settings(RISK_SCORING=RISK_CONFIG)
+class RiskScoringTests(TestCase):
+    def setUp(self):
+        self.flights = [Flight.objects.create(flight_number=f'SU{1000 + i}', destination='Москва') for i in range(6)]
+
+    def register(self, flight, series='1234', number='567890', status=0):
+        return Registration.objects.create(
+            last_name='Иванов', first_name='Иван', passport_series=series, passport_number=number,
+            flight=flight, passenger=Passenger.objects.create(suspicious_status=status),
+        )
+
+    def scores(self, registrations):
+        return score_batch(RiskBatch(Registration.objects.filter(
+            id__in=[r.id for r in registrations]
+        ).select_related('flight').order_by('id')), RISK_CONFIG)
+
+    def test_watchlist_matches_normalized_passport(self):
+        WatchlistEntry.objects.create(passport_series='12 34', passport_number='567890')
+        hit, miss = self.register(self.flights[0]), self.register(self.flights[0], number='111111')
+        self.assertEqual(self.scores([hit, miss]), [1.0, 0.0])
+
+    def test_frequent_passport_counts_flights_by_passport_key(self):
+        # Серия с пробелом и без - один паспорт
+        registrations = [
+            self.register(flight, series='12 34' if i % 2 else '1234') for i, flight in enumerate(self.flights[:2])
+        ]
+        self.assertEqual(self.scores(registrations[:1]), [0.0])
+
+        registrations.append(self.register(self.flights[2]))
+        self.assertEqual(self.scores(registrations[:1]), [0.2])
+
+        registrations += [self.register(flight) for flight in self.flights[3:5]]
+        self.assertEqual(self.scores(registrations), [0.6] * 5)
+
+    def test_destination_weights(self):
+        flight = Flight.objects.create(flight_number='SU2000', destination='Кабул')
+        self.assertEqual(self.scores([self.register(flight)]), [0.3])
+
+    def test_batch_scoring_uses_fixed_number_of_queries(self):
+        WatchlistEntry.objects.create(passport_series='1234', passport_number='000001')
+        registrations = list(Registration.objects.filter(id__in=[
+            self.register(flight, number=f'00000{i}').id for i, flight in enumerate(self.flights[:4], start=1)
+        ]).select_related('flight', 'passenger'))
+
+        # Число рейсов, список наблюдения, bulk_update
+        with self.assertNumQueries(3):
+            self.assertEqual(score_registrations(registrations), 1)
+        self.assertEqual(Passenger.objects.filter(suspicious_status=1).count(), 1)
+
+    def test_only_raise_keeps_earlier_flags(self):
+        manual = self.register(self.flights[0], status=1)
+        registrations = list(Registration.objects.filter(id=manual.id).select_related('flight', 'passenger'))
+
+        self.assertEqual(score_registrations(registrations, only_raise=True), 0)
+        manual.passenger.refresh_from_db()
+        self.assertEqual(manual.passenger.suspicious_status, 1)
+
+        score_registrations(registrations)
+        manual.passenger.refresh_from_db()
+        self.assertEqual(manual.passenger.suspicious_status, 0)
+
+    def test_command_reset(self):
+        manual = self.register(self.flights[0], status=1)
+        WatchlistEntry.objects.create(passport_series='1234', passport_number='222222')
+        watched = self.register(self.flights[0], number='222222')
+
+        call_command('score_flight_risk', '--flight', 'SU1000', stdout=StringIO())
+        self.assertEqual(Passenger.objects.get(id=manual.passenger_id).suspicious_status, 1)
+        self.assertEqual(Passenger.objects.get(id=watched.passenger_id).suspicious_status, 1)
+
+        out = StringIO()
+        call_command('score_flight_risk', '--all', '--reset', '--batch-size', '1', stdout=out)
+        self.assertIn('Оценено регистраций: 2, подозрительных: 1', out.getvalue())
+        self.assertEqual(Passenger.objects.get(id=manual.passenger_id).suspicious_status, 0)
+
+        with self.assertRaises(CommandError):
+            call_command('score_flight_risk', '--flight', 'XX0000')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RegistrationPassportKeyTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flight = Flight.objects.create(flight_number='SU1234', destination='Москва')
+            self.other_flight = Flight.objects.create(flight_number='SU4321', destination='Казань')
+        self.booked = Registration.objects.create(
+            last_name='Иванов', first_name='Иван', passport_series='12 34', passport_number='567890',
+            flight=self.flight,
+        )
+
+    def form(self, **values):
+        return RegistrationForm({
+            'last_name': 'Петров', 'first_name': 'Пётр', 'passport_series': '1234',
+            'passport_number': '567890', 'flight': self.flight.id, **values,
+        })
+
+    def test_is_booked_matches_normalized_passport_on_flight(self):
+        self.assertEqual(self.booked.passport_key, '1234567890')
+        self.assertTrue(Registration.objects.is_booked('1234', '567890', self.flight))
+        self.assertTrue(Registration.objects.is_booked('12 34', ' 567890', self.flight))
+        self.assertFalse(Registration.objects.is_booked('1234', '567890', self.other_flight))
+        self.assertFalse(Registration.objects.is_booked('1234', '111111', self.flight))
+        self.assertEqual(list(Registration.objects.for_passport('1234', '567890')), [self.booked])
+
+    def test_form_rejects_duplicate_booking(self):
+        form = self.form()
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['passport_number'], [DUPLICATE_BOOKING_ERROR])
+
+        self.assertTrue(self.form(flight=self.other_flight.id).is_valid())
+
+    def test_constraint_rejects_duplicate_booking(self):
+        with self.assertRaises(IntegrityError):
+            Registration.objects.create(
+                last_name='Петров', first_name='Пётр', passport_series='1234', passport_number='567890',
+                flight=self.flight,
+            )
+
+    def test_legacy_duplicate_keeps_no_key(self):
+        legacy = Registration.objects.create(
+            last_name='Петров', first_name='Пётр', passport_series='1234', passport_number='567890',
+            flight=self.flight, legacy_duplicate=True,
+        )
+        legacy.first_name = 'Павел'
+        legacy.save()
+        legacy.refresh_from_db()
+        self.assertIsNone(legacy.passport_key)
+        self.assertEqual(list(Registration.objects.for_passport('1234', '567890')), [self.booked])
+
+    def test_registration_without_key_gets_it_on_save(self):
+        # Вставлена старым кодом во время миграции: ключа нет, но это не повтор
+        Registration.objects.filter(id=self.booked.id).update(passport_key=None)
+        self.booked.refresh_from_db()
+        self.booked.save()
+        self.booked.refresh_from_db()
+        self.assertEqual(self.booked.passport_key, '1234567890')
+
+    def test_insert_without_new_columns(self):
+        # Так вставляет регистрации старый код во время миграции
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO flight_registration (last_name, first_name, passport_series, passport_number, flight_id) '
+                "VALUES ('Петров', 'Пётр', '5555', '000001', %s) RETURNING id",
+                [self.flight.id],
+            )
+            registration = Registration.objects.get(id=cursor.fetchone()[0])
+        self.assertEqual((registration.passport_key, registration.legacy_duplicate), (None, False))
+
+    def test_migration_keys_late_registrations(self):
+        migration = import_module('flight.migrations.0007_registration_passport_key')
+        late = Registration.objects.create(
+            last_name='Петров', first_name='Пётр', passport_series='5555', passport_number='000001',
+            flight=self.flight,
+        )
+        duplicate = Registration.objects.create(
+            last_name='Петров', first_name='Пётр', passport_series='9999', passport_number='000001',
+            flight=self.flight,
+        )
+        # Обе вставлены старым кодом без ключа; вторая повторяет паспорт первой регистрации
+        Registration.objects.filter(id=late.id).update(passport_key=None)
+        Registration.objects.filter(id=duplicate.id).update(
+            passport_key=None, passport_series='12 34', passport_number='567890',
+        )
+
+        with connection.schema_editor() as schema_editor:
+            migration.fill_late_passport_keys(None, schema_editor)
+
+        late.refresh_from_db()
+        duplicate.refresh_from_db()
+        self.assertEqual((late.passport_key, late.legacy_duplicate), ('5555000001', False))
+        self.assertEqual((duplicate.passport_key, duplicate.legacy_duplicate), (None, True))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FlightCatalogTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flight = Flight.objects.create(flight_number='SU1234', destination='Москва')
+        self.client.force_login(CustomUser.objects.create(username='op', email='op@example.com'))
+        flight_catalog.flights()  # справочник загружен
+
+    def flight_queries(self, queries):
+        # Страница подозрительных пассажиров сама выбирает рейсы с регистрациями
+        # (пагинация в SQL) - это не обращение к справочнику
+        return [
+            query['sql'] for query in queries
+            if 'FROM "flight_flight"' in query['sql'] and 'flight_registration' not in query['sql']
+        ]
+
+    def test_form_uses_catalog_without_queries(self):
+        with self.assertNumQueries(0):
+            form = RegistrationForm()
+            self.assertIn(f'value="{self.flight.id}"', str(form['flight']))
+            self.assertEqual(form.fields['flight'].clean(str(self.flight.id)), self.flight)
+
+    def test_views_run_no_flight_queries(self):
+        for url in (reverse('registration'), reverse('suspicious_passengers')):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.flight_queries(queries), [])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('registration'), {
+                'last_name': 'Иванов', 'first_name': 'Иван', 'passport_series': '1234',
+                'passport_number': '567890', 'flight': self.flight.id,
+            })
+        self.assertEqual(response.context['success_message'], 'Регистрация прошла успешно!')
+        self.assertEqual(self.flight_queries(queries), [])
+
+    def test_saved_flight_is_picked_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Flight.objects.create(flight_number='SU4321', destination='Казань')
+        self.assertIn(f'value="{added.id}"', str(RegistrationForm()['flight']))
+
+    def test_version_published_by_another_worker_is_picked_up(self):
+        # bulk_create сигналов не шлёт - снимок этого процесса не сброшен
+        added, = Flight.objects.bulk_create([Flight(flight_number='SU4321', destination='Казань')])
+        self.assertIsNone(flight_catalog.get(added.id))
+
+        bump_version(CATALOG_VERSION_KEY)
+        self.assertEqual(flight_catalog.get(added.id), added)
+        with self.assertNumQueries(0):
+            self.assertEqual(flight_catalog.get_by_number('SU4321'), added)
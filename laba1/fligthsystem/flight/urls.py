@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import registration_view, home_view, login_view, register, logout_view, suspicious_passengers
-from .views import update_passenger_status, delete_registration
+from .views import update_passenger_status, delete_registration, metrics, slow_queries
+from .views import import_manifest_api
 
 handler403 = 'flight.views.handler403'
 handler401 = 'flight.views.handler401'
@@ -15,4 +16,7 @@ urlpatterns = [
     path('suspicious-passengers/', suspicious_passengers, name='suspicious_passengers'),
     path('api/passengers/<int:passenger_id>/status/', update_passenger_status, name='update_passenger_status'),
     path('api/registrations/<int:registration_id>/', delete_registration, name='delete_registration'),
+    path('api/manifests/', import_manifest_api, name='import_manifest'),
+    path('metrics/', metrics, name='metrics'),
+    path('slow-queries/', slow_queries, name='slow_queries'),
 ]
\ No newline at end of file
@@ -1,6 +1,6 @@
 from django.shortcuts import render, redirect
 from django.views.decorators.http import require_GET
-from .forms import RegistrationForm, CreationForm
+from .forms import DUPLICATE_BOOKING_ERROR, RegistrationForm, CreationForm
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.forms import AuthenticationForm
@@ -9,11 +9,20 @@ from django.urls import reverse_lazy
 from django.contrib.auth.views import LogoutView
 from django.contrib.auth.decorators import login_required
 from .models import Flight, Passenger, Registration
-from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.views.decorators.http import require_http_methods
 from rest_framework_simplejwt.tokens import RefreshToken
-import random, json
+import hmac
+import json
 from django.conf import settings
+from .metrics import registry as metrics_registry
+from .slowqueries import slow_query_log
+from .catalog import flight_catalog
+from .manifests import ManifestError, import_manifest, parse_manifest
+from .risk import score_registrations
+from django.contrib.admin.views.decorators import staff_member_required
 import logging
 
 logger = logging.getLogger(__name__)
@@ -62,6 +71,7 @@ def login_view(request):
                 
                 # Генерация JWT
                 refresh = RefreshToken.for_user(user)
+                refresh['username'] = user.username  # для StatelessJWTMiddleware
                 access_token = str(refresh.access_token)
                 
                 # Логируем токены
@@ -93,7 +103,7 @@ def home_view(request):
 @login_required
 def registration_view(request):
     success_message = None
-    flights = Flight.objects.all()  # Получаем все рейсы
+    flights = flight_catalog.flights()  # Получаем все рейсы
 
     if request.method == 'POST':
         form = RegistrationForm(request.POST)
@@ -101,20 +111,22 @@ def registration_view(request):
             registration = form.save(commit=False)
 
             passenger = Passenger()
+            try:
+                with transaction.atomic():
+                    passenger.save()
 
-            if random.random() < 0.2:
-                passenger.suspicious_status = 1
+                    registration.passenger = passenger
+                    registration.save()
+            except IntegrityError:
+                # Параллельная регистрация того же паспорта успела раньше проверки формы
+                form.add_error('passport_number', DUPLICATE_BOOKING_ERROR)
             else:
-                passenger.suspicious_status = 0
+                # Статус выставляет оценка риска (flight.risk) - тем же путём, что и пакетная
+                score_registrations([registration])
 
-            passenger.save()
-
-            registration.passenger = passenger
-            registration.save()
-
-            success_message = "Регистрация прошла успешно!"
-            if passenger.suspicious_status == 1:
-                success_message += " Статус: Подозрительный."
+                success_message = "Регистрация прошла успешно!"
+                if passenger.suspicious_status == 1:
+                    success_message += " Статус: Подозрительный."
 
     else:
         form = RegistrationForm()
@@ -127,23 +139,34 @@ def registration_view(request):
 
 @login_required
 def suspicious_passengers(request):
-    flights = Flight.objects.all()
+    flights = flight_catalog.flights()
     flight_id = request.GET.get('flight_id')
     page_number = request.GET.get('page')
 
-    # Получаем базовый QuerySet с группировкой по рейсам
-    registrations = Registration.objects.select_related('flight', 'passenger')
-    
+    # Пагинация по рейсам (не по пассажирам) в SQL: COUNT и LIMIT/OFFSET только
+    # по рейсам, у которых есть регистрации
+    flights_with_registrations = Flight.objects.filter(
+        Exists(Registration.objects.filter(flight=OuterRef('pk')))
+    ).order_by('id')
+
     if flight_id:
-        registrations = registrations.filter(flight_id=flight_id)
-    
-    # Создаем словарь {рейс: [пассажиры]}
-    flights_dict = {}
+        # Нечисловой flight_id не совпадает ни с одним рейсом
+        flights_with_registrations = (
+            flights_with_registrations.filter(id=flight_id) if flight_id.isdigit()
+            else flights_with_registrations.none()
+        )
+
+    paginator = Paginator(flights_with_registrations, 2)
+    page_obj = paginator.get_page(page_number)
+    page_flights = list(page_obj.object_list)
+
+    # Регистрации только рейсов текущей страницы - одним запросом
+    passengers_by_flight = {flight.id: [] for flight in page_flights}
+    registrations = Registration.objects.filter(
+        flight__in=page_flights
+    ).select_related('passenger').order_by('id')
     for reg in registrations:
-        flight = reg.flight
-        if flight not in flights_dict:
-            flights_dict[flight] = []
-        flights_dict[flight].append({
+        passengers_by_flight[reg.flight_id].append({
             'first_name': reg.first_name,
             'last_name': reg.last_name,
             'suspicious_status': reg.passenger.suspicious_status if reg.passenger else 0,
@@ -151,12 +174,8 @@ def suspicious_passengers(request):
             'passenger_id': reg.passenger.id if reg.passenger else None
         })
 
-    # Преобразуем в список для пагинации
-    flights_list = list(flights_dict.items())
-    
-    # Пагинация по рейсам (не по пассажирам)
-    paginator = Paginator(flights_list, 2)
-    page_obj = paginator.get_page(page_number)
+    # Страница содержит пары (рейс, пассажиры), как ожидает шаблон
+    page_obj.object_list = [(flight, passengers_by_flight[flight.id]) for flight in page_flights]
 
     context = {
         'page_obj': page_obj,  # Содержит (рейс, пассажиры) для текущей страницы
@@ -211,6 +230,52 @@ def update_passenger_status(request, passenger_id):
     except Passenger.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'Passenger not found'}, status=404)
 
+# Ограничение размера манифеста в одном запросе
+MANIFEST_MAX_ROWS = 20000
+
+@require_http_methods(["POST"])
+@login_required
+def import_manifest_api(request):
+    """Пакетная регистрация пассажиров по манифесту.
+
+    Манифест передаётся файлом manifest (multipart) или телом запроса с
+    Content-Type application/json или text/csv. Параметры: flight - номер
+    рейса для всего манифеста, skip_invalid=1 - импортировать корректные
+    строки, даже если в других есть ошибки.
+    """
+    upload = request.FILES.get('manifest')
+    if upload is not None:
+        content = upload.read()
+        fmt = 'json' if upload.name.lower().endswith('.json') else 'csv'
+    else:
+        content = request.body
+        fmt = 'json' if request.content_type == 'application/json' else 'csv'
+
+    try:
+        rows, manifest_flight = parse_manifest(content, fmt)
+    except ManifestError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    if len(rows) > MANIFEST_MAX_ROWS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Слишком много пассажиров в манифесте (максимум {MANIFEST_MAX_ROWS})'
+        }, status=400)
+
+    try:
+        created, errors = import_manifest(
+            rows,
+            default_flight=request.GET.get('flight') or request.POST.get('flight') or manifest_flight,
+            skip_invalid=(request.GET.get('skip_invalid') or request.POST.get('skip_invalid')) == '1',
+        )
+    except ManifestError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=409)
+    logger.info(f"Manifest imported by {request.user.username}: created={created}, errors={len(errors)}")
+
+    if errors and not created:
+        return JsonResponse({'status': 'error', 'created': 0, 'errors': errors}, status=400)
+    return JsonResponse({'status': 'success', 'created': created, 'errors': errors})
+
 @require_http_methods(["DELETE"])
 @login_required
 def delete_registration(request, registration_id):
@@ -226,4 +291,26 @@ def delete_registration(request, registration_id):
         
         return JsonResponse({'status': 'success'})
     except Exception as e:
-        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
\ No newline at end of file
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+
+def metrics(request):
+    """Метрики производительности в формате Prometheus, только с токеном METRICS_TOKEN.
+
+    Адрес клиента за обратным прокси не проверить (все запросы приходят с
+    127.0.0.1), поэтому сборщик передаёт заголовок Authorization: Bearer <токен>
+    (authorization.credentials в scrape_config). Без токена в настройках
+    эндпоинт закрыт.
+    """
+    token = settings.METRICS_TOKEN
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def slow_queries(request):
+    return render(request, 'slow_queries.html', {
+        'entries': slow_query_log.entries(),
+        'threshold_ms': settings.SLOW_QUERY['THRESHOLD_MS'],
+    })
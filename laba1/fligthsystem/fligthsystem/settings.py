@@ -43,26 +43,32 @@ INSTALLED_APPS = [
     'flight',
     'rest_framework',
     'rest_framework_simplejwt',
+    # Истёкшие токены удаляет встроенная команда flushexpiredtokens (cron):
+    # отзывы здесь только при выходе, пакетная очистка как в checkplace не нужна
+    'rest_framework_simplejwt.token_blacklist',
 ]
 
 MIDDLEWARE = [
+    'flight.metrics.PerformanceMiddleware',
+    'flight.slowqueries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # До CSRF: запросы с токеном в заголовке Authorization освобождаются от проверки
+    'flight.middleware.StatelessJWTMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'flight.middleware.LogJWTMiddleware',
     'flight.middleware.AuthErrorMiddleware',
-
 ]
 
 ROOT_URLCONF = 'fligthsystem.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'flight.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -90,9 +96,27 @@ DATABASES = {
         'PASSWORD': '1234',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Проверять постоянное подключение перед повторным использованием в новом запросе
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Подключения к PostgreSQL:
+#   DB_POOL=1 - пул psycopg 3 в каждом воркере (нужен пакет psycopg[pool]),
+#     размер DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE, ожидание свободного DB_POOL_TIMEOUT секунд;
+#   иначе постоянные подключения: DB_CONN_MAX_AGE секунд (0 - новое на каждый запрос).
+#   CONN_HEALTH_CHECKS в режиме пула включает проверку подключения при выдаче из пула.
+if os.environ.get('DB_POOL') == '1':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
 AUTH_USER_MODEL = 'flight.CustomUser '
 
 # Password validation
@@ -140,14 +164,62 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Кэш. Общий уровень (L2) - Redis из REDIS_URL, без него файловый кэш, общий для
+# воркеров одного хоста (CACHE_FALLBACK=locmem - только память процесса).
+# default - двухуровневая обёртка flight.cache.TieredCache поверх него.
+if os.environ.get('REDIS_URL'):
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+elif os.environ.get('CACHE_FALLBACK') == 'locmem':
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'cache'),
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'flight.cache.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_TIMEOUT': 5,  # секунды; дольше этого L1 воркера не отстаёт от L2
+            'L1_MAX_ENTRIES': 1000,
+        },
+    },
+    'shared': SHARED_CACHE,
+}
+
+# Логирование: потоки запросов только ставят записи в очередь, файл
+# (JSON, ротация внешняя - logrotate) пишет фоновый поток, см. flight.logs
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {
+            '()': 'flight.logs.SamplingFilter',
+            # Доля сохраняемых частых записей ниже WARNING
+            'rates': {
+                'django.db.backends': 0.01,
+                'django.server': 0.1,
+                'jwt_header': 0.01,
+            },
+        },
+    },
     'handlers': {
         'file': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': 'django_debug.log',
+            'class': 'flight.logs.AsyncQueueHandler',
+            # Один файл на все воркеры, ротация - logrotate (см. flight.logs)
+            'filename': BASE_DIR / 'django_debug.log',
+            'console': False,
+            'queue_size': 10000,
+            'filters': ['sampling'],
         },
     },
     'loggers': {
@@ -177,6 +249,40 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
 }
 
+# Токен сборщика метрик для /metrics/ (заголовок Authorization: Bearer <токен>);
+# не задан - эндпоинт закрыт
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Медленные SQL-запросы (страница /slow-queries/ для сотрудников с is_staff)
+SLOW_QUERY = {
+    'THRESHOLD_MS': 200,  # None - отключено
+    'BUFFER_SIZE': 200,
+    'EXPLAIN_ANALYZE': True,  # для SELECT запрос выполняется повторно
+}
+
+# Оценка риска регистраций (flight.risk): баллы правил складываются,
+# пассажир с суммой не ниже THRESHOLD помечается подозрительным
+RISK_SCORING = {
+    'THRESHOLD': 0.5,
+    'RULES': [
+        'flight.risk.watchlist_rule',
+        'flight.risk.frequent_passport_rule',
+        'flight.risk.destination_rule',
+    ],
+    # Число рейсов одного паспорта, после которого он считается часто летающим
+    # (слабый признак) и летающим подозрительно часто (достаточно для отметки)
+    'FREQUENT_PASSPORT_REGISTRATIONS': 5,
+    'EXCESSIVE_PASSPORT_REGISTRATIONS': 20,
+    # Дополнительный балл по направлению: {'Город': балл}
+    'DESTINATION_WEIGHTS': {},
+}
+
+# API, где пользователь берётся из access-токена без запросов к БД
+JWT_STATELESS_AUTH = {
+    'COOKIE': 'jwt_access_token',
+    'VIEWS': ['update_passenger_status', 'delete_registration', 'import_manifest'],
+}
+
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AccessControlConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'access_control'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .tasks import register_periodic_tasks
+        register_periodic_tasks()
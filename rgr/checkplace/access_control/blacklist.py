@@ -0,0 +1,136 @@
+"""Проверка отозванных refresh-токенов без запроса к БД на каждое обновление.
+
+Каждый процесс держит Bloom-фильтр JTI действующих (ещё не истёкших)
+отозванных токенов. Если JTI в фильтре нет, токен точно не отозван и таблицы
+token_blacklist не читаются; при вероятном попадании выполняется обычная
+проверка simplejwt по БД.
+
+Фильтр синхронизируется между воркерами через версию в общем кэше: каждая
+запись в BlacklistedToken публикует новую версию после COMMIT (bump_version -
+случайное значение, которое не повторится и после вытеснения ключа), и воркер
+с другой версией перестраивает фильтр одним запросом. Раз в
+BLACKLIST_FILTER_REBUILD_INTERVAL фильтр перестраивается и без этого, чтобы
+выбрасывать истёкшие JTI (из Bloom-фильтра удалять нельзя).
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cache import bump_version, get_version
+
+auth_logger = logging.getLogger('auth')
+
+BLACKLIST_VERSION_KEY = 'access_control:token_blacklist:version'
+BLACKLIST_FILTER_REBUILD_INTERVAL = 3600  # секунды
+BLACKLIST_FILTER_ERROR_RATE = 0.001
+BLACKLIST_FILTER_MIN_CAPACITY = 1024
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Двойное хеширование: k позиций из двух половин одного дайджеста
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistFilter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._version = None
+        self._built_at = 0.0
+
+    def _build(self, version):
+        jtis = list(
+            BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list('token__jti', flat=True)
+        )
+        bloom = BloomFilter(max(len(jtis) * 2, BLACKLIST_FILTER_MIN_CAPACITY), BLACKLIST_FILTER_ERROR_RATE)
+        for jti in jtis:
+            bloom.add(jti)
+        self._bloom = bloom
+        self._version = version
+        self._built_at = time.monotonic()
+
+    def might_contain(self, jti):
+        version = get_version(BLACKLIST_VERSION_KEY)
+        with self._lock:
+            stale = (
+                self._bloom is None
+                or version is None  # без общего кэша нельзя узнать о чужих отзывах
+                or version != self._version
+                or time.monotonic() - self._built_at > BLACKLIST_FILTER_REBUILD_INTERVAL
+            )
+            if stale:
+                self._build(version)
+            return jti in self._bloom
+
+    def add(self, jti):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+    def invalidate(self):
+        with self._lock:
+            self._bloom = None
+
+
+blacklist_filter = BlacklistFilter()
+
+
+def token_blacklisted(jti):
+    """Вызывается после записи в BlacklistedToken, в том числе пакетной"""
+    def publish():
+        blacklist_filter.add(jti)
+        bump_version(BLACKLIST_VERSION_KEY)
+    transaction.on_commit(publish)
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken, который идёт в таблицы blacklist только при попадании в фильтр"""
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if blacklist_filter.might_contain(jti):
+            super().check_blacklist()
+
+
+def prune_expired_tokens(batch_size=5000, now=None):
+    """Удаляет истёкшие outstanding-токены (и их записи blacklist) пакетами.
+
+    Возвращает число удалённых outstanding-токенов.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                OutstandingToken.objects.filter(expires_at__lte=now).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(id__in=ids).delete()
+        total += len(ids)
+    return total
@@ -0,0 +1,54 @@
+"""Кэш данных главной страницы для ролей ADMIN и SECURITY.
+
+Данные общие для всех пользователей роли, поэтому хранятся в кэше Django
+целиком. Ключи содержат версию из общего кэша: сигналы при изменении
+AirportPass или PassRequest публикуют новую версию (после COMMIT, чтобы
+параллельный запрос не успел закэшировать старое состояние), и все воркеры
+сразу читают новые ключи - удаление из TieredCache очистило бы L1 только
+своего процесса. Таймаут - лишь страховка от пропущенных сбросов и уборка
+ключей старых версий.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import bump_version, get_version
+from .models import AirportPass, PassRequest
+
+ADMIN_DASHBOARD_KEY = 'access_control:dashboard:admin'
+SECURITY_DASHBOARD_KEY = 'access_control:dashboard:security'
+DASHBOARD_VERSION_KEY = 'access_control:dashboard:version'
+DASHBOARD_CACHE_TIMEOUT = 300
+
+
+def build_admin_dashboard():
+    return {
+        'active_passes_count': AirportPass.objects.filter(is_active=True).count(),
+        'pending_requests_count': PassRequest.objects.filter(status='PENDING').count(),
+        'recent_requests': list(PassRequest.objects.select_related('user').order_by('-created_at')[:5]),
+    }
+
+
+def build_security_dashboard():
+    return {
+        'active_passes': list(AirportPass.objects.filter(is_active=True).select_related('owner')[:20]),
+    }
+
+
+def get_dashboard(key, build):
+    version = get_version(DASHBOARD_VERSION_KEY)
+    if version is None:
+        # Без общего кэша о сбросах в других воркерах не узнать - только свежие данные
+        return build()
+    return cache.get_or_set(f'{key}:{version}', build, DASHBOARD_CACHE_TIMEOUT)
+
+
+def get_admin_dashboard():
+    return get_dashboard(ADMIN_DASHBOARD_KEY, build_admin_dashboard)
+
+
+def get_security_dashboard():
+    return get_dashboard(SECURITY_DASHBOARD_KEY, build_security_dashboard)
+
+
+def invalidate_dashboards():
+    transaction.on_commit(lambda: bump_version(DASHBOARD_VERSION_KEY))
@@ -0,0 +1,153 @@
+"""Процессный кэш решений о доступе для турникетов.
+
+Матрица хранит для каждого пользователя лучший уровень активного непросроченного
+пропуска, а для каждой зоны - требуемый уровень. Данные лежат в плоских массивах,
+индексированных по id, поэтому проверка пары (пользователь, зона) - это два
+обращения по индексу без запросов к БД. Сброс выполняется сигналами
+(см. signals.py), перестроение - лениво при следующей проверке.
+
+Снимок синхронизируется между воркерами через версию в общем кэше: сброс
+публикует новую версию, и воркер с устаревшей версией перестраивает матрицу
+при следующей проверке, поэтому отозванный в одном процессе пропуск сразу
+перестаёт открывать турникеты во всех. Если общий кэш недоступен, снимок
+живёт не дольше MATRIX_FALLBACK_MAX_AGE секунд.
+"""
+import threading
+import time
+from array import array
+from datetime import date
+
+from .cache import bump_version, get_version
+from .models import AccessZone, AirportPass, CustomUser
+
+MATRIX_VERSION_KEY = 'access_control:access_matrix:version'
+MATRIX_FALLBACK_MAX_AGE = 5  # секунды
+
+# Значения в массиве уровней пользователей
+UNKNOWN_USER = -1
+NO_PASS = 0
+
+# Значение в массиве уровней зон для отсутствующих id
+UNKNOWN_ZONE = -1
+
+
+class AccessDecision:
+    __slots__ = ('granted', 'user_level', 'required_level', 'display_level', 'zone_name', 'pass_id')
+
+    def __init__(self, granted, user_level, required_level, display_level, zone_name, pass_id):
+        self.granted = granted
+        self.user_level = user_level
+        self.required_level = required_level
+        self.display_level = display_level
+        self.zone_name = zone_name
+        self.pass_id = pass_id
+
+    @property
+    def has_pass(self):
+        return self.user_level != NO_PASS
+
+
+class AccessDecisionMatrix:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def invalidate(self):
+        """Сбрасывает снимок в этом процессе и публикует новую версию для остальных"""
+        self._snapshot = None
+        bump_version(MATRIX_VERSION_KEY)
+
+    def _build(self):
+        today = date.today()
+
+        user_ids = list(CustomUser.objects.values_list('id', flat=True))
+        size = max(user_ids, default=0) + 1
+        user_levels = array('b', [UNKNOWN_USER]) * size
+        user_expiry = array('l', [0]) * size
+        user_pass = array('q', [0]) * size
+        for user_id in user_ids:
+            user_levels[user_id] = NO_PASS
+
+        # Лучший активный пропуск каждого пользователя
+        passes = AirportPass.objects.filter(
+            is_active=True,
+            expiry_date__gte=today,
+        ).values_list('id', 'owner_id', 'access_level', 'expiry_date')
+        for pass_id, owner_id, level, expiry in passes:
+            if owner_id < size and level > user_levels[owner_id]:
+                user_levels[owner_id] = level
+                user_expiry[owner_id] = expiry.toordinal()
+                user_pass[owner_id] = pass_id
+
+        zones = list(AccessZone.objects.values_list('id', 'zone_type', 'required_access_level', 'name'))
+        zone_size = max((zone[0] for zone in zones), default=0) + 1
+        zone_levels = array('b', [UNKNOWN_ZONE]) * zone_size
+        zone_display = array('b', [0]) * zone_size
+        zone_names = {}
+        for zone_id, zone_type, display_level, name in zones:
+            zone_levels[zone_id] = AirportPass.required_level_for(zone_type)
+            zone_display[zone_id] = display_level
+            zone_names[zone_id] = name
+
+        return {
+            'built_on': today.toordinal(),
+            'built_at': time.monotonic(),
+            'user_levels': user_levels,
+            'user_expiry': user_expiry,
+            'user_pass': user_pass,
+            'zone_levels': zone_levels,
+            'zone_display': zone_display,
+            'zone_names': zone_names,
+        }
+
+    def _is_stale(self, snapshot, version):
+        if snapshot is None:
+            return True
+        # Перестраиваем раз в сутки, чтобы не учитывать истёкшие пропуски
+        if snapshot['built_on'] != date.today().toordinal():
+            return True
+        if version is None:
+            return time.monotonic() - snapshot['built_at'] > MATRIX_FALLBACK_MAX_AGE
+        return snapshot['version'] != version
+
+    def _get_snapshot(self):
+        # Версия читается до построения: изменение во время построения
+        # оставит снимок устаревшим, а не потеряется
+        version = get_version(MATRIX_VERSION_KEY)
+        snapshot = self._snapshot
+        if self._is_stale(snapshot, version):
+            with self._lock:
+                snapshot = self._snapshot
+                if self._is_stale(snapshot, version):
+                    snapshot = self._build()
+                    snapshot['version'] = version
+                    self._snapshot = snapshot
+        return snapshot
+
+    def check(self, user_id, zone_id):
+        """Возвращает AccessDecision или None, если пользователь или зона не найдены"""
+        snapshot = self._get_snapshot()
+        user_levels = snapshot['user_levels']
+        zone_levels = snapshot['zone_levels']
+
+        if not (0 <= user_id < len(user_levels)) or not (0 <= zone_id < len(zone_levels)):
+            return None
+        user_level = user_levels[user_id]
+        required_level = zone_levels[zone_id]
+        if user_level == UNKNOWN_USER or required_level == UNKNOWN_ZONE:
+            return None
+
+        if user_level != NO_PASS and snapshot['user_expiry'][user_id] < date.today().toordinal():
+            user_level = NO_PASS
+
+        return AccessDecision(
+            granted=user_level != NO_PASS and user_level >= required_level,
+            user_level=user_level,
+            required_level=required_level,
+            display_level=snapshot['zone_display'][zone_id],
+            zone_name=snapshot['zone_names'][zone_id],
+            pass_id=snapshot['user_pass'][user_id] if user_level != NO_PASS else None,
+        )
+
+
+access_matrix = AccessDecisionMatrix()
@@ -0,0 +1,89 @@
+"""Внутрипроцессная рассылка новых попыток доступа открытым дашбордам.
+
+Каждое SSE-подключение получает свою asyncio-очередь. Запись попыток
+(сигналы и пакетные пути, см. signals.py) после COMMIT раскладывает события по
+очередям через call_soon_threadsafe, поэтому подписчики не опрашивают БД.
+Рассылка работает в пределах одного процесса: дашборд видит попытки,
+записанные тем же воркером ASGI.
+"""
+import asyncio
+import threading
+
+# Сколько событий может накопиться у медленного клиента, дальше они отбрасываются
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+def attempt_event(attempt):
+    def label(field, get_label):
+        # Только уже загруженные объекты, без дополнительных запросов
+        if attempt._meta.get_field(field).is_cached(attempt):
+            related = getattr(attempt, field)
+            return get_label(related) if related is not None else None
+        return None
+
+    return {
+        'id': attempt.id,
+        'timestamp': attempt.timestamp.isoformat(),
+        'attempt_type': attempt.attempt_type,
+        'user_id': attempt.user_id,
+        'user': label('user', lambda user: user.get_username()),
+        'zone_id': attempt.zone_id,
+        'zone': label('zone', lambda zone: zone.name),
+        'pass_id': attempt.pass_instance_id,
+        'details': attempt.details,
+    }
+
+
+class Subscription:
+    def __init__(self, loop, attempt_types=None):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.attempt_types = attempt_types
+        self.dropped = 0
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class AttemptBroadcaster:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, attempt_types=None):
+        subscription = Subscription(asyncio.get_running_loop(), attempt_types)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, events):
+        """Можно вызывать из любого потока"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            for event in events:
+                if subscription.attempt_types and event['attempt_type'] not in subscription.attempt_types:
+                    continue
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.put, event)
+                except RuntimeError:
+                    # Цикл событий подписчика уже закрыт
+                    self.unsubscribe(subscription)
+                    break
+
+
+broadcaster = AttemptBroadcaster()
@@ -0,0 +1,322 @@
+"""Пакетная запись попыток доступа через локальный спул.
+
+Каждая попытка сначала дописывается строкой JSON в файл спула и в буфер в
+памяти, затем фоновый поток сбрасывает буфер в БД одним bulk_create - по
+достижении размера пакета или по таймеру. Файл пакета удаляется только после
+успешной записи (неудавшиеся пакеты повторяются при следующем сбросе), так
+что попытки переживают сбои БД и перезапуск процесса. Гарантия -
+"как минимум один раз": падение между COMMIT и удалением файла приведёт к
+повторной записи пакета.
+
+Пакет, который не удалось записать max_batch_attempts раз подряд,
+записывается по одной попытке; попытки, которые БД отвергает (например,
+пользователь или зона уже удалены), откладываются в DEAD_LETTER_DIR и не
+блокируют следующие пакеты. Если БД недоступна дольше, буфер в памяти не
+растёт больше max_buffered: накопленное остаётся только в файле пакета.
+
+У каждого процесса свой каталог в SPOOL_DIR, занятый блокировкой flock на всё
+время жизни процесса. При старте ингестор дозаписывает в БД файлы каталогов,
+блокировку которых удалось взять, - их процессы завершились; каталоги живых
+воркеров не трогаются.
+
+Турникеты пишут попытки через submit_attempts(); с
+ACCESS_ATTEMPT_INGEST['ENABLED'] = False попытки записываются сразу (тесты,
+разовые скрипты).
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import AccessAttempt
+from .signals import attempts_created
+
+logger = logging.getLogger('checkplace')
+
+WORKER_PREFIX = 'worker-'
+LOCK_FILE = 'lock'
+CURRENT_SEGMENT = 'current.jsonl'
+BATCH_PREFIX = 'batch-'
+DEAD_LETTER_DIR = 'dead-letter'
+
+
+def serialize_attempt(attempt):
+    return json.dumps({
+        'user_id': attempt.user_id,
+        'zone_id': attempt.zone_id,
+        'pass_instance_id': attempt.pass_instance_id,
+        'attempt_type': attempt.attempt_type,
+        'timestamp': attempt.timestamp.isoformat(),
+        'details': attempt.details,
+    }, ensure_ascii=False)
+
+
+def deserialize_attempt(line):
+    data = json.loads(line)
+    data['timestamp'] = parse_datetime(data['timestamp'])
+    return AccessAttempt(**data)
+
+
+def write_attempts(attempts, batch_size=1000):
+    with transaction.atomic():
+        AccessAttempt.objects.bulk_create(attempts, batch_size=batch_size)
+        attempts_created(attempts)
+
+
+def try_lock(path):
+    """Открывает и блокирует файл; None, если блокировку держит другой процесс"""
+    try:
+        lock = open(path, 'a')
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+class AttemptIngestor:
+    def __init__(self, spool_dir, batch_size=1000, flush_interval=1.0, fsync=False,
+                 max_batch_attempts=3, max_buffered=100000):
+        self.spool_dir = Path(spool_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_batch_attempts = max_batch_attempts
+        self.max_buffered = max_buffered
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buffer = []
+        self._segment = None
+        self._batch_failures = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.worker_dir = None
+        self._worker_lock = None
+
+    def start(self):
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        # Каталог блокируется до появления под именем worker-*, иначе
+        # стартующий рядом воркер мог бы счесть его брошенным
+        name = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        staging_dir = self.spool_dir / f'.{name}'
+        staging_dir.mkdir()
+        self._worker_lock = try_lock(staging_dir / LOCK_FILE)
+        self.worker_dir = self.spool_dir / f'{WORKER_PREFIX}{name}'
+        staging_dir.rename(self.worker_dir)
+        self.recover()
+        self._segment = open(self.worker_dir / CURRENT_SEGMENT, 'a', encoding='utf-8')
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='attempt-ingestor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+            # Всё записано - каталог больше не нужен
+            shutil.rmtree(self.worker_dir, ignore_errors=True)
+        finally:
+            # При ошибке каталог остаётся, а снятая блокировка позволит
+            # следующему процессу дозаписать его
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            if self._worker_lock is not None:
+                self._worker_lock.close()
+                self._worker_lock = None
+
+    def submit(self, attempt):
+        """Ставит несохранённую попытку в очередь на запись"""
+        self.submit_many([attempt])
+
+    def submit_many(self, attempts):
+        lines = ''.join(serialize_attempt(attempt) + '\n' for attempt in attempts)
+        with self._lock:
+            self._segment.write(lines)
+            self._segment.flush()
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+            self._buffer.extend(attempts)
+            full = len(self._buffer) >= self.batch_size
+            if len(self._buffer) >= self.max_buffered:
+                # Сброс не успевает: попытки остаются только в файле пакета
+                self._seal_segment()
+                self._buffer = []
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Сбрасывает накопленный буфер в БД, возвращает число записанных попыток"""
+        with self._flush_lock:
+            # Сначала пакеты, запись которых раньше не удалась; их ошибка не
+            # задерживает текущий буфер и пробрасывается после его записи
+            replay_error = None
+            try:
+                self._replay(sorted(self.worker_dir.glob(f'{BATCH_PREFIX}*.jsonl')))
+            except Exception as e:
+                replay_error = e
+
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                batch_path = self._seal_segment() if batch else None
+
+            if batch:
+                self._write_batch(batch, batch_path)
+            if replay_error is not None:
+                raise replay_error
+            return len(batch)
+
+    def _seal_segment(self):
+        """Текущий файл становится файлом пакета, новые попытки идут в новый"""
+        self._segment.close()
+        batch_path = self.worker_dir / f'{BATCH_PREFIX}{time.time_ns()}-{uuid.uuid4().hex[:8]}.jsonl'
+        os.replace(self.worker_dir / CURRENT_SEGMENT, batch_path)
+        self._segment = open(self.worker_dir / CURRENT_SEGMENT, 'a', encoding='utf-8')
+        return batch_path
+
+    def _write_batch(self, batch, path):
+        try:
+            write_attempts(batch, self.batch_size)
+        except Exception:
+            failures = self._batch_failures.get(path.name, 0) + 1
+            if failures < self.max_batch_attempts:
+                self._batch_failures[path.name] = failures
+                raise
+            self._write_one_by_one(batch, path)
+        self._batch_failures.pop(path.name, None)
+        path.unlink()
+
+    def _write_one_by_one(self, batch, path):
+        """Пишет пакет по одной попытке, отвергнутые БД откладывает в DEAD_LETTER_DIR"""
+        rejected = []
+        for attempt in batch:
+            try:
+                write_attempts([attempt])
+            except (IntegrityError, DataError) as e:
+                logger.error(f"Attempt rejected: batch={path.name}, error={e}")
+                rejected.append(attempt)
+        if rejected:
+            dead_letter_dir = self.spool_dir / DEAD_LETTER_DIR
+            dead_letter_dir.mkdir(exist_ok=True)
+            with open(dead_letter_dir / path.name, 'a', encoding='utf-8') as dead_letter:
+                dead_letter.write(''.join(serialize_attempt(attempt) + '\n' for attempt in rejected))
+
+    def recover(self):
+        """Дозаписывает в БД попытки из каталогов завершившихся процессов"""
+        recovered = 0
+        for worker_dir in sorted(self.spool_dir.glob(f'{WORKER_PREFIX}*')):
+            if worker_dir == self.worker_dir or not worker_dir.is_dir():
+                continue
+            lock = try_lock(worker_dir / LOCK_FILE)
+            if lock is None:
+                continue  # процесс жив или каталог уже разбирает другой воркер
+            try:
+                segments = sorted(worker_dir.glob(f'{BATCH_PREFIX}*.jsonl'))
+                if (worker_dir / CURRENT_SEGMENT).exists():
+                    segments.append(worker_dir / CURRENT_SEGMENT)
+                recovered += self._replay(segments)
+                shutil.rmtree(worker_dir, ignore_errors=True)
+            finally:
+                lock.close()
+
+        if recovered:
+            logger.info(f"Attempt spool recovered: attempts={recovered}")
+        return recovered
+
+    def _replay(self, segments):
+        replayed = 0
+        for path in segments:
+            with open(path, encoding='utf-8') as segment:
+                # Последняя строка могла быть записана не полностью
+                batch = [deserialize_attempt(line) for line in segment if line.endswith('\n')]
+            if batch:
+                self._write_batch(batch, path)
+            else:
+                path.unlink()
+            replayed += len(batch)
+        return replayed
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break  # остаток сбрасывает stop()
+            try:
+                self.flush()
+            except Exception as e:
+                # Файл пакета остаётся в каталоге, запись повторится при следующем сбросе
+                logger.error(f"Attempt spool flush failed: error={e}")
+            finally:
+                close_old_connections()
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def _forget_ingestor_after_fork():
+    # Поток и каталог родителя не переходят в дочерний процесс - у него будет свой
+    global _ingestor
+    _ingestor = None
+
+
+os.register_at_fork(after_in_child=_forget_ingestor_after_fork)
+
+
+def get_ingestor():
+    """Общий для процесса экземпляр, настроенный через ACCESS_ATTEMPT_INGEST"""
+    global _ingestor
+    if _ingestor is None:
+        with _ingestor_lock:
+            if _ingestor is None:
+                config = getattr(settings, 'ACCESS_ATTEMPT_INGEST', {})
+                ingestor = AttemptIngestor(
+                    spool_dir=config.get('SPOOL_DIR', Path(settings.BASE_DIR) / 'spool'),
+                    batch_size=config.get('BATCH_SIZE', 1000),
+                    flush_interval=config.get('FLUSH_INTERVAL', 1.0),
+                    fsync=config.get('FSYNC', False),
+                    max_batch_attempts=config.get('MAX_BATCH_ATTEMPTS', 3),
+                    max_buffered=config.get('MAX_BUFFERED', 100000),
+                )
+                ingestor.start()
+                atexit.register(_stop_at_exit, ingestor)
+                _ingestor = ingestor
+    return _ingestor
+
+
+def _stop_at_exit(ingestor):
+    try:
+        ingestor.stop()
+    except Exception as e:
+        # Несброшенные попытки остаются в спуле и будут записаны следующим процессом
+        logger.error(f"Attempt spool not flushed at exit: error={e}")
+
+
+def submit_attempts(attempts):
+    """Запись попыток с турникетов: через спул или, если он отключён, сразу в БД"""
+    if not attempts:
+        return
+    if not getattr(settings, 'ACCESS_ATTEMPT_INGEST', {}).get('ENABLED', True):
+        write_attempts(attempts)
+        return
+    get_ingestor().submit_many(attempts)
@@ -0,0 +1,98 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from access_control.decisions import access_matrix
+from access_control.models import AccessZone, AirportPass, CustomUser
+
+
+class RollbackBenchmark(Exception):
+    pass
+
+
+def legacy_check(user_id, zone_id):
+    """Прежняя логика check_access: три запроса к БД на каждую проверку"""
+    zone = AccessZone.objects.get(id=zone_id)
+    user = CustomUser.objects.get(id=user_id)
+    user_pass = user.airportpass_set.filter(is_active=True).first()
+    return bool(user_pass and user_pass.has_access_to(zone.zone_type))
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает проверку доступа через БД и через матрицу решений на тестовых данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--zones', type=int, default=500)
+        parser.add_argument('--checks', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Все тестовые данные откатываются по завершении замера
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise RollbackBenchmark
+        except RollbackBenchmark:
+            pass
+        access_matrix.invalidate()
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        zone_types = [choice[0] for choice in AccessZone.ZONE_TYPES]
+        today = date.today()
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench_user_{i}', role='STAFF', password='!')
+            for i in range(options['users'])
+        ])
+        zones = AccessZone.objects.bulk_create([
+            AccessZone(
+                name=f'Bench zone {i}',
+                zone_type=rng.choice(zone_types),
+                required_access_level=rng.randint(1, 4),
+                description='',
+            )
+            for i in range(options['zones'])
+        ])
+        AirportPass.objects.bulk_create([
+            AirportPass(
+                owner=user,
+                expiry_date=today + timedelta(days=rng.randint(-30, 365)),
+                access_zone=rng.choice(zone_types),
+                access_level=rng.randint(1, 4),
+                is_active=rng.random() < 0.9,
+            )
+            for user in users
+            if rng.random() < 0.8
+        ])
+        access_matrix.invalidate()
+
+        pairs = [(rng.choice(users).id, rng.choice(zones).id) for _ in range(options['checks'])]
+
+        started = time.perf_counter()
+        for user_id, zone_id in pairs:
+            legacy_check(user_id, zone_id)
+        legacy_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        access_matrix.check(*pairs[0])
+        build_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for user_id, zone_id in pairs:
+            access_matrix.check(user_id, zone_id)
+        matrix_elapsed = time.perf_counter() - started
+
+        checks = len(pairs)
+        self.stdout.write(f"Пользователей: {len(users)}, зон: {len(zones)}, проверок: {checks}")
+        self.stdout.write(
+            f"Через БД:     {legacy_elapsed:.3f} с, {legacy_elapsed / checks * 1e6:.1f} мкс/проверка"
+        )
+        self.stdout.write(f"Матрица:      построение {build_elapsed:.3f} с")
+        self.stdout.write(
+            f"Матрица:      {matrix_elapsed:.3f} с, {matrix_elapsed / checks * 1e6:.1f} мкс/проверка"
+        )
@@ -0,0 +1,109 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from access_control.models import AccessAttempt, AccessZone, CustomUser
+from access_control.rollups import rebuild_rollups
+
+
+class RollbackBenchmark(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет AccessAttempt синтетическими данными и сравнивает планы запросов '
+        'журнала доступа с индексами и без них (EXPLAIN ANALYZE). Индексы удаляются '
+        'внутри транзакции и восстанавливаются откатом - не запускайте на рабочей БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000)
+        parser.add_argument('--days', type=int, default=90, help='Период, по которому распределяются попытки')
+        parser.add_argument('--repeat', type=int, default=3, help='Число прогонов каждого запроса')
+        parser.add_argument('--keep', action='store_true', help='Оставить сгенерированные строки в БД')
+
+    def handle(self, *args, **options):
+        user_ids = list(CustomUser.objects.values_list('id', flat=True)[:1000])
+        zone_ids = list(AccessZone.objects.values_list('id', flat=True)[:1000])
+        if not user_ids or not zone_ids:
+            raise CommandError('Нужен хотя бы один пользователь и одна зона')
+
+        with transaction.atomic():
+            self.seed(options['rows'], options['days'], user_ids, zone_ids)
+            self.report('С индексами', options['repeat'])
+
+            # Индексы удаляются в точке сохранения и возвращаются её откатом
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        for index in AccessAttempt._meta.indexes:
+                            cursor.execute(f'DROP INDEX "{index.name}"')
+                    self.report('Без индексов', options['repeat'])
+                    raise RollbackBenchmark
+            except RollbackBenchmark:
+                pass
+
+            if options['keep']:
+                rebuild_rollups()
+            else:
+                transaction.set_rollback(True)
+
+    def seed(self, rows, days, user_ids, zone_ids):
+        self.stdout.write(f"Генерация {rows} попыток за {days} дн...")
+        # Время растёт вместе с номером строки, как при обычной дозаписи
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {AccessAttempt._meta.db_table}
+                    (user_id, zone_id, attempt_type, "timestamp", details)
+                SELECT
+                    (%s::bigint[])[1 + floor(random() * %s)::int],
+                    (%s::bigint[])[1 + floor(random() * %s)::int],
+                    (ARRAY['GRANTED', 'GRANTED', 'GRANTED', 'DENIED', 'ALERT'])[1 + floor(random() * 5)::int],
+                    %s - (%s - g) * (%s::interval / %s),
+                    'bench'
+                FROM generate_series(1, %s) AS g
+                """,
+                [
+                    user_ids, len(user_ids),
+                    zone_ids, len(zone_ids),
+                    timezone.now(), rows, timedelta(days=days), rows,
+                    rows,
+                ],
+            )
+            cursor.execute(f'ANALYZE {AccessAttempt._meta.db_table}')
+
+    def queries(self):
+        now = timezone.now()
+        day_ago = now - timedelta(hours=24)
+        return {
+            'журнал, все типы': AccessAttempt.objects.order_by('-timestamp', '-id')[:100],
+            'журнал, ALERT': AccessAttempt.objects.filter(attempt_type='ALERT').order_by('-timestamp', '-id')[:100],
+            'статистика за 24ч': AccessAttempt.objects.filter(
+                timestamp__gte=day_ago, attempt_type='DENIED'
+            ).values('id'),
+            'неполная минута': AccessAttempt.objects.filter(
+                timestamp__gte=day_ago, timestamp__lt=day_ago + timedelta(minutes=1)
+            ).values('attempt_type'),
+        }
+
+    def report(self, title, repeat):
+        self.stdout.write(title)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {AccessAttempt._meta.db_table}')
+        for name, queryset in self.queries().items():
+            timings = []
+            for _ in range(repeat):
+                plan = json.loads(queryset.explain(format='json', analyze=True))[0]
+                timings.append(plan['Execution Time'])
+            node = plan['Plan']
+            while node.get('Plans') and node['Node Type'] in ('Limit', 'Aggregate', 'Gather', 'Gather Merge'):
+                node = node['Plans'][0]
+            self.stdout.write(
+                f"  {name:<20} {min(timings):>10.2f} мс  ({node['Node Type']}"
+                f"{' ' + node['Index Name'] if 'Index Name' in node else ''})"
+            )
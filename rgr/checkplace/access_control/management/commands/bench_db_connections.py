@@ -0,0 +1,135 @@
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.contrib.auth.signals import user_logged_in
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client
+from django.urls import reverse
+
+from access_control.models import AccessAttempt, CustomUser
+
+# Запросы только читают журнал: замер не добавляет попыток и счётчиков
+ATTEMPT_TYPES = ['', 'GRANTED', 'DENIED', 'ALERT']
+PAGE_SIZES = [20, 50, 100]
+
+# Режимы для --compare: переменные окружения, с которыми перезапускается команда
+MODES = [
+    ('новое подключение на запрос', {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '0'}),
+    ('постоянные подключения', {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '60'}),
+    ('пул psycopg', {'DB_POOL': '1'}),
+]
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def describe_mode():
+    database = settings.DATABASES['default']
+    pool = database.get('OPTIONS', {}).get('pool')
+    if pool:
+        return f"пул psycopg ({pool.get('min_size')}..{pool.get('max_size')})"
+    return f"CONN_MAX_AGE={database['CONN_MAX_AGE']}"
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку GET access_logs_api при параллельных клиентах '
+        'в текущем режиме подключений к БД (--compare - во всех режимах). '
+        'Запросы только читают журнал; сессии клиентов удаляются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на клиента')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--compare', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            self.compare(options)
+            return
+
+        security = CustomUser.objects.filter(role='SECURITY').first()
+        if security is None or not AccessAttempt.objects.exists():
+            raise CommandError('Нужны пользователь SECURITY и попытки доступа (generate_access_attempts)')
+        connections.close_all()
+
+        url = reverse('access_logs_api')
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['clients'])
+
+        def client_loop(index):
+            rng = random.Random(options['seed'] + index)
+            client = Client(SERVER_NAME='localhost')
+            local = []
+            try:
+                client.force_login(security)
+                barrier.wait()
+                for _ in range(options['requests']):
+                    params = {'type': rng.choice(ATTEMPT_TYPES), 'limit': rng.choice(PAGE_SIZES)}
+                    started = time.perf_counter()
+                    # Тестовый клиент отключает close_old_connections на время запроса;
+                    # вызываем его сами, как обработчик запросов WSGI/ASGI
+                    close_old_connections()
+                    response = client.get(url, params)
+                    close_old_connections()
+                    local.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise RuntimeError(f'HTTP {response.status_code}')
+            except Exception as e:
+                errors.append(e)
+                barrier.abort()
+            finally:
+                client.logout()  # сессия замера не остаётся в django_session
+                connections.close_all()
+                with lock:
+                    latencies.extend(local)
+
+        threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(options['clients'])]
+        # Вход клиентов не обновляет last_login пользователя
+        user_logged_in.disconnect(update_last_login, dispatch_uid='update_last_login')
+        try:
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            user_logged_in.connect(update_last_login, dispatch_uid='update_last_login')
+
+        if errors:
+            raise CommandError(f'Ошибки клиентов: {errors[:3]}')
+
+        ordered = sorted(latencies)
+        self.stdout.write(
+            f"{describe_mode()}: клиентов {options['clients']}, запросов {len(ordered)}, "
+            f"{len(ordered) / elapsed:.0f} запр/с"
+        )
+        self.stdout.write(
+            f"  p50 {percentile(ordered, 0.5) * 1000:.2f} мс, "
+            f"p95 {percentile(ordered, 0.95) * 1000:.2f} мс, "
+            f"p99 {percentile(ordered, 0.99) * 1000:.2f} мс"
+        )
+
+    def compare(self, options):
+        command = [
+            sys.executable, sys.argv[0], 'bench_db_connections',
+            '--clients', str(options['clients']),
+            '--requests', str(options['requests']),
+            '--seed', str(options['seed']),
+        ]
+        for title, env in MODES:
+            self.stdout.write(f"== {title}")
+            self.stdout.flush()
+            subprocess.run(command, env={**os.environ, **env}, check=True)
@@ -0,0 +1,46 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from access_control.export import EXPORT_CHUNK_SIZE, export_queryset, iter_csv, write_parquet
+from access_control.models import AccessAttempt
+
+
+def parse_day(value):
+    day = parse_date(value)
+    if day is None:
+        raise CommandError(f'Неверная дата: {value} (ожидается ГГГГ-ММ-ДД)')
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class Command(BaseCommand):
+    help = 'Выгружает попытки доступа в CSV или Parquet через серверный курсор'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Путь к файлу выгрузки')
+        parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+        parser.add_argument('--type', choices=[choice[0] for choice in AccessAttempt.ATTEMPT_TYPES])
+        parser.add_argument('--start', help='Начальная дата включительно, ГГГГ-ММ-ДД')
+        parser.add_argument('--end', help='Конечная дата включительно, ГГГГ-ММ-ДД')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = parse_day(options['start']) if options['start'] else None
+        end = parse_day(options['end']) + timedelta(days=1) if options['end'] else None
+        queryset = export_queryset(options['type'], start, end)
+
+        if options['format'] == 'parquet':
+            try:
+                total = write_parquet(queryset, options['output'], options['chunk_size'])
+            except ImportError:
+                raise CommandError('Для выгрузки в Parquet установите pyarrow')
+        else:
+            total = -1  # строка заголовка
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                for line in iter_csv(queryset, options['chunk_size']):
+                    output.write(line)
+                    total += 1
+
+        self.stdout.write(f"Выгружено попыток: {total}")
@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from access_control.ingest import AttemptIngestor
+from access_control.models import AccessAttempt, AccessZone, AirportPass, CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный генератор попыток доступа через пакетную запись (спул + bulk_create)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--flush-interval', type=float, default=1.0)
+        parser.add_argument('--spool-dir', default=None)
+        parser.add_argument('--fsync', action='store_true')
+
+    def handle(self, *args, **options):
+        # Те же правила, что и в AccessAttempt.generate_test_attempt,
+        # но справочники загружаются один раз, а не на каждую попытку
+        users = list(CustomUser.objects.filter(role='STAFF', is_active=True))
+        zones = list(AccessZone.objects.all())
+        if not users or not zones:
+            raise CommandError('Нужны активные сотрудники (STAFF) и хотя бы одна зона')
+
+        passes = {}
+        for pass_instance in AirportPass.objects.filter(owner__in=users, is_active=True).order_by('access_level'):
+            if not pass_instance.is_expired:
+                passes[pass_instance.owner_id] = pass_instance
+
+        spool_dir = options['spool_dir']
+        if spool_dir is None:
+            spool_dir = settings.ACCESS_ATTEMPT_INGEST['SPOOL_DIR']
+
+        ingestor = AttemptIngestor(
+            spool_dir=spool_dir,
+            batch_size=options['batch_size'],
+            flush_interval=options['flush_interval'],
+            fsync=options['fsync'],
+        )
+        ingestor.start()
+
+        count = options['count']
+        started = time.perf_counter()
+        for _ in range(count):
+            user = random.choice(users)
+            attempt = AccessAttempt.build_test_attempt(user, random.choice(zones), passes.get(user.id))
+            ingestor.submit(attempt)
+        ingestor.stop()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Записано попыток: {count} за {elapsed:.2f} с ({count / elapsed:.0f} попыток/с)")
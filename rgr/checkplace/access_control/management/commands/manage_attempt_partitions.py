@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from access_control.partitions import drop_expired_partitions, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт месячные секции AccessAttempt заранее и применяет политику хранения: '
+        'старые секции выгружаются в сжатый CSV и удаляются. Запускать по расписанию (cron).'
+    )
+
+    def add_arguments(self, parser):
+        config = settings.ACCESS_ATTEMPT_PARTITIONS
+        parser.add_argument('--months-ahead', type=int, default=config['MONTHS_AHEAD'])
+        parser.add_argument(
+            '--retain-months', type=int, default=config['RETAIN_MONTHS'],
+            help='Сколько полных месяцев хранить в БД (0 - не удалять)',
+        )
+        parser.add_argument('--archive-dir', default=config['ARCHIVE_DIR'])
+        parser.add_argument('--no-archive', action='store_true', help='Удалять старые секции без выгрузки')
+
+    def handle(self, *args, **options):
+        for name in ensure_partitions(options['months_ahead']):
+            self.stdout.write(f"Создана секция {name}")
+
+        if options['retain_months'] > 0:
+            archive_dir = None if options['no_archive'] else options['archive_dir']
+            for name in drop_expired_partitions(options['retain_months'], archive_dir):
+                self.stdout.write(f"Удалена секция {name}")
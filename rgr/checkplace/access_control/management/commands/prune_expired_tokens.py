@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from access_control.blacklist import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие outstanding и blacklisted JWT пакетами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        pruned = prune_expired_tokens(batch_size=options['batch_size'])
+        self.stdout.write(f"Удалено токенов: {pruned}")
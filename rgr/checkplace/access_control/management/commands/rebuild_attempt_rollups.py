@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from access_control.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поминутные счётчики попыток доступа по таблице AccessAttempt'
+
+    def handle(self, *args, **options):
+        buckets = rebuild_rollups()
+        self.stdout.write(f"Счётчики пересчитаны: {buckets} строк")
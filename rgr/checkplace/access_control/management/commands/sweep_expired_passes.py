@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from access_control.tasks import sweep_expired_passes
+
+
+class Command(BaseCommand):
+    help = 'Деактивирует просроченные пропуска пакетными UPDATE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deactivated = sweep_expired_passes(batch_size=options['batch_size'])
+        self.stdout.write(f"Деактивировано пропусков: {deactivated}")
@@ -0,0 +1,174 @@
+"""Метрики производительности запросов в памяти процесса.
+
+PerformanceMiddleware для каждого запроса измеряет полное время, число и
+время SQL-запросов (через connection.execute_wrapper) и время рендеринга
+шаблонов (через бэкенд TimedDjangoTemplates) и складывает их в скользящие
+гистограммы по имени URL. Квантили p50/p95/p99 считаются по последним
+WINDOW_SIZE наблюдениям только при чтении метрик, поэтому на запрос
+приходится несколько вызовов perf_counter и одна короткая блокировка.
+
+Метрики отдаются в текстовом формате Prometheus (summary). Данные свои у
+каждого процесса, метка pid позволяет различать воркеры.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+WINDOW_SIZE = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+UNRESOLVED_VIEW = '<unresolved>'
+
+METRICS = {
+    'http_request_duration_seconds': 'Полное время обработки запроса',
+    'http_request_db_queries': 'Число SQL-запросов за запрос',
+    'http_request_db_duration_seconds': 'Время SQL-запросов за запрос',
+    'http_request_template_duration_seconds': 'Время рендеринга шаблонов за запрос',
+}
+
+
+class RollingHistogram:
+    __slots__ = ('samples', 'count', 'total')
+
+    def __init__(self, window=WINDOW_SIZE):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, quantiles=QUANTILES):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in quantiles}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in quantiles}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe_request(self, view, values):
+        """values - {имя метрики: значение} для одного запроса"""
+        with self._lock:
+            for metric, value in values.items():
+                histogram = self._histograms.get((metric, view))
+                if histogram is None:
+                    histogram = self._histograms[(metric, view)] = RollingHistogram()
+                histogram.observe(value)
+
+    def render(self):
+        with self._lock:
+            snapshot = [
+                (metric, view, histogram.quantiles(), histogram.total, histogram.count)
+                for (metric, view), histogram in sorted(self._histograms.items())
+            ]
+
+        pid = os.getpid()
+        lines = []
+        for metric, description in METRICS.items():
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} summary')
+            for name, view, quantiles, total, count in snapshot:
+                if name != metric:
+                    continue
+                labels = f'view="{view}",pid="{pid}"'
+                for quantile, value in quantiles.items():
+                    lines.append(f'{metric}{{{labels},quantile="{quantile}"}} {value:.6f}')
+                lines.append(f'{metric}_sum{{{labels}}} {total:.6f}')
+                lines.append(f'{metric}_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+_current_stats = ContextVar('request_stats', default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+class PerformanceMiddleware:
+    """Ставится первым в MIDDLEWARE, чтобы учитывать и остальные middleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(_timed_execute))
+                response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+
+        match = request.resolver_match
+        registry.observe_request(match.view_name if match else UNRESOLVED_VIEW, {
+            'http_request_duration_seconds': time.perf_counter() - start,
+            'http_request_db_queries': stats.queries,
+            'http_request_db_duration_seconds': stats.db_time,
+            'http_request_template_duration_seconds': stats.template_time,
+        })
+        return response
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current_stats.get()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, который учитывает время рендеринга в метриках запроса.
+
+    Засекается только рендеринг верхнего уровня; {% include %} и наследование
+    уже входят в его время.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
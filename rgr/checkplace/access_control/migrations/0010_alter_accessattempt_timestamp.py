@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0009_accessattempt'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accessattempt',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время попытки'),
+        ),
+    ]
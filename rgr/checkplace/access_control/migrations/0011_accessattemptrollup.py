@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0010_alter_accessattempt_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessAttemptRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='Минута')),
+                ('attempt_type', models.CharField(choices=[('GRANTED', 'Доступ разрешён'), ('DENIED', 'Доступ запрещён'), ('ALERT', 'Попытка доступа в запрещённую зону')], max_length=10, verbose_name='Тип попытки')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'attempt_type'), name='unique_attempt_rollup_bucket')],
+            },
+        ),
+        # Заполняем счётчики по уже записанным попыткам
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO access_control_accessattemptrollup (bucket, attempt_type, count)
+                SELECT date_trunc('minute', "timestamp"), attempt_type, COUNT(*)
+                FROM access_control_accessattempt
+                GROUP BY 1, 2
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
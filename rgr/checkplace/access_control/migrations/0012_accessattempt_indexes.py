@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:39
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся без блокировки записи в таблицу попыток
+    atomic = False
+
+    dependencies = [
+        ('access_control', '0011_accessattemptrollup'),
+    ]
+
+    operations = [
+        # id в конце - порядок для постраничного вывода журнала по ключу (timestamp, id)
+        AddIndexConcurrently(
+            model_name='accessattempt',
+            index=models.Index(fields=['attempt_type', '-timestamp', '-id'], name='attempt_type_ts_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accessattempt',
+            index=models.Index(fields=['-timestamp', '-id'], name='attempt_ts_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accessattempt',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['timestamp'], name='attempt_ts_brin'),
+        ),
+    ]
@@ -0,0 +1,130 @@
+from django.db import migrations
+
+# Таблица попыток переводится на декларативное секционирование по месяцам
+# (PARTITION BY RANGE ("timestamp")). Первичный ключ секционированной таблицы
+# обязан включать ключ секционирования, поэтому он становится (id, timestamp);
+# для Django первичным ключом остаётся id, значения по-прежнему выдаёт одна
+# последовательность. Секции на будущее создаёт команда manage_attempt_partitions.
+
+INDEXES_SQL = """
+CREATE INDEX "access_control_accessattempt_pass_instance_id_7acce262"
+    ON access_control_accessattempt (pass_instance_id);
+CREATE INDEX "access_control_accessattempt_user_id_eef4a51b"
+    ON access_control_accessattempt (user_id);
+CREATE INDEX "access_control_accessattempt_zone_id_9bfdf082"
+    ON access_control_accessattempt (zone_id);
+CREATE INDEX "attempt_type_ts_id_idx"
+    ON access_control_accessattempt (attempt_type, "timestamp" DESC, id DESC);
+CREATE INDEX "attempt_ts_id_idx"
+    ON access_control_accessattempt ("timestamp" DESC, id DESC);
+CREATE INDEX "attempt_ts_brin"
+    ON access_control_accessattempt USING brin ("timestamp");
+
+ALTER TABLE access_control_accessattempt
+    ADD CONSTRAINT "access_control_acces_pass_instance_id_7acce262_fk_access_co"
+    FOREIGN KEY (pass_instance_id) REFERENCES access_control_airportpass (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE access_control_accessattempt
+    ADD CONSTRAINT "access_control_acces_user_id_eef4a51b_fk_access_co"
+    FOREIGN KEY (user_id) REFERENCES access_control_customuser (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE access_control_accessattempt
+    ADD CONSTRAINT "access_control_acces_zone_id_9bfdf082_fk_access_co"
+    FOREIGN KEY (zone_id) REFERENCES access_control_accesszone (id) DEFERRABLE INITIALLY DEFERRED;
+"""
+
+COLUMNS = 'id, attempt_type, "timestamp", details, pass_instance_id, user_id, zone_id'
+
+PARTITION_SQL = f"""
+CREATE SEQUENCE access_control_accessattempt_part_id_seq;
+SELECT setval(
+    'access_control_accessattempt_part_id_seq',
+    COALESCE((SELECT MAX(id) FROM access_control_accessattempt), 0) + 1,
+    false
+);
+
+CREATE TABLE access_control_accessattempt_part (
+    id bigint NOT NULL DEFAULT nextval('access_control_accessattempt_part_id_seq'),
+    attempt_type varchar(10) NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    details text NOT NULL,
+    pass_instance_id bigint NULL,
+    user_id bigint NOT NULL,
+    zone_id bigint NOT NULL
+) PARTITION BY RANGE ("timestamp");
+
+-- Страховка для строк вне созданных секций; в норме остаётся пустой
+CREATE TABLE access_control_accessattempt_default
+    PARTITION OF access_control_accessattempt_part DEFAULT;
+
+-- Месячные секции от самой ранней попытки до двух месяцев вперёд
+DO $$
+DECLARE
+    month_start date := date_trunc('month', COALESCE(
+        (SELECT MIN("timestamp") FROM access_control_accessattempt), now()
+    ) AT TIME ZONE 'UTC');
+    last_month date := date_trunc('month', now() AT TIME ZONE 'UTC') + interval '2 months';
+BEGIN
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF access_control_accessattempt_part '
+            'FOR VALUES FROM (%L) TO (%L)',
+            'access_control_accessattempt_p' || to_char(month_start, 'YYYY_MM'),
+            month_start::timestamp AT TIME ZONE 'UTC',
+            (month_start + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+        );
+        month_start := month_start + interval '1 month';
+    END LOOP;
+END
+$$;
+
+INSERT INTO access_control_accessattempt_part ({COLUMNS})
+SELECT {COLUMNS} FROM access_control_accessattempt;
+
+DROP TABLE access_control_accessattempt;
+ALTER TABLE access_control_accessattempt_part RENAME TO access_control_accessattempt;
+ALTER SEQUENCE access_control_accessattempt_part_id_seq RENAME TO access_control_accessattempt_id_seq;
+ALTER SEQUENCE access_control_accessattempt_id_seq OWNED BY access_control_accessattempt.id;
+ALTER TABLE access_control_accessattempt
+    ALTER COLUMN id SET DEFAULT nextval('access_control_accessattempt_id_seq');
+ALTER TABLE access_control_accessattempt
+    ADD CONSTRAINT access_control_accessattempt_pkey PRIMARY KEY (id, "timestamp");
+{INDEXES_SQL}
+"""
+
+UNPARTITION_SQL = f"""
+CREATE TABLE access_control_accessattempt_plain (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+    attempt_type varchar(10) NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    details text NOT NULL,
+    pass_instance_id bigint NULL,
+    user_id bigint NOT NULL,
+    zone_id bigint NOT NULL
+);
+
+INSERT INTO access_control_accessattempt_plain ({COLUMNS})
+SELECT {COLUMNS} FROM access_control_accessattempt;
+
+SELECT setval(
+    pg_get_serial_sequence('access_control_accessattempt_plain', 'id'),
+    COALESCE((SELECT MAX(id) FROM access_control_accessattempt_plain), 0) + 1,
+    false
+);
+
+DROP TABLE access_control_accessattempt;
+ALTER TABLE access_control_accessattempt_plain RENAME TO access_control_accessattempt;
+ALTER SEQUENCE access_control_accessattempt_plain_id_seq RENAME TO access_control_accessattempt_id_seq;
+ALTER TABLE access_control_accessattempt
+    ADD CONSTRAINT access_control_accessattempt_pkey PRIMARY KEY (id);
+{INDEXES_SQL}
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0012_accessattempt_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=PARTITION_SQL, reverse_sql=UNPARTITION_SQL),
+    ]
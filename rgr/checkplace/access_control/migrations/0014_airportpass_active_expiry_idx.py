@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:46
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('access_control', '0013_partition_accessattempt'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='airportpass',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['expiry_date'], name='active_pass_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:40
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_control', '0014_airportpass_active_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='airportpass',
+            name='issue_date',
+            field=models.DateField(default=datetime.date.today, editable=False),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.indexes import BrinIndex
+from django.db import models, transaction
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 from datetime import date, timedelta
@@ -29,13 +30,32 @@ class AirportPass(models.Model):
         (3, 'Высокий (Зона безопасности)'),
         (4, 'Полный (Все зоны)'),
     ]
+
+    # Минимальный уровень пропуска для типа зоны; неизвестные зоны требуют полного доступа
+    ZONE_LEVELS = {
+        'TERMINAL': 1,
+        'AIRFIELD': 2,
+        'SECURE': 3,
+    }
+    FULL_ACCESS_LEVEL = 4
     
     owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    issue_date = models.DateField(auto_now_add=True)
+    # Не auto_now_add: при одобрении заявки выдача датируется её start_date
+    issue_date = models.DateField(default=date.today, editable=False)
     expiry_date = models.DateField()
     access_zone = models.CharField(max_length=10, choices=ZONE_CHOICES)
     access_level = models.IntegerField(choices=ACCESS_LEVELS, default=1)
     is_active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            # Поиск просроченных среди активных: индекс покрывает только активные пропуски
+            models.Index(
+                fields=['expiry_date'],
+                condition=models.Q(is_active=True),
+                name='active_pass_expiry_idx',
+            ),
+        ]
     
     @property
     def is_expired(self):
@@ -44,14 +64,44 @@ class AirportPass(models.Model):
     def __str__(self):
         return f"Пропуск #{self.id} ({self.get_access_zone_display()})"
         
+    @classmethod
+    def required_level_for(cls, zone):
+        return cls.ZONE_LEVELS.get(zone, cls.FULL_ACCESS_LEVEL)
+
     def has_access_to(self, zone):
-        zone_levels = {
-            'TERMINAL': 1,
-            'AIRFIELD': 2,
-            'SECURE': 3
-        }
-        required_level = zone_levels.get(zone, 4)
-        return self.access_level >= required_level
+        return self.access_level >= self.required_level_for(zone)
+
+    def check_access(self, zone):
+        return self.has_access_to(zone.zone_type)
+
+    @classmethod
+    def deactivate_expired(cls, batch_size=1000, today=None):
+        """Снимает is_active с просроченных пропусков пачками, возвращает их число.
+
+        Работает через update(), сигналы save() не отправляются.
+        """
+        today = today or timezone.now().date()
+        total = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    cls.objects.filter(is_active=True, expiry_date__lt=today)
+                    .order_by('expiry_date')
+                    .values_list('id', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                total += cls.objects.filter(id__in=ids, is_active=True).update(is_active=False)
+        return total
+
+    @classmethod
+    def get_active_pass_for_user(cls, user):
+        """Лучший активный непросроченный пропуск пользователя"""
+        return cls.objects.filter(
+            owner=user,
+            is_active=True,
+            expiry_date__gte=timezone.now().date()
+        ).order_by('-access_level').first()
     
 class PassRequest(models.Model):
     STATUS_CHOICES = [
@@ -82,6 +132,58 @@ class PassRequest(models.Model):
     def __str__(self):
         return f"Заявка #{self.id} ({self.user.get_full_name()})"
 
+    @classmethod
+    def bulk_review(cls, requests, action, reason=''):
+        """Одобряет (action='approve') или отклоняет ('reject') заявки одной транзакцией.
+
+        requests - QuerySet заявок; обрабатываются только ожидающие рассмотрения.
+        Возвращает (список обработанных заявок, {id заявки: причина отказа в обработке}).
+        Сигналы save() при этом не отправляются.
+        """
+        if action not in ('approve', 'reject'):
+            raise ValueError(f"Unknown review action: {action}")
+
+        today = timezone.now().date()
+        failures = {}
+        reviewed = []
+
+        with transaction.atomic():
+            pending = requests.filter(status='PENDING').select_related('user').select_for_update(of=('self',))
+            for pass_request in pending:
+                if action == 'approve':
+                    if not pass_request.user.is_active:
+                        failures[pass_request.id] = 'Учётная запись сотрудника отключена'
+                        continue
+                    if pass_request.end_date < pass_request.start_date:
+                        failures[pass_request.id] = 'Дата окончания раньше даты начала'
+                        continue
+                    if pass_request.end_date < today:
+                        failures[pass_request.id] = 'Срок действия заявки уже истёк'
+                        continue
+                    pass_request.status = 'APPROVED'
+                else:
+                    pass_request.status = 'REJECTED'
+                    pass_request.rejection_reason = reason
+                reviewed.append(pass_request)
+
+            if action == 'approve':
+                AirportPass.objects.bulk_create([
+                    AirportPass(
+                        owner_id=pass_request.user_id,
+                        access_zone=pass_request.access_zone,
+                        issue_date=pass_request.start_date,
+                        expiry_date=pass_request.end_date,
+                        is_active=True
+                    )
+                    for pass_request in reviewed
+                ], batch_size=1000)
+            # Статус у всех обработанных заявок один, поэтому вместо bulk_update
+            # (CASE по каждой строке) достаточно одного UPDATE ... WHERE id IN (...)
+            updates = {'status': 'APPROVED'} if action == 'approve' else {'status': 'REJECTED', 'rejection_reason': reason}
+            cls.objects.filter(id__in=[pass_request.id for pass_request in reviewed]).update(**updates)
+
+        return reviewed, failures
+
 class AccessZone(models.Model):
     ZONE_TYPES = [
         ('TERMINAL', 'Терминал'),
@@ -99,6 +201,10 @@ class AccessZone(models.Model):
 
     def __str__(self):
         return f"{self.name} (Уровень {self.required_access_level})"
+
+    @classmethod
+    def get_random_zone(cls):
+        return cls.objects.order_by('?').first()
     
 class AccessAttempt(models.Model):
     ATTEMPT_TYPES = [
@@ -129,8 +235,9 @@ class AccessAttempt(models.Model):
         choices=ATTEMPT_TYPES,
         verbose_name='Тип попытки'
     )
+    # Не auto_now_add: при пакетной записи из спула сохраняется время события
     timestamp = models.DateTimeField(
-        auto_now_add=True,
+        default=timezone.now,
         verbose_name='Время попытки'
     )
     details = models.TextField(
@@ -138,15 +245,35 @@ class AccessAttempt(models.Model):
         verbose_name='Дополнительная информация'
     )
 
+    class Meta:
+        indexes = [
+            # Журнал с фильтром по типу; id - для курсорной пагинации по (timestamp, id)
+            models.Index(fields=['attempt_type', '-timestamp', '-id'], name='attempt_type_ts_id_idx'),
+            # Журнал без фильтра и выборки по диапазону времени
+            models.Index(fields=['-timestamp', '-id'], name='attempt_ts_id_idx'),
+            # Компактный индекс для диапазонных сканирований по таблице, в которую только дописывают
+            BrinIndex(fields=['timestamp'], name='attempt_ts_brin'),
+        ]
+
     def __str__(self):
         return f"Попытка {self.user} в {self.zone} ({self.get_attempt_type_display()})"
     
+    @staticmethod
+    def classify(access_level, zone):
+        """Определяет тип попытки по уровню пропуска (None - нет пропуска) и зоне"""
+        return AccessAttempt.classify_levels(access_level, AirportPass.required_level_for(zone.zone_type))
+
+    @staticmethod
+    def classify_levels(access_level, required_level):
+        if access_level is None:
+            return 'ALERT', "Нет активного пропуска"
+        if access_level >= required_level:
+            return 'GRANTED', "Доступ разрешен"
+        return 'DENIED', f"Недостаточный уровень ({access_level}<{required_level})"
+
     @classmethod
-    def generate_test_attempt(cls):
-        """Генерирует и сохраняет тестовую попытку доступа"""
-        user = cls.objects.filter(role='STAFF', is_active=True).order_by('?').first()
-        zone = AccessZone.get_random_zone()
-        
+    def build_test_attempt(cls, user, zone, pass_instance):
+        """Собирает тестовую попытку доступа без сохранения в БД"""
         attempt = cls(
             user=user,
             zone=zone,
@@ -154,8 +281,6 @@ class AccessAttempt(models.Model):
         )
         
         # Проверяем есть ли у пользователя активный пропуск
-        pass_instance = AirportPass.get_active_pass_for_user(user)
-        
         if pass_instance:
             attempt.pass_instance = pass_instance
             if pass_instance.check_access(zone):
@@ -168,5 +293,36 @@ class AccessAttempt(models.Model):
             attempt.attempt_type = 'ALERT'
             attempt.details = "Автотест: нет активного пропуска"
         
-        attempt.save()
-        return attempt
\ No newline at end of file
+        return attempt
+
+    @classmethod
+    def generate_test_attempt(cls):
+        """Генерирует тестовую попытку доступа и отправляет её на пакетную запись"""
+        from .ingest import submit_attempts
+
+        user = CustomUser.objects.filter(role='STAFF', is_active=True).order_by('?').first()
+        zone = AccessZone.get_random_zone()
+        pass_instance = AirportPass.get_active_pass_for_user(user)
+
+        attempt = cls.build_test_attempt(user, zone, pass_instance)
+        submit_attempts([attempt])
+        return attempt
+
+
+class AccessAttemptRollup(models.Model):
+    """Число попыток доступа каждого типа за минуту (поддерживается access_control.rollups)"""
+    bucket = models.DateTimeField(verbose_name='Минута')
+    attempt_type = models.CharField(
+        max_length=10,
+        choices=AccessAttempt.ATTEMPT_TYPES,
+        verbose_name='Тип попытки'
+    )
+    count = models.IntegerField(default=0, verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'attempt_type'], name='unique_attempt_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket:%Y-%m-%d %H:%M} {self.attempt_type}: {self.count}"
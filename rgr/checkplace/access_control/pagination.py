@@ -0,0 +1,51 @@
+"""Курсорная (keyset) пагинация журнала попыток доступа.
+
+Страницы упорядочены по (timestamp, id) по убыванию, курсор хранит ключ
+последней записи страницы. Следующая страница - это диапазон по индексу,
+начинающийся сразу после курсора, поэтому глубокие страницы так же дёшевы,
+как первая (в отличие от OFFSET).
+"""
+import base64
+
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(attempt):
+    raw = f"{attempt.timestamp.isoformat()}|{attempt.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, attempt_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        timestamp = parse_datetime(timestamp)
+        attempt_id = int(attempt_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if timestamp is None:
+        raise InvalidCursor(cursor)
+    return timestamp, attempt_id
+
+
+def paginate_attempts(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Возвращает (записи страницы, курсор следующей страницы или None)"""
+    queryset = queryset.order_by('-timestamp', '-id')
+    if cursor:
+        timestamp, attempt_id = decode_cursor(cursor)
+        # (timestamp, id) < (курсор): диапазон по индексу плюс отсев строк с тем же временем
+        queryset = queryset.filter(timestamp__lte=timestamp).exclude(timestamp=timestamp, id__gte=attempt_id)
+
+    # Одна лишняя запись показывает, есть ли следующая страница
+    items = list(queryset[:page_size + 1])
+    if len(items) > page_size:
+        items = items[:page_size]
+        return items, encode_cursor(items[-1])
+    return items, None
@@ -0,0 +1,176 @@
+"""Обслуживание месячных секций таблицы попыток доступа.
+
+Секции называются access_control_accessattempt_pYYYY_MM и покрывают
+календарный месяц по UTC. Новые секции создаются заранее, старые по политике
+хранения выгружаются в сжатый CSV, отсоединяются (DETACH) и удаляются целиком -
+без DELETE по строкам и без последующего раздувания таблицы.
+
+Долгие операции не держат блокировок родительской таблицы: выгрузка COPY идёт
+из самой секции до DETACH (в истёкшие месяцы турникеты уже не пишут), а
+DETACH и DROP выполняются короткой транзакцией с lock_timeout. DETACH
+CONCURRENTLY не подходит: у таблицы есть секция по умолчанию.
+"""
+import gzip
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from .models import AccessAttempt, AccessAttemptRollup
+
+logger = logging.getLogger('checkplace')
+
+PARENT_TABLE = AccessAttempt._meta.db_table
+PARTITION_PREFIX = f'{PARENT_TABLE}_p'
+PARTITION_NAME_RE = re.compile(rf'^{PARTITION_PREFIX}(\d{{4}})_(\d{{2}})$')
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+COLUMNS = 'id, attempt_type, "timestamp", details, pass_instance_id, user_id, zone_id'
+
+# Сколько DETACH ждёт блокировку родительской таблицы; очередь за ним
+# останавливает запись попыток, поэтому лучше отступить до следующего запуска
+DETACH_LOCK_TIMEOUT = '5s'
+
+
+def month_start(year, month):
+    return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(moment, months):
+    index = moment.year * 12 + moment.month - 1 + months
+    return month_start(index // 12, index % 12 + 1)
+
+
+def partition_name(moment):
+    return f'{PARTITION_PREFIX}{moment:%Y_%m}'
+
+
+def list_partitions():
+    """Месячные секции: {начало месяца: имя таблицы}"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [PARENT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions[month_start(int(match.group(1)), int(match.group(2)))] = name
+    return partitions
+
+
+def ensure_partitions(months_ahead, now=None):
+    """Создаёт недостающие секции с текущего месяца на months_ahead вперёд"""
+    now = now or datetime.now(dt_timezone.utc)
+    current = month_start(now.year, now.month)
+    existing = list_partitions()
+    created = []
+
+    for offset in range(months_ahead + 1):
+        start = add_months(current, offset)
+        if start in existing:
+            continue
+        name = partition_name(start)
+        moved = create_partition(name, start, add_months(start, 1))
+        created.append(name)
+        logger.info(f"Attempt partition created: {name}, moved_from_default={moved}")
+    return created
+
+
+def create_partition(name, start, end):
+    """Создаёт секцию [start, end), забирая попавшие в этот период строки из
+    секции по умолчанию (иначе PostgreSQL откажется создавать секцию).
+    Возвращает число перенесённых строк."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s)',
+            [start, end],
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f'CREATE TABLE "{name}" PARTITION OF "{PARENT_TABLE}" FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+            return 0
+
+        # Новые строки периода не должны попасть в секцию по умолчанию до ATTACH
+        cursor.execute(f'LOCK TABLE "{DEFAULT_PARTITION}" IN SHARE ROW EXCLUSIVE MODE')
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{PARENT_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM "{DEFAULT_PARTITION}"
+                WHERE "timestamp" >= %s AND "timestamp" < %s
+                RETURNING {COLUMNS}
+            )
+            INSERT INTO "{name}" ({COLUMNS}) SELECT {COLUMNS} FROM moved
+            """,
+            [start, end],
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f'ALTER TABLE "{PARENT_TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+    return moved
+
+
+def archive_partition(name, archive_dir):
+    """Выгружает секцию в сжатый CSV, возвращает путь к файлу"""
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f'{name}.csv.gz'
+    sql = f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER true)'
+
+    with connection.cursor() as cursor, gzip.open(path, 'wb') as archive:
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):
+            # psycopg2
+            raw_cursor.copy_expert(sql, archive)
+        else:
+            # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                for data in copy:
+                    archive.write(data)
+    return path
+
+
+def drop_expired_partitions(retain_months, archive_dir=None, now=None):
+    """Отсоединяет и удаляет секции старше retain_months месяцев.
+
+    Если задан archive_dir, секция предварительно выгружается в сжатый CSV -
+    до DETACH и вне транзакции, чтобы долгий COPY не блокировал запись попыток.
+    Вместе с секциями удаляются поминутные счётчики за тот же период.
+    """
+    now = now or datetime.now(dt_timezone.utc)
+    cutoff = add_months(month_start(now.year, now.month), -retain_months)
+    dropped = []
+
+    for start, name in sorted(list_partitions().items()):
+        if add_months(start, 1) > cutoff:
+            continue
+        if archive_dir is not None:
+            path = archive_partition(name, archive_dir)
+            logger.info(f"Attempt partition archived: {name} -> {path}")
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+                cursor.execute(f'ALTER TABLE "{PARENT_TABLE}" DETACH PARTITION "{name}"')
+                cursor.execute(f'DROP TABLE "{name}"')
+            AccessAttemptRollup.objects.filter(
+                bucket__gte=start,
+                bucket__lt=add_months(start, 1),
+            ).delete()
+        dropped.append(name)
+        logger.info(f"Attempt partition dropped: {name}")
+    return dropped
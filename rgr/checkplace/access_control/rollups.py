@@ -0,0 +1,111 @@
+"""Поминутные счётчики попыток доступа для статистики журнала.
+
+Счётчики обновляются при каждой записи попыток (см. signals.py), поэтому
+статистика за окно - это сумма по нескольким тысячам поминутных строк плюс
+точный подсчёт "хвоста" до первой полной минуты. Результат совпадает с
+COUNT(*) по AccessAttempt. Попытки считаются неизменяемыми: смена времени или
+типа у существующей записи и удаление отдельных попыток счётчики не
+пересчитывают (для этого есть команда rebuild_attempt_rollups). Попытки
+удаляемых пользователя или зоны вычитаются одним агрегирующим UPDATE
+(uncount_attempts), а сброс партиций (partitions.py) счётчики не трогает.
+"""
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMinute
+
+from .models import AccessAttempt, AccessAttemptRollup
+
+
+def bucket_for(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+
+
+def record_attempts(attempts):
+    """Добавляет попытки в поминутные счётчики"""
+    deltas = Counter()
+    for attempt in attempts:
+        deltas[(bucket_for(attempt.timestamp), attempt.attempt_type)] += 1
+    if not deltas:
+        return
+
+    table = AccessAttemptRollup._meta.db_table
+    with connection.cursor() as cursor:
+        # Строки счётчиков блокируются в порядке ключей: параллельные пакеты
+        # с общими минутами ждут друг друга, а не взаимоблокируются
+        cursor.executemany(
+            f"""
+            INSERT INTO {table} (bucket, attempt_type, count)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (bucket, attempt_type)
+            DO UPDATE SET count = {table}.count + EXCLUDED.count
+            """,
+            [(bucket, attempt_type, delta) for (bucket, attempt_type), delta in sorted(deltas.items())],
+        )
+
+
+def uncount_attempts(queryset):
+    """Вычитает попытки queryset из счётчиков одним UPDATE с GROUP BY по минутам.
+
+    Вызывается до удаления (pre_delete пользователя или зоны): получатель
+    post_delete на AccessAttempt отключил бы быстрое каскадное удаление, и
+    Django загружал бы каждую попытку.
+    """
+    totals = queryset.annotate(
+        bucket=TruncMinute('timestamp', tzinfo=dt_timezone.utc),
+    ).values('bucket', 'attempt_type').annotate(total=Count('id')).order_by()
+    sql, params = totals.query.sql_with_params()
+
+    table = AccessAttemptRollup._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS r
+            SET count = r.count - d.total
+            FROM ({sql}) AS d
+            WHERE r.bucket = d.bucket AND r.attempt_type = d.attempt_type
+            """,
+            params,
+        )
+
+
+def attempt_stats(start_time):
+    """Число попыток каждого типа начиная с start_time: {'GRANTED': n, ...}"""
+    first_bucket = bucket_for(start_time)
+    if first_bucket < start_time:
+        first_bucket += timedelta(minutes=1)
+
+    stats = Counter()
+    # Неполная минута в начале окна считается по самим попыткам
+    head = AccessAttempt.objects.filter(
+        timestamp__gte=start_time,
+        timestamp__lt=first_bucket,
+    ).values('attempt_type').annotate(total=Count('id'))
+    for row in head:
+        stats[row['attempt_type']] += row['total']
+
+    buckets = AccessAttemptRollup.objects.filter(
+        bucket__gte=first_bucket,
+    ).values('attempt_type').annotate(total=Sum('count'))
+    for row in buckets:
+        stats[row['attempt_type']] += row['total']
+
+    return stats
+
+
+def rebuild_rollups():
+    """Пересчитывает все счётчики по таблице попыток"""
+    with transaction.atomic():
+        AccessAttemptRollup.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {AccessAttemptRollup._meta.db_table} (bucket, attempt_type, count)
+                SELECT date_trunc('minute', "timestamp"), attempt_type, COUNT(*)
+                FROM {AccessAttempt._meta.db_table}
+                GROUP BY 1, 2
+                """
+            )
+            return cursor.rowcount
@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .blacklist import token_blacklisted
+
+from .dashboards import invalidate_dashboards
+from .decisions import access_matrix
+from .events import attempt_event, broadcaster
+from .models import AccessAttempt, AccessZone, AirportPass, CustomUser, PassRequest
+from .rollups import record_attempts, uncount_attempts
+
+
+def publish_attempts(attempts):
+    if not broadcaster.subscriber_count:
+        return
+    events = [attempt_event(attempt) for attempt in attempts]
+    transaction.on_commit(lambda: broadcaster.publish(events))
+
+
+def passes_changed():
+    """Вызывается после пакетных изменений пропусков и заявок (bulk_create/bulk_update)"""
+    transaction.on_commit(access_matrix.invalidate)
+    invalidate_dashboards()
+
+
+def attempts_created(attempts):
+    """Вызывается для попыток, записанных в обход save() (bulk_create)"""
+    record_attempts(attempts)
+    publish_attempts(attempts)
+
+
+@receiver([post_save, post_delete], sender=AirportPass)
+@receiver([post_save, post_delete], sender=AccessZone)
+def invalidate_access_matrix(sender, **kwargs):
+    # После COMMIT: иначе параллельная проверка может перестроить матрицу по старым данным
+    transaction.on_commit(access_matrix.invalidate)
+
+
+@receiver([post_save, post_delete], sender=AirportPass)
+@receiver([post_save, post_delete], sender=PassRequest)
+def invalidate_home_dashboards(sender, **kwargs):
+    invalidate_dashboards()
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_access_matrix_on_new_user(sender, created, **kwargs):
+    # Матрице важен только состав пользователей, а не, например, last_login
+    if created:
+        transaction.on_commit(access_matrix.invalidate)
+
+
+@receiver(post_delete, sender=CustomUser)
+def invalidate_access_matrix_on_user_delete(sender, **kwargs):
+    transaction.on_commit(access_matrix.invalidate)
+
+
+@receiver(post_save, sender=AccessAttempt)
+def count_saved_attempt(sender, instance, created, **kwargs):
+    if created:
+        record_attempts([instance])
+        publish_attempts([instance])
+
+
+@receiver(pre_delete, sender=CustomUser)
+def uncount_user_attempts(sender, instance, **kwargs):
+    # Попытки удалятся каскадом (быстрым, без загрузки строк) - счётчики вычитаются заранее
+    uncount_attempts(AccessAttempt.objects.filter(user=instance))
+
+
+@receiver(pre_delete, sender=AccessZone)
+def uncount_zone_attempts(sender, instance, **kwargs):
+    uncount_attempts(AccessAttempt.objects.filter(zone=instance))
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def sync_blacklist_filter(sender, instance, created, **kwargs):
+    if created:
+        token_blacklisted(instance.token.jti)
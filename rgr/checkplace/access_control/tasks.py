@@ -0,0 +1,133 @@
+"""Фоновые периодические задачи внутри веб-процесса.
+
+Задачи запускаются при первом запросе (сигнал request_started), поэтому
+management-команды вроде migrate их не стартуют. Для выполнения по cron
+у каждой задачи есть management-команда.
+
+Потоки задач есть в каждом воркере, но задачу выполняет один: запуск
+берёт advisory-блокировку PostgreSQL с ключом по имени задачи
+(pg_try_advisory_lock) и под ней сверяет время последнего запуска в общем
+кэше. Воркер, не взявший блокировку или опоздавший, пропускает интервал.
+"""
+import logging
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_started
+from django.db import close_old_connections, connection
+
+from .cache import SHARED_CACHE_ALIAS
+
+from .blacklist import prune_expired_tokens
+from .models import AirportPass
+from .signals import passes_changed
+
+logger = logging.getLogger('checkplace')
+
+
+# Запуск пропускается, если другой воркер выполнил задачу меньше чем за эту
+# долю интервала: таймеры воркеров не синхронизированы и немного плывут
+MIN_RUN_SPACING = 0.9
+
+
+class PeriodicTask:
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        # Ключ advisory-блокировки - одинаковый во всех процессах (в отличие от hash())
+        self.lock_id = zlib.crc32(name.encode())
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run_once(self):
+        """Выполняет задачу, если её сейчас не выполняет и недавно не выполнял другой воркер"""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [self.lock_id])
+            if not cursor.fetchone()[0]:
+                return False
+            try:
+                last_run_key = f'periodic-task:{self.name}:last-run'
+                shared = caches[SHARED_CACHE_ALIAS]
+                try:
+                    last_run = shared.get(last_run_key)
+                except Exception as e:
+                    # Без общего кэша задача всё равно не выполняется параллельно
+                    logger.warning(f"Periodic task last run unavailable: task={self.name}, error={e}")
+                    last_run = None
+                if last_run is not None and time.time() - last_run < self.interval * MIN_RUN_SPACING:
+                    return False
+
+                self.func()
+                try:
+                    shared.set(last_run_key, time.time(), None)
+                except Exception as e:
+                    logger.warning(f"Periodic task last run not saved: task={self.name}, error={e}")
+                return True
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [self.lock_id])
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Periodic task failed: task={self.name}, error={e}")
+            finally:
+                close_old_connections()
+
+
+def sweep_expired_passes(batch_size=1000):
+    deactivated = AirportPass.deactivate_expired(batch_size=batch_size)
+    if deactivated:
+        passes_changed()
+        logger.info(f"Expired passes deactivated: count={deactivated}")
+    return deactivated
+
+
+def prune_tokens(batch_size=5000):
+    pruned = prune_expired_tokens(batch_size=batch_size)
+    if pruned:
+        logger.info(f"Expired JWT pruned: count={pruned}")
+    return pruned
+
+
+_started = False
+_start_lock = threading.Lock()
+_tasks = []
+
+
+def start_periodic_tasks(**kwargs):
+    global _started
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+        request_started.disconnect(start_periodic_tasks)
+
+        interval = getattr(settings, 'PASS_SWEEP_INTERVAL', None)
+        if interval:
+            _tasks.append(PeriodicTask('pass-expiry-sweeper', interval, sweep_expired_passes))
+
+        interval = getattr(settings, 'TOKEN_PRUNE_INTERVAL', None)
+        if interval:
+            _tasks.append(PeriodicTask('jwt-pruner', interval, prune_tokens))
+
+        for task in _tasks:
+            task.start()
+
+
+def register_periodic_tasks():
+    request_started.connect(start_periodic_tasks)
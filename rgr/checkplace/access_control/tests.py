@@ -1,3 +1,1123 @@
-from django.test import TestCase
+import gzip
+import json
+import logging
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .blacklist import BlacklistFilter, FilteredRefreshToken, blacklist_filter, prune_expired_tokens
+from .cache import TieredCache, bump_version, get_version
+from .dashboards import DASHBOARD_VERSION_KEY, get_admin_dashboard, invalidate_dashboards
+from .decisions import MATRIX_VERSION_KEY, AccessDecisionMatrix, access_matrix
+from .logs import AsyncQueueHandler
+from .metrics import registry as metrics_registry
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, paginate_attempts
+from .slowqueries import explain, slow_query_log
+from .tasks import PeriodicTask, sweep_expired_passes
+from .ingest import AttemptIngestor, write_attempts
+from . import partitions
+from .rollups import attempt_stats, record_attempts
+from .models import AccessAttempt, AccessAttemptRollup, AccessZone, AirportPass, CustomUser, PassRequest
+
+
+class SecurityDashboardQueryTests(TestCase):
+    def setUp(self):
+        self.security = CustomUser.objects.create_user('security', password='x', role='SECURITY')
+        AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        self.client.force_login(self.security)
+
+    def create_staff(self, count, start=0):
+        expiry = date.today() + timedelta(days=30)
+        for i in range(start, start + count):
+            user = CustomUser.objects.create(username=f'staff{i}', role='STAFF')
+            AirportPass.objects.create(owner=user, expiry_date=expiry, access_zone='TERMINAL', access_level=1)
+            AirportPass.objects.create(owner=user, expiry_date=expiry, access_zone='SECURE', access_level=3)
+            AirportPass.objects.create(
+                owner=user, expiry_date=expiry, access_zone='SECURE', access_level=4, is_active=False
+            )
+
+    def get_dashboard(self):
+        # Сессия, пользователь, зоны и персонал - независимо от числа сотрудников
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('check_access'))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_staff(self):
+        self.create_staff(3)
+        self.get_dashboard()
+
+        self.create_staff(30, start=3)
+        response = self.get_dashboard()
+        self.assertEqual(len(response.context['staff_users']), 33)
+
+    def test_staff_level_uses_only_active_passes(self):
+        self.create_staff(1)
+        response = self.get_dashboard()
+
+        staff = list(response.context['staff_users'])
+        self.assertEqual(len(staff), 1)
+        self.assertEqual(staff[0].active_pass_level, 3)
+
+
+# LocMem вместо Redis в роли общего L2
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+})
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+
+    def make_worker(self, **options):
+        options.setdefault('L2', 'shared')
+        return TieredCache('', {'OPTIONS': options})
+
+    def test_workers_share_values_through_l2(self):
+        first, second = self.make_worker(), self.make_worker()
+        first.set('flights', [1, 2, 3], 60)
+        self.assertEqual(second.get('flights'), [1, 2, 3])
+
+    def test_l1_answers_without_l2_until_its_ttl(self):
+        worker = self.make_worker(L1_TIMEOUT=5)
+        with mock.patch('access_control.cache.time.monotonic', return_value=1000):
+            worker.set('key', 'value', 60)
+        caches['shared'].clear()
+
+        with mock.patch('access_control.cache.time.monotonic', return_value=1004):
+            self.assertEqual(worker.get('key'), 'value')
+        with mock.patch('access_control.cache.time.monotonic', return_value=1006):
+            self.assertIsNone(worker.get('key'))
+
+    def test_l1_evicts_least_recently_used(self):
+        worker = self.make_worker(L1_MAX_ENTRIES=2)
+        worker.set('a', 'first')
+        worker.set('b', 'second')
+        worker.get('a')
+        worker.set('c', 'third')
+
+        self.assertEqual(len(worker.l1), 2)
+        self.assertEqual(worker.l1.get(worker.make_key('a')), (True, 'first'))
+        self.assertEqual(worker.l1.get(worker.make_key('b')), (False, None))
+
+    def test_delete_reaches_both_levels(self):
+        first, second = self.make_worker(), self.make_worker()
+        first.set('key', 'value')
+        first.delete('key')
+        self.assertIsNone(first.get('key'))
+        self.assertIsNone(second.get('key'))
+
+    def test_l2_failure_falls_back_to_l1(self):
+        worker = self.make_worker()
+        l2 = caches['shared']
+        with mock.patch.object(l2, 'set', side_effect=ConnectionError), \
+                mock.patch.object(l2, 'get', side_effect=ConnectionError):
+            worker.set('key', 'value')
+            self.assertEqual(worker.get('key'), 'value')
+            self.assertEqual(worker.get('missing', 'default'), 'default')
+
+    def test_counters_are_not_kept_in_l1(self):
+        first, second = self.make_worker(), self.make_worker()
+        first.set('counter', 1)
+        self.assertEqual(second.get('counter'), 1)
+
+        first.incr('counter')
+        self.assertEqual(second.get('counter'), 2)
+        self.assertEqual(len(first.l1) + len(second.l1), 0)
+
+    def test_versions_live_in_shared_cache_and_never_repeat(self):
+        self.assertEqual(get_version('matrix'), 0)
+        bump_version('matrix')
+        first = get_version('matrix')
+        self.assertEqual(caches['shared'].get('matrix'), first)
+
+        caches['shared'].clear()  # вытеснение ключа
+        bump_version('matrix')
+        self.assertNotIn(get_version('matrix'), (0, first))
+
+
+# Попытки пишутся сразу в транзакции теста, без фонового потока спула
+SYNC_INGEST = override_settings(ACCESS_ATTEMPT_INGEST={'ENABLED': False})
+
+
+@SYNC_INGEST
+class StatelessJWTTests(TestCase):
+    def setUp(self):
+        self.security = CustomUser.objects.create(username='security', role='SECURITY')
+        self.staff = CustomUser.objects.create(username='staff', role='STAFF')
+        self.zone = AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        AirportPass.objects.create(
+            owner=self.staff, expiry_date=date.today() + timedelta(days=30), access_zone='TERMINAL', access_level=1
+        )
+        access_matrix.invalidate()
+
+    def access_token(self, user, **claims):
+        token = AccessToken.for_user(user)
+        for claim, value in claims.items():
+            token[claim] = value
+        return str(token)
+
+    def post_check(self):
+        return self.client.post(reverse('check_access'), {'user_id': self.staff.id, 'zone_id': self.zone.id})
+
+    def test_check_access_authenticates_without_queries(self):
+        self.client.cookies['access_token'] = self.access_token(self.security, username='security', role='SECURITY')
+        self.post_check()  # прогрев матрицы доступа
+
+        # Попытка уходит в спул, а не в БД
+        with mock.patch('access_control.views.submit_attempts') as submit, self.assertNumQueries(0):
+            response = self.post_check()
+        self.assertEqual(response.json()['status'], 'access_granted')
+        self.assertEqual(submit.call_args.args[0][0].attempt_type, 'GRANTED')
+
+    def test_role_comes_from_token(self):
+        self.client.cookies['access_token'] = self.access_token(self.staff, username='staff', role='STAFF')
+        response = self.post_check()
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    @mock.patch('access_control.views.submit_attempts')
+    def test_bearer_token_is_exempt_from_csrf(self, submit):
+        client = Client(enforce_csrf_checks=True)
+        token = self.access_token(self.security, username='security', role='SECURITY')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+        response = client.post(reverse('check_access'), {'user_id': self.staff.id, 'zone_id': self.zone.id}, **headers)
+        self.assertEqual(response.json()['status'], 'access_granted')
+
+        response = client.post(
+            reverse('check_access_batch'), json.dumps({'checks': [[self.staff.id, self.zone.id]]}),
+            content_type='application/json', **headers,
+        )
+        self.assertEqual(response.json()['results'][0]['status'], 'access_granted')
+
+    def test_cookie_token_and_session_keep_csrf_checks(self):
+        client = Client(enforce_csrf_checks=True)
+        client.cookies['access_token'] = self.access_token(self.security, username='security', role='SECURITY')
+        response = client.post(reverse('check_access'), {'user_id': self.staff.id, 'zone_id': self.zone.id})
+        self.assertEqual(response.status_code, 403)
+
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.security)
+        response = client.post(
+            reverse('check_access'), {'user_id': self.staff.id, 'zone_id': self.zone.id},
+            HTTP_AUTHORIZATION='Bearer broken',
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_token_falls_back_to_session(self):
+        self.client.cookies['access_token'] = 'broken'
+        response = self.post_check()
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(reverse('login')))
+
+        self.client.force_login(self.security)
+        response = self.post_check()
+        self.assertEqual(response.json()['status'], 'access_granted')
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+})
+class RefreshTokenBlacklistTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        blacklist_filter.invalidate()
+        self.user = CustomUser.objects.create(username='staff', role='STAFF')
+
+    def test_valid_token_skips_blacklist_tables(self):
+        raw = str(FilteredRefreshToken.for_user(self.user))
+        FilteredRefreshToken(raw)  # первое обращение строит фильтр
+
+        with self.assertNumQueries(0):
+            FilteredRefreshToken(raw)
+
+    def test_blacklisted_token_is_rejected(self):
+        raw = str(FilteredRefreshToken.for_user(self.user))
+        FilteredRefreshToken(raw)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FilteredRefreshToken(raw).blacklist()
+
+        with self.assertRaises(TokenError):
+            FilteredRefreshToken(raw)
+
+    def test_other_workers_rebuild_after_blacklist(self):
+        token = FilteredRefreshToken.for_user(self.user)
+        other_worker = BlacklistFilter()
+        self.assertFalse(other_worker.might_contain(token['jti']))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+
+        self.assertTrue(other_worker.might_contain(token['jti']))
+
+    def test_evicted_version_does_not_hide_blacklist(self):
+        token = FilteredRefreshToken.for_user(self.user)
+        other_worker = BlacklistFilter()
+        with self.captureOnCommitCallbacks(execute=True):
+            FilteredRefreshToken.for_user(self.user).blacklist()
+        other_worker.might_contain(token['jti'])
+
+        # Ключ версии вытеснен и опубликован заново - значение не должно совпасть
+        # с тем, что воркер уже видел
+        caches['shared'].clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+
+        self.assertTrue(other_worker.might_contain(token['jti']))
+
+    def test_prune_removes_only_expired_tokens(self):
+        FilteredRefreshToken.for_user(self.user).blacklist()
+        expired = FilteredRefreshToken.for_user(self.user)
+        expired.blacklist()
+        OutstandingToken.objects.filter(jti=expired['jti']).update(expires_at=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(prune_expired_tokens(batch_size=1), 1)
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class PerformanceMetricsTests(TestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.client.force_login(CustomUser.objects.create(username='security', role='SECURITY'))
+
+    def test_request_metrics_are_exposed(self):
+        self.client.get(reverse('check_access'))
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        body = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_request_duration_seconds_count{view="check_access"', body)
+        self.assertIn('http_request_db_queries{view="check_access"', body)
+        self.assertRegex(body, r'http_request_template_duration_seconds_sum\{view="check_access",pid="\d+"\} 0\.\d*[1-9]')
+
+    def test_metrics_require_token(self):
+        # За прокси адрес клиента всегда локальный - он ничего не разрешает
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_metrics_are_closed_without_configured_token(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer None')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(SLOW_QUERY={'THRESHOLD_MS': 0.001, 'BUFFER_SIZE': 200, 'EXPLAIN_ANALYZE': True})
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        slow_query_log.clear()
+        self.security = CustomUser.objects.create(username='security', role='SECURITY')
+        self.admin = CustomUser.objects.create(username='admin', role='ADMIN')
+
+    def test_slow_queries_are_captured_with_plan_and_call_site(self):
+        self.client.force_login(self.security)
+        self.client.get(reverse('check_access'))
+
+        entry = next(e for e in slow_query_log.entries() if 'access_control_accesszone' in e['sql'])
+        self.assertEqual(entry['path'], reverse('check_access'))
+        self.assertIn('actual time', entry['plan'])
+        self.assertTrue(any('in check_access' in frame for frame in entry['stack']))
+
+    def test_only_admins_see_slow_queries(self):
+        self.client.force_login(self.security)
+        self.assertRedirects(self.client.get(reverse('slow_queries')), reverse('home'), fetch_redirect_response=False)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('slow_queries'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'План выполнения')
+
+    def test_explain_rolls_back_side_effects(self):
+        plan = explain(connection, "SELECT set_config('slow_query.test', 'changed', false)", None, analyze=True)
+        self.assertIn('actual time', plan)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('slow_query.test', true)")
+            self.assertIn(cursor.fetchone()[0], (None, ''))
+
+    def test_only_plain_selects_are_analyzed(self):
+        AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        for sql in [
+            'WITH gone AS (DELETE FROM access_control_accesszone RETURNING id) SELECT count(*) FROM gone',
+            'SELECT id FROM access_control_accesszone FOR UPDATE',
+            "SELECT nextval(pg_get_serial_sequence('access_control_accesszone', 'id'))",
+        ]:
+            plan = explain(connection, sql, None, analyze=True)
+            self.assertNotIn('actual time', plan, sql)
+        self.assertEqual(AccessZone.objects.count(), 1)
+
+
+class BatchReviewFilterTests(TestCase):
+    def setUp(self):
+        self.client.force_login(CustomUser.objects.create(username='admin', role='ADMIN'))
+        self.staff = CustomUser.objects.create(username='staff', role='STAFF')
+        self.requests = [
+            PassRequest.objects.create(user=self.staff, access_zone='TERMINAL', purpose='Смена')
+            for _ in range(3)
+        ]
+
+    def post_batch(self, data):
+        return self.client.post(reverse('review_requests_batch'), json.dumps(data), content_type='application/json')
+
+    def assert_nothing_reviewed(self):
+        self.assertFalse(PassRequest.objects.exclude(status='PENDING').exists())
+
+    def test_unparseable_dates_are_rejected(self):
+        for field in ('created_after', 'created_before'):
+            for value in ('вчера', '2024-13-45', 20240101):
+                response = self.post_batch({'action': 'reject', 'filters': {field: value}})
+                self.assertEqual(response.status_code, 400, (field, value))
+        self.assert_nothing_reviewed()
+
+    def test_non_numeric_user_id_is_rejected(self):
+        response = self.post_batch({'action': 'approve', 'filters': {'user_id': 'staff'}})
+        self.assertEqual(response.status_code, 400)
+        self.assert_nothing_reviewed()
+
+    def test_valid_filters_are_applied(self):
+        other = CustomUser.objects.create(username='other', role='STAFF')
+        PassRequest.objects.create(user=other, access_zone='TERMINAL', purpose='Смена')
+
+        response = self.post_batch({
+            'action': 'reject',
+            'filters': {'user_id': str(self.staff.id), 'created_after': date.today().isoformat()},
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['reviewed'], sorted(r.id for r in self.requests))
+        self.assertTrue(PassRequest.objects.filter(user=other, status='PENDING').exists())
+
+    def test_approve_creates_passes_and_reports_failures(self):
+        today = date.today()
+        approved = PassRequest.objects.create(
+            user=self.staff, access_zone='SECURE', purpose='Смена',
+            start_date=today + timedelta(days=1), end_date=today + timedelta(days=10),
+        )
+        inactive_user = CustomUser.objects.create(username='fired', role='STAFF', is_active=False)
+        inactive = PassRequest.objects.create(user=inactive_user, access_zone='TERMINAL', purpose='Смена')
+        reversed_dates = PassRequest.objects.create(
+            user=self.staff, access_zone='TERMINAL', purpose='Смена',
+            start_date=today + timedelta(days=5), end_date=today + timedelta(days=2),
+        )
+        expired = PassRequest.objects.create(
+            user=self.staff, access_zone='TERMINAL', purpose='Смена',
+            start_date=today - timedelta(days=10), end_date=today - timedelta(days=1),
+        )
+        already_rejected = PassRequest.objects.create(
+            user=self.staff, access_zone='TERMINAL', purpose='Смена', status='REJECTED',
+        )
+        candidates = [approved, inactive, reversed_dates, expired, already_rejected]
+
+        reviewed, failures = PassRequest.bulk_review(
+            PassRequest.objects.filter(id__in=[r.id for r in candidates]), 'approve',
+        )
+
+        self.assertEqual([r.id for r in reviewed], [approved.id])
+        self.assertEqual(failures, {
+            inactive.id: 'Учётная запись сотрудника отключена',
+            reversed_dates.id: 'Дата окончания раньше даты начала',
+            expired.id: 'Срок действия заявки уже истёк',
+        })
+        airport_pass = AirportPass.objects.get()
+        self.assertEqual(
+            (airport_pass.owner, airport_pass.access_zone, airport_pass.issue_date, airport_pass.expiry_date, airport_pass.is_active),
+            (self.staff, 'SECURE', approved.start_date, approved.end_date, True),
+        )
+        statuses = dict(PassRequest.objects.filter(id__in=[r.id for r in candidates]).values_list('id', 'status'))
+        self.assertEqual(statuses, {
+            approved.id: 'APPROVED', inactive.id: 'PENDING', reversed_dates.id: 'PENDING',
+            expired.id: 'PENDING', already_rejected.id: 'REJECTED',
+        })
+
+    def test_approve_by_ids_reports_skipped_requests(self):
+        self.requests[1].status = 'APPROVED'
+        self.requests[1].save()
+
+        response = self.post_batch({'action': 'approve', 'ids': [r.id for r in self.requests] + [999999]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['reviewed'], [self.requests[0].id, self.requests[2].id])
+        self.assertEqual(
+            {failure['id']: failure['message'] for failure in response.json()['failures']},
+            {self.requests[1].id: 'Заявка не найдена или уже рассмотрена', 999999: 'Заявка не найдена или уже рассмотрена'},
+        )
+        self.assertEqual(
+            sorted(AirportPass.objects.values_list('owner_id', 'access_zone', 'expiry_date')),
+            [(self.staff.id, 'TERMINAL', self.requests[0].end_date)] * 2,
+        )
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+})
+class AccessDecisionMatrixTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.staff = CustomUser.objects.create(username='staff', role='STAFF')
+        self.terminal = AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        self.secure = AccessZone.objects.create(name='Перрон', zone_type='SECURE', description='')
+        self.airport_pass = AirportPass.objects.create(
+            owner=self.staff, expiry_date=date.today() + timedelta(days=30), access_zone='TERMINAL', access_level=1
+        )
+        access_matrix.invalidate()
+
+    def test_grant_and_deny_by_level(self):
+        granted = access_matrix.check(self.staff.id, self.terminal.id)
+        self.assertTrue(granted.granted)
+        self.assertEqual(granted.pass_id, self.airport_pass.id)
+
+        denied = access_matrix.check(self.staff.id, self.secure.id)
+        self.assertFalse(denied.granted)
+        self.assertTrue(denied.has_pass)
+
+    def test_unknown_user_or_zone(self):
+        self.assertIsNone(access_matrix.check(self.staff.id + 1000, self.terminal.id))
+        self.assertIsNone(access_matrix.check(self.staff.id, self.terminal.id + 1000))
+
+    def test_revocation_reaches_other_workers(self):
+        other_worker = AccessDecisionMatrix()
+        self.assertTrue(other_worker.check(self.staff.id, self.terminal.id).granted)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.airport_pass.is_active = False
+            self.airport_pass.save()
+
+        decision = other_worker.check(self.staff.id, self.terminal.id)
+        self.assertFalse(decision.granted)
+        self.assertFalse(decision.has_pass)
+
+    def test_snapshot_is_reused_while_version_is_unchanged(self):
+        other_worker = AccessDecisionMatrix()
+        other_worker.check(self.staff.id, self.terminal.id)
+        with self.assertNumQueries(0):
+            other_worker.check(self.staff.id, self.secure.id)
+
+
+class AttemptIngestorTests(TestCase):
+    def setUp(self):
+        self.spool_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+        self.user = CustomUser.objects.create(username='staff', role='STAFF')
+        self.zone = AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+
+    def start_ingestor(self, **options):
+        # Без сброса по таймеру и размеру: пишет только тестовый поток
+        ingestor = AttemptIngestor(self.spool_dir, batch_size=10 ** 6, flush_interval=3600, **options)
+        ingestor.start()
+        self.addCleanup(lambda: ingestor._thread and ingestor.stop())
+        return ingestor
+
+    def attempts(self, count):
+        return [
+            AccessAttempt(user=self.user, zone=self.zone, attempt_type='GRANTED', details='Турникет')
+            for _ in range(count)
+        ]
+
+    def kill(self, ingestor):
+        # Процесс упал: поток и блокировка исчезли, каталог со спулом остался
+        ingestor._stopped.set()
+        ingestor._wakeup.set()
+        ingestor._thread.join()
+        ingestor._thread = None
+        ingestor._segment.close()
+        ingestor._worker_lock.close()
+
+    def test_each_process_spools_to_its_own_directory(self):
+        first, second = self.start_ingestor(), self.start_ingestor()
+        self.assertNotEqual(first.worker_dir, second.worker_dir)
+
+        first.submit_many(self.attempts(3))
+        second.submit_many(self.attempts(2))
+        self.assertEqual(first.flush() + second.flush(), 5)
+        self.assertEqual(AccessAttempt.objects.count(), 5)
+
+    def test_recovery_replays_only_dead_workers(self):
+        dead, alive = self.start_ingestor(), self.start_ingestor()
+        dead.submit_many(self.attempts(3))
+        alive.submit_many(self.attempts(2))
+        self.kill(dead)
+
+        self.start_ingestor()
+
+        self.assertEqual(AccessAttempt.objects.count(), 3)
+        self.assertFalse(dead.worker_dir.exists())
+        self.assertTrue((alive.worker_dir / 'current.jsonl').exists())
+        self.assertEqual(alive.flush(), 2)
+
+    def test_failed_batch_is_retried_on_next_flush(self):
+        ingestor = self.start_ingestor()
+        ingestor.submit_many(self.attempts(4))
+        with mock.patch('access_control.ingest.AccessAttempt.objects.bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                ingestor.flush()
+        self.assertEqual(AccessAttempt.objects.count(), 0)
+
+        ingestor.submit_many(self.attempts(1))
+        ingestor.flush()
+        self.assertEqual(AccessAttempt.objects.count(), 5)
+        self.assertEqual(list(ingestor.worker_dir.glob('batch-*')), [])
+
+    def test_rejected_attempts_go_to_dead_letter(self):
+        # FK проверяются сразу, как при COMMIT пакета вне тестовой транзакции
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        ingestor = self.start_ingestor()
+        deleted_user = CustomUser.objects.create(username='gone', role='STAFF')
+        orphan = AccessAttempt(user_id=deleted_user.id, zone=self.zone, attempt_type='DENIED', details='Турникет')
+        deleted_user.delete()
+        ingestor.submit_many(self.attempts(2) + [orphan])
+
+        with self.assertRaises(IntegrityError):
+            ingestor.flush()
+
+        # Неудачный пакет не задерживает новые попытки
+        ingestor.submit_many(self.attempts(1))
+        with self.assertRaises(IntegrityError):
+            ingestor.flush()
+        self.assertEqual(AccessAttempt.objects.count(), 1)
+
+        # После max_batch_attempts пакет пишется по одной попытке
+        self.assertEqual(ingestor.flush(), 0)
+        self.assertEqual(AccessAttempt.objects.count(), 3)
+        self.assertEqual(list(ingestor.worker_dir.glob('batch-*')), [])
+        dead_letters = list((self.spool_dir / 'dead-letter').glob('batch-*.jsonl'))
+        self.assertEqual(len(dead_letters), 1)
+        self.assertEqual(json.loads(dead_letters[0].read_text())['attempt_type'], 'DENIED')
+
+    def test_buffer_is_capped(self):
+        ingestor = self.start_ingestor(max_buffered=3)
+        for _ in range(5):
+            ingestor.submit(self.attempts(1)[0])
+        self.assertEqual(len(ingestor._buffer), 2)
+        self.assertEqual(len(list(ingestor.worker_dir.glob('batch-*'))), 1)
+
+        self.assertEqual(ingestor.flush(), 2)
+        self.assertEqual(AccessAttempt.objects.count(), 5)
+
+    def test_stop_flushes_and_removes_directory(self):
+        ingestor = self.start_ingestor()
+        ingestor.submit_many(self.attempts(2))
+        worker_dir = ingestor.worker_dir
+        ingestor.stop()
+
+        self.assertEqual(AccessAttempt.objects.count(), 2)
+        self.assertFalse(worker_dir.exists())
+
+
+class AttemptRollupTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='staff', role='STAFF')
+        self.zone = AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        self.now = timezone.now()
+
+    def attempt(self, attempt_type, seconds_ago, user=None, zone=None):
+        return AccessAttempt(
+            user=user or self.user, zone=zone or self.zone, attempt_type=attempt_type,
+            timestamp=self.now - timedelta(seconds=seconds_ago),
+        )
+
+    def raw_counts(self, start_time):
+        counts = dict.fromkeys(['GRANTED', 'DENIED', 'ALERT'], 0)
+        for attempt_type in counts:
+            counts[attempt_type] = AccessAttempt.objects.filter(
+                timestamp__gte=start_time, attempt_type=attempt_type
+            ).count()
+        return counts
+
+    def test_rollups_match_raw_count(self):
+        types = ['GRANTED', 'DENIED', 'ALERT']
+        # Пакетная запись и одиночные save() в разные минуты, затем удаление
+        # пользователя и зоны вместе с их попытками
+        other_user = CustomUser.objects.create(username='gone', role='STAFF')
+        other_zone = AccessZone.objects.create(name='Терминал B', zone_type='TERMINAL', description='')
+        write_attempts([self.attempt(types[i % 3], i * 17) for i in range(300)])
+        write_attempts([self.attempt(types[i % 3], i * 23, user=other_user) for i in range(40)])
+        write_attempts([self.attempt(types[i % 3], i * 29, zone=other_zone) for i in range(40)])
+        for i in range(30):
+            self.attempt(types[i % 2], i * 41 + 5).save()
+        other_user.delete()
+        other_zone.delete()
+
+        for minutes in (5, 37, 90, 24 * 60):
+            start_time = self.now - timedelta(minutes=minutes, seconds=13)
+            stats = attempt_stats(start_time)
+            self.assertEqual(
+                {attempt_type: stats[attempt_type] for attempt_type in types},
+                self.raw_counts(start_time),
+                minutes,
+            )
+
+    def test_user_delete_does_not_load_attempts(self):
+        def delete_queries(attempt_count):
+            user = CustomUser.objects.create(username=f'gone-{attempt_count}', role='STAFF')
+            write_attempts([self.attempt('GRANTED', i * 7, user=user) for i in range(attempt_count)])
+            with CaptureQueriesContext(connection) as queries:
+                user.delete()
+            return len(queries)
+
+        # Каскад по попыткам - один DELETE, счётчики - один UPDATE
+        self.assertEqual(delete_queries(1), delete_queries(50))
+
+    def test_upserts_are_issued_in_key_order(self):
+        attempts = [self.attempt(attempt_type, seconds) for attempt_type, seconds in
+                    [('DENIED', 0), ('GRANTED', 600), ('ALERT', 0), ('GRANTED', 0), ('DENIED', 300)]]
+        with mock.patch('django.db.backends.utils.CursorWrapper.executemany') as executemany:
+            record_attempts(attempts)
+        rows = executemany.call_args.args[1]
+        self.assertEqual(rows, sorted(rows))
+        self.assertEqual(len(rows), 5)
+
+
+class AccessAttemptStreamTests(TestCase):
+    def setUp(self):
+        self.security = CustomUser.objects.create(username='security', role='SECURITY')
+
+    def test_wsgi_page_does_not_subscribe(self):
+        self.client.force_login(self.security)
+        response = self.client.get(reverse('access_logs'))
+        self.assertFalse(response.context['live_updates'])
+        self.assertNotContains(response, 'EventSource')
+
+    def test_wsgi_stream_fails_fast(self):
+        self.client.force_login(self.security)
+        response = self.client.get(reverse('access_attempts_stream'))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.streaming)
+
+    async def test_asgi_page_subscribes_to_stream(self):
+        await self.async_client.aforce_login(self.security)
+        response = await self.async_client.get(reverse('access_logs'))
+        self.assertContains(response, 'EventSource')
+
+    async def test_asgi_stream_starts_with_retry_interval(self):
+        await self.async_client.aforce_login(self.security)
+        response = await self.async_client.get(reverse('access_attempts_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        await stream.aclose()
+
+
+class AccessLogExportTests(TestCase):
+    def setUp(self):
+        self.security = CustomUser.objects.create(username='security', role='SECURITY')
+        zone = AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        now = timezone.now()
+        write_attempts([
+            AccessAttempt(user=self.security, zone=zone, attempt_type='GRANTED',
+                          timestamp=now - timedelta(minutes=i), details=f'попытка {i}')
+            for i in range(5)
+        ])
+
+    def test_wsgi_export_streams_sync_rows(self):
+        self.client.force_login(self.security)
+        response = self.client.get(reverse('access_logs_export'))
+        self.assertFalse(response.is_async)
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,timestamp,attempt_type,user,zone,pass_id,details')
+        self.assertEqual(len(lines), 6)
+
+    def test_unparseable_dates_are_rejected(self):
+        self.client.force_login(self.security)
+        for params in ({'start': 'вчера'}, {'end': '2024-13-45'}, {'start': '2024-01-01', 'end': '01.02.2024'}):
+            response = self.client.get(reverse('access_logs_export'), params)
+            self.assertEqual(response.status_code, 400, params)
+
+        today = timezone.localdate().isoformat()
+        response = self.client.get(reverse('access_logs_export'), {'start': today, 'end': today})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_asgi_export_streams_async_rows(self):
+        await self.async_client.aforce_login(self.security)
+        response = await self.async_client.get(reverse('access_logs_export'))
+        self.assertTrue(response.is_async)
+
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[-1].endswith('попытка 0'))
+
+
+class AttemptPartitionTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='staff', role='STAFF')
+        self.zone = AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+
+    def attempt_at(self, year, month, day):
+        AccessAttempt.objects.create(
+            user=self.user, zone=self.zone, attempt_type='GRANTED',
+            timestamp=datetime(year, month, day, tzinfo=dt_timezone.utc),
+        )
+
+    def default_partition_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM "{partitions.DEFAULT_PARTITION}"')
+            return cursor.fetchone()[0]
+
+    def test_new_partition_takes_rows_from_default(self):
+        self.attempt_at(2041, 2, 10)
+        self.attempt_at(2041, 2, 20)
+        self.assertEqual(self.default_partition_count(), 2)
+
+        created = partitions.ensure_partitions(1, now=datetime(2041, 1, 15, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(created, ['access_control_accessattempt_p2041_01', 'access_control_accessattempt_p2041_02'])
+        self.assertEqual(self.default_partition_count(), 0)
+        self.assertEqual(AccessAttempt.objects.filter(timestamp__year=2041).count(), 2)
+        # Строки периода после переноса попадают уже в новую секцию
+        self.attempt_at(2041, 2, 25)
+        self.assertEqual(self.default_partition_count(), 0)
+
+    def test_partition_is_archived_before_detach(self):
+        partitions.ensure_partitions(0, now=datetime(2001, 1, 1, tzinfo=dt_timezone.utc))
+        self.attempt_at(2001, 1, 10)
+        name = 'access_control_accessattempt_p2001_01'
+        with connection.cursor() as cursor:
+            # Отложенные проверки FK внутри тестовой транзакции мешают DROP
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        archive_partition = partitions.archive_partition
+
+        def archive_attached(partition, archive_dir):
+            self.assertIn(partition, partitions.list_partitions().values())
+            return archive_partition(partition, archive_dir)
+
+        with mock.patch('access_control.partitions.archive_partition', side_effect=archive_attached):
+            dropped = partitions.drop_expired_partitions(
+                1, self.archive_dir, now=datetime(2001, 3, 1, tzinfo=dt_timezone.utc)
+            )
+
+        self.assertEqual(dropped, [name])
+        self.assertNotIn(name, partitions.list_partitions().values())
+        self.assertFalse(AccessAttempt.objects.filter(timestamp__year=2001).exists())
+        self.assertFalse(AccessAttemptRollup.objects.filter(bucket__year=2001).exists())
+        with gzip.open(Path(self.archive_dir) / f'{name}.csv.gz', 'rt') as archive:
+            self.assertEqual(len(archive.read().splitlines()), 2)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'access_control.cache.TieredCache', 'OPTIONS': {'L2': 'shared', 'L1_TIMEOUT': 60}},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+})
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = CustomUser.objects.create(username='staff', role='STAFF')
+
+    def request_pass(self):
+        return PassRequest.objects.create(user=self.user, access_zone='TERMINAL', purpose='Работа')
+
+    def test_dashboard_is_served_from_cache(self):
+        self.request_pass()
+        self.assertEqual(get_admin_dashboard()['pending_requests_count'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_admin_dashboard()['pending_requests_count'], 1)
+
+    def test_invalidation_in_another_worker_is_seen_despite_l1(self):
+        get_admin_dashboard()
+        self.request_pass()
+        # Сброс в другом воркере: его TieredCache, общий L2, L1 этого процесса не тронут
+        other_worker = TieredCache('', {'OPTIONS': {'L2': 'shared'}})
+        with mock.patch('access_control.dashboards.cache', other_worker), \
+                self.captureOnCommitCallbacks(execute=True):
+            invalidate_dashboards()
+
+        self.assertEqual(get_admin_dashboard()['pending_requests_count'], 1)
+
+    def test_changes_publish_new_version_after_commit(self):
+        version = get_version(DASHBOARD_VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.request_pass()
+            self.assertEqual(get_version(DASHBOARD_VERSION_KEY), version)
+        self.assertNotEqual(get_version(DASHBOARD_VERSION_KEY), version)
+
+    def test_unavailable_shared_cache_bypasses_dashboard_cache(self):
+        get_admin_dashboard()
+        self.request_pass()
+        with mock.patch('access_control.dashboards.get_version', return_value=None):
+            self.assertEqual(get_admin_dashboard()['pending_requests_count'], 1)
+
+
+class AsyncQueueHandlerTests(SimpleTestCase):
+    def setUp(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir, ignore_errors=True)
+        self.path = Path(log_dir) / 'debug.log'
+
+    def make_handler(self):
+        handler = AsyncQueueHandler(filename=self.path, console=False)
+        self.addCleanup(handler.close)
+        return handler
+
+    def emit(self, handler, message):
+        handler.handle(logging.makeLogRecord({'name': 'checkplace', 'levelno': logging.INFO, 'levelname': 'INFO', 'msg': message}))
+
+    def drain(self, handler):
+        # stop() дожидается записи всей очереди; дальше работа продолжается
+        handler.stop()
+        handler.start()
+
+    def messages(self, path):
+        return [json.loads(line)['message'] for line in path.read_text(encoding='utf-8').splitlines()]
+
+    def test_workers_append_to_one_file(self):
+        first, second = self.make_handler(), self.make_handler()
+        for i in range(100):
+            self.emit(first, f'first {i}')
+            self.emit(second, f'second {i}')
+        self.drain(first)
+        self.drain(second)
+
+        messages = self.messages(self.path)
+        self.assertEqual(len(messages), 200)
+        self.assertEqual([m for m in messages if m.startswith('first')], [f'first {i}' for i in range(100)])
+
+    def test_external_rotation_reopens_file(self):
+        handler = self.make_handler()
+        self.emit(handler, 'before')
+        self.drain(handler)
+
+        rotated = self.path.with_name('debug.log.1')
+        self.path.rename(rotated)  # так делает logrotate
+        self.emit(handler, 'after')
+        self.drain(handler)
+
+        self.assertEqual(self.messages(rotated), ['before'])
+        self.assertEqual(self.messages(self.path), ['after'])
+
+
+@SYNC_INGEST
+class BatchAccessCheckTests(TestCase):
+    def setUp(self):
+        today = date.today()
+        self.terminal = AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        self.secure = AccessZone.objects.create(name='Досмотр', zone_type='SECURE', description='')
+        self.staff = CustomUser.objects.create(username='staff', role='STAFF')
+        self.active_pass = AirportPass.objects.create(
+            owner=self.staff, expiry_date=today + timedelta(days=30), access_zone='SECURE', access_level=3
+        )
+        # Неактивный и просроченный пропуска с полным доступом не учитываются
+        AirportPass.objects.create(
+            owner=self.staff, expiry_date=today + timedelta(days=30), access_zone='SECURE', access_level=4, is_active=False
+        )
+        AirportPass.objects.create(
+            owner=self.staff, expiry_date=today - timedelta(days=1), access_zone='SECURE', access_level=4
+        )
+        self.visitor = CustomUser.objects.create(username='visitor', role='STAFF')
+        self.client.force_login(CustomUser.objects.create(username='security', role='SECURITY'))
+
+    def check(self, checks):
+        return self.client.post(
+            reverse('check_access_batch'), json.dumps({'checks': checks}), content_type='application/json'
+        )
+
+    def test_decisions_follow_request_order(self):
+        response = self.check([
+            [self.staff.id, self.secure.id],
+            [self.staff.id, self.terminal.id],
+            [self.visitor.id, self.terminal.id],
+            [999999, self.terminal.id],
+            [self.staff.id, 999999],
+        ])
+
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], [
+            'access_granted', 'access_granted', 'access_denied', 'error', 'error',
+        ])
+        self.assertEqual(results[2]['attempt_type'], 'ALERT')
+
+        attempts = AccessAttempt.objects.order_by('id')
+        self.assertEqual([a.attempt_type for a in attempts], ['GRANTED', 'GRANTED', 'ALERT'])
+        self.assertEqual([a.pass_instance_id for a in attempts], [self.active_pass.id, self.active_pass.id, None])
+
+    def test_query_count_does_not_grow_with_batch(self):
+        with CaptureQueriesContext(connection) as single:
+            self.check([[self.staff.id, self.secure.id]])
+        with CaptureQueriesContext(connection) as batch:
+            self.check([[self.staff.id, self.secure.id], [self.visitor.id, self.terminal.id]] * 50)
+        self.assertEqual(len(batch), len(single))
+        self.assertEqual(AccessAttempt.objects.count(), 101)
+
+    def test_rejects_malformed_and_oversized_batches(self):
+        self.assertEqual(self.check([[self.staff.id]]).status_code, 400)
+        self.assertEqual(self.check([['x', self.secure.id]]).status_code, 400)
+        with mock.patch('access_control.views.BATCH_CHECK_LIMIT', 2):
+            self.assertEqual(self.check([[self.staff.id, self.secure.id]] * 3).status_code, 400)
+        self.assertFalse(AccessAttempt.objects.exists())
+
+    def test_only_security_can_check(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.check([[self.staff.id, self.secure.id]]).status_code, 403)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.security = CustomUser.objects.create(username='security', role='SECURITY')
+        zone = AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        now = timezone.now().replace(microsecond=0)
+        # По три попытки на одну и ту же секунду: порядок внутри решает id
+        write_attempts([
+            AccessAttempt(user=self.security, zone=zone, attempt_type='GRANTED' if i % 2 else 'DENIED',
+                          timestamp=now - timedelta(seconds=i // 3))
+            for i in range(10)
+        ])
+
+    def test_cursor_round_trip(self):
+        attempt = AccessAttempt.objects.first()
+        self.assertEqual(decode_cursor(encode_cursor(attempt)), (attempt.timestamp, attempt.id))
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ['', 'не-base64', encode_cursor(AccessAttempt(id=1, timestamp=timezone.now()))[:-3], 'MjAyNHwx']:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_pages_cover_ties_without_gaps_or_repeats(self):
+        expected = list(AccessAttempt.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        seen = []
+        cursor = None
+        while True:
+            items, cursor = paginate_attempts(AccessAttempt.objects.all(), cursor, page_size=2)
+            seen.extend(attempt.id for attempt in items)
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_last_full_page_has_no_cursor(self):
+        items, cursor = paginate_attempts(AccessAttempt.objects.all(), page_size=10)
+        self.assertEqual(len(items), 10)
+        self.assertIsNone(cursor)
+
+    def test_api_follows_cursor_with_filter(self):
+        self.client.force_login(self.security)
+        first = self.client.get(reverse('access_logs_api'), {'type': 'GRANTED', 'limit': 3}).json()
+        second = self.client.get(
+            reverse('access_logs_api'), {'type': 'GRANTED', 'limit': 3, 'cursor': first['next_cursor']}
+        ).json()
+
+        ids = [r['id'] for r in first['results'] + second['results']]
+        self.assertEqual(ids, list(
+            AccessAttempt.objects.filter(attempt_type='GRANTED').order_by('-timestamp', '-id').values_list('id', flat=True)
+        ))
+        self.assertIsNone(second['next_cursor'])
+
+    def test_invalid_cursor_in_api_and_page(self):
+        self.client.force_login(self.security)
+        self.assertEqual(self.client.get(reverse('access_logs_api'), {'cursor': '%%%'}).status_code, 400)
+        response = self.client.get(reverse('access_logs'), {'cursor': '%%%', 'type': 'ALERT'})
+        self.assertRedirects(response, f"{reverse('access_logs')}?type=ALERT&time_range=24h")
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+})
+class ExpiredPassSweepTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        today = date.today()
+        self.staff = CustomUser.objects.create(username='staff', role='STAFF')
+        self.terminal = AccessZone.objects.create(name='Терминал A', zone_type='TERMINAL', description='')
+        self.expired = [
+            AirportPass.objects.create(
+                owner=self.staff, expiry_date=today - timedelta(days=days), access_zone='TERMINAL', access_level=1
+            )
+            for days in (1, 2, 30)
+        ]
+        self.valid = AirportPass.objects.create(
+            owner=self.staff, expiry_date=today, access_zone='TERMINAL', access_level=1
+        )
+        self.revoked = AirportPass.objects.create(
+            owner=self.staff, expiry_date=today - timedelta(days=5), access_zone='TERMINAL', access_level=1,
+            is_active=False,
+        )
+
+    def test_deactivates_only_expired_active_passes_in_batches(self):
+        self.assertEqual(AirportPass.deactivate_expired(batch_size=1), 3)
+
+        self.assertFalse(AirportPass.objects.filter(id__in=[p.id for p in self.expired], is_active=True).exists())
+        self.valid.refresh_from_db()
+        self.assertTrue(self.valid.is_active)
+        self.assertEqual(AirportPass.deactivate_expired(batch_size=1), 0)
+
+    def test_today_can_be_overridden(self):
+        self.assertEqual(AirportPass.deactivate_expired(today=date.today() - timedelta(days=10)), 1)
+        self.assertEqual(AirportPass.deactivate_expired(today=date.today() + timedelta(days=1)), 3)
+
+    def test_sweep_invalidates_access_decisions(self):
+        version = get_version(MATRIX_VERSION_KEY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_expired_passes(batch_size=2), 3)
+        self.assertNotEqual(get_version(MATRIX_VERSION_KEY), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_expired_passes(), 0)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('sweep_expired_passes', '--batch-size', '2', stdout=out)
+        self.assertIn('Деактивировано пропусков: 3', out.getvalue())
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+})
+class PeriodicTaskLockTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.func = mock.Mock()
+        self.task = PeriodicTask('test-task', 60, self.func)
+
+    def test_runs_once_per_interval_across_workers(self):
+        other_worker = PeriodicTask('test-task', 60, self.func)
+        self.assertTrue(self.task.run_once())
+        self.assertFalse(other_worker.run_once())
+        self.assertEqual(self.func.call_count, 1)
+
+        # Интервал прошёл
+        with mock.patch('access_control.tasks.time.time', return_value=time.time() + 60):
+            self.assertTrue(other_worker.run_once())
+        self.assertEqual(self.func.call_count, 2)
+
+    def test_skips_while_another_worker_holds_the_lock(self):
+        other_worker = connections.create_connection('default')
+        try:
+            with other_worker.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_lock(%s)', [self.task.lock_id])
+            self.assertFalse(self.task.run_once())
+            self.func.assert_not_called()
+
+            with other_worker.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [self.task.lock_id])
+            self.assertTrue(self.task.run_once())
+        finally:
+            other_worker.close()
+        self.func.assert_called_once()
+
+    def test_lock_is_released_after_failure(self):
+        self.func.side_effect = RuntimeError
+        with self.assertRaises(RuntimeError):
+            self.task.run_once()
+
+        self.func.side_effect = None
+        self.assertTrue(self.task.run_once())
@@ -9,7 +9,14 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('api/refresh-token/', views.refresh_token, name='refresh_token'),
     path('review-request/<int:request_id>/', views.review_request, name='review_request'),
+    path('api/review-requests/batch/', views.review_requests_batch, name='review_requests_batch'),
     path('check_access/', views.check_access, name='check_access'),
+    path('api/check-access/batch/', views.check_access_batch, name='check_access_batch'),
     path('request-pass/', views.request_pass, name='request_pass'),
     path('access-logs/', views.access_logs_view, name='access_logs'),
+    path('api/access-logs/', views.access_logs_api, name='access_logs_api'),
+    path('access-logs/export/', views.access_logs_export, name='access_logs_export'),
+    path('api/access-logs/stream/', views.access_attempts_stream, name='access_attempts_stream'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('slow-queries/', views.slow_queries, name='slow_queries'),
 ]
\ No newline at end of file
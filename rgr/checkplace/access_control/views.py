@@ -1,13 +1,34 @@
+import hmac
 import logging
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import AuthenticationForm
 from .forms import CustomUserCreationForm
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.http import JsonResponse
+from rest_framework_simplejwt.exceptions import TokenError
+from .blacklist import FilteredRefreshToken
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from .models import AirportPass, PassRequest, AccessZone, CustomUser, AccessAttempt
+from .decisions import access_matrix
+from .dashboards import get_admin_dashboard, get_security_dashboard
+from django.db.models import FilteredRelation, Max, Q
+from .rollups import attempt_stats
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, paginate_attempts
+from urllib.parse import urlencode
+from .events import broadcaster
+from .metrics import registry as metrics_registry
+from .slowqueries import slow_query_log
+from django.conf import settings
+from .export import aiter_csv, export_queryset, iter_csv
+from django.utils.dateparse import parse_date
+import asyncio
+from .signals import passes_changed
+from .ingest import submit_attempts
+from django.views.decorators.http import require_POST
+import json
 from django.contrib.auth.decorators import login_required
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta
 from django.contrib import messages
 from django.views.generic import TemplateView
 from django.utils import timezone
@@ -21,13 +42,10 @@ def home(request):
     }
     
     if request.user.role == 'ADMIN':
-        context['active_passes_count'] = AirportPass.objects.filter(is_active=True).count()
-        context['pending_requests_count'] = PassRequest.objects.filter(status='PENDING').count()
-
-        context['recent_requests'] = PassRequest.objects.select_related('user').order_by('-created_at')[:5]
+        context.update(get_admin_dashboard())
         
     elif request.user.role == 'SECURITY':
-        context['active_passes'] = AirportPass.objects.filter(is_active=True).select_related('owner')[:20]
+        context.update(get_security_dashboard())
         
     elif request.user.role == 'STAFF':
         # Активный пропуск (последний одобренный)
@@ -111,6 +129,84 @@ def review_request(request, request_id):
     
     return redirect('home')
 
+# Максимальное число заявок, обрабатываемых одним пакетным запросом
+BATCH_REVIEW_LIMIT = 10000
+
+@require_POST
+@login_required
+def review_requests_batch(request):
+    """Пакетное рассмотрение заявок.
+
+    Принимает {"action": "approve"|"reject", "reason": "...", и либо "ids": [...],
+    либо "filters": {"access_zone", "user_id", "created_after", "created_before"}}.
+    """
+    if request.user.role != 'ADMIN':
+        return JsonResponse({'status': 'error', 'message': 'Доступ запрещен'}, status=403)
+
+    try:
+        data = json.loads(request.body)
+        action = data['action']
+        ids = [int(request_id) for request_id in data.get('ids', [])]
+        filters = data.get('filters', {})
+        if action not in ('approve', 'reject') or not isinstance(filters, dict):
+            raise ValueError
+        # Нераспознанный фильтр не должен молча расширять пакет до всех заявок
+        created_after = parse_date(filters['created_after']) if 'created_after' in filters else None
+        created_before = parse_date(filters['created_before']) if 'created_before' in filters else None
+        if ('created_after' in filters and created_after is None) or \
+                ('created_before' in filters and created_before is None):
+            raise ValueError
+        user_id = int(filters['user_id']) if 'user_id' in filters else None
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'status': 'error', 'message': 'Ошибка: неверные данные'}, status=400)
+
+    if not ids and not filters:
+        return JsonResponse({'status': 'error', 'message': 'Укажите ids или filters'}, status=400)
+
+    requests = PassRequest.objects.filter(status='PENDING')
+    if ids:
+        requests = requests.filter(id__in=ids)
+    if 'access_zone' in filters:
+        requests = requests.filter(access_zone=filters['access_zone'])
+    if user_id is not None:
+        requests = requests.filter(user_id=user_id)
+    if created_after:
+        requests = requests.filter(created_at__date__gte=created_after)
+    if created_before:
+        requests = requests.filter(created_at__date__lte=created_before)
+
+    # Ограничиваем объём одной транзакции; остаток обрабатывается следующим запросом
+    requests = PassRequest.objects.filter(
+        id__in=list(requests.order_by('id').values_list('id', flat=True)[:BATCH_REVIEW_LIMIT])
+    )
+
+    try:
+        reviewed, failures = PassRequest.bulk_review(requests, action, data.get('reason', ''))
+    except Exception as e:
+        auth_logger.error(f"Batch review failed: user={request.user.username}, error={e}")
+        return JsonResponse({'status': 'error', 'message': f'Ошибка при обработке заявок: {e}'}, status=500)
+    passes_changed()
+
+    # Запрошенные по id, но не найденные среди ожидающих
+    reviewed_ids = {pass_request.id for pass_request in reviewed}
+    for request_id in ids:
+        if request_id not in reviewed_ids and request_id not in failures:
+            failures[request_id] = 'Заявка не найдена или уже рассмотрена'
+
+    auth_logger.info(
+        f"Batch review: user={request.user.username}, action={action}, "
+        f"reviewed={len(reviewed)}, failed={len(failures)}"
+    )
+
+    return JsonResponse({
+        'status': 'success',
+        'reviewed': sorted(reviewed_ids),
+        'failures': [
+            {'id': request_id, 'message': message}
+            for request_id, message in sorted(failures.items())
+        ],
+    })
+
 @login_required
 def check_access(request):
     if request.user.role != 'SECURITY':
@@ -119,50 +215,139 @@ def check_access(request):
     
     zones = AccessZone.objects.all()
     
-    # Исправленный запрос для получения персонала с активными пропусками
+    # Персонал с активными пропусками и лучшим уровнем доступа - одним запросом
     staff_users = CustomUser.objects.filter(
-        role='STAFF'
-    ).prefetch_related('airportpass_set').filter(
+        role='STAFF',
         airportpass__is_active=True
-    ).distinct()
+    ).annotate(
+        active_pass_level=Max('airportpass__access_level')
+    ).order_by('username')
     
     if request.method == 'POST':
         user_id = request.POST.get('user_id')
         zone_id = request.POST.get('zone_id')
         
         try:
-            zone = AccessZone.objects.get(id=zone_id)
-            user = CustomUser.objects.get(id=user_id)
-            user_pass = user.airportpass_set.filter(is_active=True).first()
-            
-            if not user_pass:
-                message = "У сотрудника нет активного пропуска"
-                access_granted = False
-            elif user_pass.has_access_to(zone.zone_type):
-                message = f"Доступ в {zone.name} разрешен"
-                access_granted = True
-            else:
-                message = f"Недостаточный уровень доступа (Требуется: {zone.get_required_access_level_display()})"
-                access_granted = False
-                
-            return JsonResponse({
-                'status': 'access_granted' if access_granted else 'access_denied',
-                'message': message,
-                'required_level': zone.get_required_access_level_display(),
-                'user_level': user_pass.get_access_level_display() if user_pass else 'Нет пропуска'
-            })
-            
-        except (AccessZone.DoesNotExist, CustomUser.DoesNotExist) as e:
+            decision = access_matrix.check(int(user_id), int(zone_id))
+        except (TypeError, ValueError):
+            decision = None
+
+        if decision is None:
             return JsonResponse({
                 'status': 'error',
                 'message': 'Ошибка: неверные данные'
             }, status=400)
 
+        attempt_type, details = AccessAttempt.classify_levels(
+            decision.user_level if decision.has_pass else None, decision.required_level
+        )
+        submit_attempts([AccessAttempt(
+            user_id=int(user_id),
+            zone_id=int(zone_id),
+            pass_instance_id=decision.pass_id,
+            attempt_type=attempt_type,
+            details=details,
+        )])
+
+        access_levels = dict(AirportPass.ACCESS_LEVELS)
+        required_level_display = access_levels.get(decision.display_level, decision.display_level)
+
+        if not decision.has_pass:
+            message = "У сотрудника нет активного пропуска"
+        elif decision.granted:
+            message = f"Доступ в {decision.zone_name} разрешен"
+        else:
+            message = f"Недостаточный уровень доступа (Требуется: {required_level_display})"
+
+        return JsonResponse({
+            'status': 'access_granted' if decision.granted else 'access_denied',
+            'message': message,
+            'required_level': required_level_display,
+            'user_level': access_levels.get(decision.user_level, decision.user_level) if decision.has_pass else 'Нет пропуска'
+        })
+
     return render(request, 'security_dashboard.html', {
         'zones': zones,
         'staff_users': staff_users,
     })
 
+# Максимальное число пар в одном пакетном запросе
+BATCH_CHECK_LIMIT = 5000
+
+@require_POST
+@login_required
+def check_access_batch(request):
+    """Пакетная проверка доступа для турникетов.
+
+    Принимает {"checks": [[user_id, zone_id], ...]}, отвечает решениями в том же
+    порядке и отправляет все попытки на пакетную запись (access_control.ingest).
+    """
+    if request.user.role != 'SECURITY':
+        return JsonResponse({'status': 'error', 'message': 'Доступ запрещен'}, status=403)
+
+    try:
+        checks = json.loads(request.body)['checks']
+        pairs = [(int(user_id), int(zone_id)) for user_id, zone_id in checks]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'status': 'error', 'message': 'Ошибка: неверные данные'}, status=400)
+
+    if len(pairs) > BATCH_CHECK_LIMIT:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Слишком много проверок в запросе (максимум {BATCH_CHECK_LIMIT})'
+        }, status=400)
+
+    # Запрос 1: зоны
+    zones = AccessZone.objects.in_bulk({zone_id for _, zone_id in pairs})
+
+    # Запрос 2: пользователи вместе с активными непросроченными пропусками (LEFT JOIN)
+    user_passes = {}
+    rows = CustomUser.objects.filter(
+        id__in={user_id for user_id, _ in pairs}
+    ).annotate(
+        active_pass=FilteredRelation(
+            'airportpass',
+            condition=Q(airportpass__is_active=True, airportpass__expiry_date__gte=date.today()),
+        )
+    ).values_list('id', 'active_pass__id', 'active_pass__access_level')
+    for user_id, pass_id, access_level in rows:
+        best = user_passes.get(user_id)
+        if best is None or (pass_id is not None and (best[0] is None or access_level > best[1])):
+            user_passes[user_id] = (pass_id, access_level)
+
+    results = []
+    attempts = []
+    for user_id, zone_id in pairs:
+        zone = zones.get(zone_id)
+        if zone is None or user_id not in user_passes:
+            results.append({
+                'user_id': user_id,
+                'zone_id': zone_id,
+                'status': 'error',
+                'message': 'Пользователь или зона не найдены',
+            })
+            continue
+
+        pass_id, access_level = user_passes[user_id]
+        attempt_type, details = AccessAttempt.classify(access_level, zone)
+        attempts.append(AccessAttempt(
+            user_id=user_id,
+            zone=zone,
+            pass_instance_id=pass_id,
+            attempt_type=attempt_type,
+            details=details,
+        ))
+        results.append({
+            'user_id': user_id,
+            'zone_id': zone_id,
+            'status': 'access_granted' if attempt_type == 'GRANTED' else 'access_denied',
+            'attempt_type': attempt_type,
+        })
+
+    submit_attempts(attempts)
+
+    return JsonResponse({'status': 'success', 'results': results})
+
 def register(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
@@ -184,6 +369,13 @@ def logout_view(request):
         f"refresh_token={'present' if refresh_token else 'missing'}"
     )
     
+    # Отзываем refresh токен, чтобы его нельзя было использовать после выхода
+    if refresh_token:
+        try:
+            FilteredRefreshToken(refresh_token, verify=False).blacklist()
+        except TokenError as e:
+            auth_logger.warning(f"Refresh token not blacklisted: user={request.user.username}, error={e}")
+
     # Делаем логаут Django
     logout(request)
     
@@ -207,6 +399,9 @@ def user_login(request):
             if user is not None:
                 # Генерация JWT токенов
                 refresh = RefreshToken.for_user(user)
+                # Claims для аутентификации без БД (access_control.middleware)
+                refresh['username'] = user.username
+                refresh['role'] = user.role
                 access_token = str(refresh.access_token)
                 
                 # Логируем успешный вход
@@ -252,7 +447,7 @@ def refresh_token(request):
     
     if refresh_token_value:
         try:
-            refresh = RefreshToken(refresh_token_value)
+            refresh = FilteredRefreshToken(refresh_token_value)
             new_access_token = str(refresh.access_token)
             
             # Логируем обновление токена
@@ -286,6 +481,43 @@ def refresh_token(request):
     )
     return JsonResponse({'status': 'error', 'message': 'Refresh token missing'}, status=400)
     
+ATTEMPT_TYPE_FILTERS = ['GRANTED', 'DENIED', 'ALERT']
+
+# Интервал комментариев-пингов в потоке событий, секунды
+STREAM_KEEPALIVE_SECONDS = 15
+
+def is_asgi_request(request):
+    """Запрос обслуживается сервером ASGI (uvicorn, daphne), а не WSGI или runserver"""
+    return isinstance(request, ASGIRequest)
+
+def get_time_range_start(time_range):
+    """Начало временного окна журнала по параметру time_range"""
+    now = timezone.now()
+    if time_range == '1h':
+        return now - timedelta(hours=1)
+    elif time_range == '12h':
+        return now - timedelta(hours=12)
+    elif time_range == '7d':
+        return now - timedelta(days=7)
+    else:  # по умолчанию 24 часа
+        return now - timedelta(hours=24)
+
+def get_access_logs_page(params):
+    """Страница журнала по GET-параметрам type, cursor и limit"""
+    logs_queryset = AccessAttempt.objects.select_related('user', 'zone', 'pass_instance')
+    
+    # Фильтрация по типу попытки
+    attempt_type = params.get('type', '')
+    if attempt_type in ATTEMPT_TYPE_FILTERS:
+        logs_queryset = logs_queryset.filter(attempt_type=attempt_type)
+
+    try:
+        page_size = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+
+    return paginate_attempts(logs_queryset, params.get('cursor'), max(page_size, 1))
+
 def access_logs_view(request):
     """Функция-представление для отображения логов доступа"""
     # Проверка прав доступа (если нужно)
@@ -296,34 +528,25 @@ def access_logs_view(request):
     attempt_type = request.GET.get('type', '')
     time_range = request.GET.get('time_range', '24h')
     
-    # Базовый QuerySet
-    logs_queryset = AccessAttempt.objects.all().order_by('-timestamp')
-    
-    # Фильтрация по типу попытки
-    if attempt_type in ['GRANTED', 'DENIED', 'ALERT']:
-        logs_queryset = logs_queryset.filter(attempt_type=attempt_type)
-    
-    # Фильтрация по временному диапазону
-    now = timezone.now()
-    if time_range == '1h':
-        start_time = now - timedelta(hours=1)
-    elif time_range == '12h':
-        start_time = now - timedelta(hours=12)
-    elif time_range == '7d':
-        start_time = now - timedelta(days=7)
-    else:  # по умолчанию 24 часа
-        start_time = now - timedelta(hours=24)
-    
-    stats_queryset = AccessAttempt.objects.filter(timestamp__gte=start_time)
+    try:
+        access_logs, next_cursor = get_access_logs_page(request.GET)
+    except InvalidCursor:
+        return redirect(f"{request.path}?{urlencode({'type': attempt_type, 'time_range': time_range})}")
+
+    stats = attempt_stats(get_time_range_start(time_range))
     
     # Подготовка контекста
     context = {
-        'access_logs': logs_queryset[:100],  # последние 100 записей
+        'access_logs': access_logs,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        # Под WSGI бесконечный поток занял бы рабочий поток навсегда
+        'live_updates': is_asgi_request(request),
         'stats': {
-            'total': stats_queryset.count(),
-            'granted': stats_queryset.filter(attempt_type='GRANTED').count(),
-            'denied': stats_queryset.filter(attempt_type='DENIED').count(),
-            'alerts': stats_queryset.filter(attempt_type='ALERT').count(),
+            'total': sum(stats.values()),
+            'granted': stats['GRANTED'],
+            'denied': stats['DENIED'],
+            'alerts': stats['ALERT'],
         },
         'filters': {
             'selected_type': attempt_type,
@@ -331,4 +554,135 @@ def access_logs_view(request):
         }
     }
     
-    return render(request, 'access_logs.html', context)
\ No newline at end of file
+    return render(request, 'access_logs.html', context)
+
+@login_required
+def access_logs_api(request):
+    """JSON-вариант журнала доступа с курсорной пагинацией"""
+    if request.user.role != 'SECURITY':
+        return JsonResponse({'status': 'error', 'message': 'Доступ запрещен'}, status=403)
+
+    try:
+        access_logs, next_cursor = get_access_logs_page(request.GET)
+    except InvalidCursor:
+        return JsonResponse({'status': 'error', 'message': 'Неверный курсор'}, status=400)
+
+    return JsonResponse({
+        'status': 'success',
+        'results': [
+            {
+                'id': attempt.id,
+                'timestamp': attempt.timestamp.isoformat(),
+                'user': attempt.user.get_username(),
+                'zone': attempt.zone.name,
+                'pass_id': attempt.pass_instance_id,
+                'attempt_type': attempt.attempt_type,
+                'details': attempt.details,
+            }
+            for attempt in access_logs
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+def access_logs_export(request):
+    """Потоковая выгрузка журнала в CSV: фильтры type и time_range как в журнале,
+    либо start/end (ГГГГ-ММ-ДД) для произвольного периода"""
+    if request.user.role != 'SECURITY':
+        return JsonResponse({'status': 'error', 'message': 'Доступ запрещен'}, status=403)
+
+    attempt_type = request.GET.get('type', '')
+    if attempt_type not in ATTEMPT_TYPE_FILTERS:
+        attempt_type = None
+
+    # Нераспознанная дата не должна молча подменяться окном time_range
+    start_param = request.GET.get('start', '')
+    end_param = request.GET.get('end', '')
+    try:
+        start_date = parse_date(start_param) if start_param else None
+        end_date = parse_date(end_param) if end_param else None
+        if (start_param and start_date is None) or (end_param and end_date is None):
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Неверный формат даты'}, status=400)
+
+    if start_date or end_date:
+        start = timezone.make_aware(datetime.combine(start_date, time.min)) if start_date else None
+        # Конец периода включительно
+        end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min)) if end_date else None
+    else:
+        start = get_time_range_start(request.GET.get('time_range', '24h'))
+        end = None
+
+    auth_logger.info(
+        f"Access log export: user={request.user.username}, type={attempt_type}, start={start}, end={end}"
+    )
+
+    queryset = export_queryset(attempt_type, start, end)
+    # Каждый сервер получает итератор своего вида, иначе Django буферизует выгрузку целиком
+    rows = aiter_csv(queryset) if is_asgi_request(request) else iter_csv(queryset)
+    response = StreamingHttpResponse(rows, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="access_attempts.csv"'
+    return response
+
+async def access_attempts_stream(request):
+    """Server-sent events: новые попытки доступа в реальном времени (нужен ASGI)"""
+    if not is_asgi_request(request):
+        # WSGI потребляет асинхронный поток синхронно и не отпускает воркер
+        return JsonResponse({'status': 'error', 'message': 'Поток событий доступен только под ASGI'}, status=503)
+
+    user = await request.auser()
+    if not user.is_authenticated or user.role != 'SECURITY':
+        return JsonResponse({'status': 'error', 'message': 'Доступ запрещен'}, status=403)
+
+    attempt_types = {
+        attempt_type for attempt_type in request.GET.getlist('type')
+        if attempt_type in ATTEMPT_TYPE_FILTERS
+    }
+
+    async def event_stream():
+        subscription = broadcaster.subscribe(attempt_types)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE не даёт прокси закрыть простаивающее соединение
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"id: {event['id']}\nevent: attempt\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics(request):
+    """Метрики производительности в формате Prometheus, только с токеном METRICS_TOKEN.
+
+    Адрес клиента за обратным прокси не проверить (все запросы приходят с
+    127.0.0.1), поэтому сборщик передаёт заголовок Authorization: Bearer <токен>
+    (authorization.credentials в scrape_config). Без токена в настройках
+    эндпоинт закрыт.
+    """
+    token = settings.METRICS_TOKEN
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+def slow_queries(request):
+    if request.user.role != 'ADMIN':
+        messages.error(request, 'Доступ запрещен: только для администраторов')
+        return redirect('home')
+
+    return render(request, 'slow_queries.html', {
+        'entries': slow_query_log.entries(),
+        'threshold_ms': settings.SLOW_QUERY['THRESHOLD_MS'],
+    })
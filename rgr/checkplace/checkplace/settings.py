@@ -42,12 +42,17 @@ INSTALLED_APPS = [
     'access_control',
     'rest_framework',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
 ]
 
 MIDDLEWARE = [
+    'access_control.metrics.PerformanceMiddleware',
+    'access_control.slowqueries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # До CSRF: запросы с токеном в заголовке Authorization освобождаются от проверки
+    'access_control.middleware.StatelessJWTMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -58,7 +63,7 @@ ROOT_URLCONF = 'checkplace.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'access_control.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'access_control/templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -86,9 +91,27 @@ DATABASES = {
         'PASSWORD': '1234',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Проверять постоянное подключение перед повторным использованием в новом запросе
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Подключения к PostgreSQL:
+#   DB_POOL=1 - пул psycopg 3 в каждом воркере (нужен пакет psycopg[pool]),
+#     размер DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE, ожидание свободного DB_POOL_TIMEOUT секунд;
+#   иначе постоянные подключения: DB_CONN_MAX_AGE секунд (0 - новое на каждый запрос).
+#   CONN_HEALTH_CHECKS в режиме пула включает проверку подключения при выдаче из пула.
+if os.environ.get('DB_POOL') == '1':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -151,47 +174,123 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Токен сборщика метрик для /metrics/ (заголовок Authorization: Bearer <токен>);
+# не задан - эндпоинт закрыт
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Медленные SQL-запросы (страница /slow-queries/ для администраторов)
+SLOW_QUERY = {
+    'THRESHOLD_MS': 200,  # None - отключено
+    'BUFFER_SIZE': 200,
+    'EXPLAIN_ANALYZE': True,  # для SELECT запрос выполняется повторно
+}
+
+# API, где пользователь берётся из access-токена без запросов к БД
+JWT_STATELESS_AUTH = {
+    'COOKIE': 'access_token',
+    'VIEWS': ['check_access', 'check_access_batch'],
+    'REQUIRED_CLAIMS': ['role'],
+}
+
+# Кэш. Общий уровень (L2) - Redis из REDIS_URL, без него файловый кэш, общий для
+# воркеров одного хоста (CACHE_FALLBACK=locmem - только память процесса).
+# default - двухуровневая обёртка access_control.cache.TieredCache поверх него.
+if os.environ.get('REDIS_URL'):
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+elif os.environ.get('CACHE_FALLBACK') == 'locmem':
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'cache'),
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'access_control.cache.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_TIMEOUT': 5,  # секунды; дольше этого L1 воркера не отстаёт от L2
+            'L1_MAX_ENTRIES': 1000,
+        },
+    },
+    'shared': SHARED_CACHE,
+}
+
+# Пакетная запись попыток доступа (access_control.ingest)
+ACCESS_ATTEMPT_INGEST = {
+    # False - попытки записываются сразу, без спула и фонового потока
+    'ENABLED': True,
+    'SPOOL_DIR': BASE_DIR / 'spool',
+    'BATCH_SIZE': 1000,
+    'FLUSH_INTERVAL': 1.0,  # секунды
+    'FSYNC': False,
+    # После стольких неудачных записей пакет пишется по одной попытке,
+    # отвергнутые БД попытки откладываются в SPOOL_DIR/dead-letter
+    'MAX_BATCH_ATTEMPTS': 3,
+    'MAX_BUFFERED': 100000,  # попыток в памяти; сверх - только в файле спула
+}
+
+# Период фоновой деактивации просроченных пропусков, секунды (None - отключено)
+PASS_SWEEP_INTERVAL = 3600
+
+# Период удаления истёкших outstanding/blacklisted JWT, секунды (None - отключено)
+TOKEN_PRUNE_INTERVAL = 6 * 3600
+
+# Секционирование и хранение попыток доступа (команда manage_attempt_partitions)
+ACCESS_ATTEMPT_PARTITIONS = {
+    'MONTHS_AHEAD': 3,
+    'RETAIN_MONTHS': 12,
+    'ARCHIVE_DIR': BASE_DIR / 'archive',
+}
+
+# Логирование: потоки запросов только ставят записи в очередь, файл
+# (JSON, ротация внешняя - logrotate) и консоль пишет фоновый поток, см. access_control.logs
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
-            'style': '{',
-        },
-        'simple': {
-            'format': '{levelname} {message}',
-            'style': '{',
+    'filters': {
+        'sampling': {
+            '()': 'access_control.logs.SamplingFilter',
+            # Доля сохраняемых частых записей ниже WARNING
+            'rates': {
+                'django.server': 0.1,
+                'stateless_jwt_rejected': 0.1,
+            },
         },
     },
     'handlers': {
-        'console': {
+        'queue': {
             'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
-            'formatter': 'simple',
-        },
-        'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': 'debug.log',
-            'formatter': 'verbose',
+            'class': 'access_control.logs.AsyncQueueHandler',
+            # Один файл на все воркеры, ротация - logrotate (см. access_control.logs)
+            'filename': BASE_DIR / 'debug.log',
+            'console': True,
+            'queue_size': 10000,
+            'filters': ['sampling'],
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],  # В консоль И в файл
+            'handlers': ['queue'],  # В консоль И в файл
             'level': 'INFO',
             'propagate': False,
         },
         'checkplace': {
-            'handlers': ['console', 'file'],  # В консоль И в файл
+            'handlers': ['queue'],
             'level': 'DEBUG',
             'propagate': False,
         },
         'auth': {
-            'handlers': ['console', 'file'],  # В консоль И в auth.log
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
     },
-}
\ No newline at end of file
+}